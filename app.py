@@ -2,6 +2,7 @@ import streamlit as st
 from streamlit_option_menu import option_menu
 import os
 import base64
+import shutil
 from io import BytesIO
 
 # 嘗試添加模組路徑
@@ -68,7 +69,19 @@ if "debug" in st.query_params:
                         st.error(f"測試 {path} 時出錯: {str(e)}")
         except Exception as e:
             st.error(f"搜索Ghostscript路徑出錯: {str(e)}")
-    
+
+    # 檢查Ghostscript動態庫（gsapi常駐工作進程後端）
+    try:
+        from pdf_engine.gs_backend import find_gsapi_library, ghostscript_backend
+        gsapi_library = find_gsapi_library()
+        if gsapi_library:
+            st.success(f"找到Ghostscript動態庫: {gsapi_library}")
+        else:
+            st.info("未找到Ghostscript動態庫，將以獨立進程方式執行Ghostscript")
+        st.write(f"目前Ghostscript執行後端: {ghostscript_backend()}")
+    except Exception as e:
+        st.error(f"檢查Ghostscript動態庫時出錯: {str(e)}")
+
     # 檢查Poppler
     st.header("Poppler檢測")
     pdftoppm_found = False
@@ -151,6 +164,7 @@ try:
     from modules.metadata import pdf_metadata_page
     from modules.watermark import pdf_watermark_page
     from modules.optimize import pdf_optimize_page
+    from modules.downloads import cleanup_static_downloads
 except ImportError as e:
     st.error(f"模組導入錯誤: {str(e)}")
     st.stop()
@@ -163,6 +177,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 刪除已過期的靜態下載連結
+cleanup_static_downloads()
+
 # 自定義CSS
 st.markdown("""
 <style>
@@ -281,8 +298,10 @@ def get_binary_file_downloader_html(bin_file, file_label='File', button_label='D
 
 # 通用文件保存函數
 def save_uploaded_file(uploaded_file, save_path):
+    uploaded_file.seek(0)
     with open(save_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+    uploaded_file.seek(0)
     return save_path
 
 def main():
@@ -2,56 +2,17 @@ import streamlit as st
 import os
 import tempfile
 import subprocess
-import base64
-import shutil
 from PyPDF2 import PdfReader
-import pikepdf
-from pikepdf import Pdf
-import time
 
-# 檢查Ghostscript是否可用的函數（適用於所有平台，尤其是Linux）
-def check_ghostscript():
-    try:
-        # 直接嘗試執行gs命令
-        result = subprocess.run(["gs", "--version"], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            return True, "gs", result.stdout.strip()
-        
-        # 如果直接執行失敗，嘗試其他可能的路徑
-        for cmd in ["gswin64c", "gswin32c"]:
-            try:
-                result = subprocess.run([cmd, "--version"], capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    return True, cmd, result.stdout.strip()
-            except:
-                pass
-        
-        return False, None, None
-    except Exception as e:
-        return False, None, str(e)
-
-# 設置Ghostscript路徑
-# 首先嘗試命令行檢測
-GS_AVAILABLE, GS_CMD, GS_VERSION = check_ghostscript()
-
-if GS_AVAILABLE:
-    GHOSTSCRIPT_PATH = GS_CMD
-    GHOSTSCRIPT_AVAILABLE = True
-else:
-    # 如果命令行檢測失敗，回退到傳統路徑檢測
-    GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin64c.exe")
-    if not os.path.exists(GHOSTSCRIPT_PATH):
-        GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin32c.exe")
-        if not os.path.exists(GHOSTSCRIPT_PATH):
-            # 嘗試在系統路徑中查找
-            GHOSTSCRIPT_PATH = shutil.which("gswin64c") or shutil.which("gswin32c") or shutil.which("gs") or "gs"
-            
-    # 最後檢查路徑是否可用
-    try:
-        result = subprocess.run([GHOSTSCRIPT_PATH, "--version"], capture_output=True, text=True, timeout=5)
-        GHOSTSCRIPT_AVAILABLE = result.returncode == 0
-    except:
-        GHOSTSCRIPT_AVAILABLE = False
+# Ghostscript檢測和執行由gs_backend統一處理，與其他模組共用同一個工作進程池
+from pdf_engine.gs_backend import (
+    GS_VERSION, GHOSTSCRIPT_PATH, GHOSTSCRIPT_AVAILABLE, ghostscript_backend
+)
+from pdf_engine.sampling import SAMPLE_MIN_PAGES
+# 壓縮處理由pdf_engine完成，本模組只負責頁面和結果展示
+from pdf_engine.compress import COMPRESSION_PRESETS, compress_pdf, compress_to_target
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
 
 def pdf_compress_page():
     st.header("🔎 PDF壓縮與優化")
@@ -72,6 +33,10 @@ def pdf_compress_page():
                         st.info(f"Ghostscript 版本: {result.stdout.strip()}")
                 except Exception as e:
                     st.warning(f"無法獲取 Ghostscript 版本信息: {str(e)}")
+            if ghostscript_backend() == "gsapi":
+                st.info("Ghostscript 執行方式: 常駐工作進程 (gsapi)")
+            else:
+                st.info("Ghostscript 執行方式: 獨立進程 (subprocess)")
         else:
             st.error("❌ Ghostscript 未檢測到，這可能會影響壓縮功能")
             st.info("系統路徑變量 PATH: " + os.environ.get('PATH', '未設置'))
@@ -125,12 +90,7 @@ def pdf_compress_page():
             )
             
             # 根據選項設置不同的壓縮方式
-            compression_settings = {
-                "輕度": {"dpi": 150, "image_quality": "/default", "color_mode": "Color", "metadata": False},
-                "中度": {"dpi": 120, "image_quality": "/ebook", "color_mode": "Color", "metadata": True},
-                "強力": {"dpi": 90, "image_quality": "/printer", "color_mode": "Color", "metadata": True},
-                "極限": {"dpi": 72, "image_quality": "/screen", "color_mode": "Gray", "metadata": True}
-            }
+            compression_settings = COMPRESSION_PRESETS
             
             # 選擇標準模式的處理選項
             remove_metadata = st.checkbox("移除元數據", value=compression_settings[compression_level]["metadata"], help="刪除文檔的額外信息以減小大小")
@@ -171,6 +131,24 @@ def pdf_compress_page():
             # 最大嘗試次數
             max_attempts = compression_precision * 2
             
+            # 搜索策略
+            search_strategy = st.radio(
+                "搜索策略",
+                ["模型預測", "並行搜索", "逐一嘗試"],
+                index=0,
+                horizontal=True,
+                help="模型預測根據前幾次結果擬合大小與DPI的關係，直接跳到預測的設置，通常2-3次即可完成；"
+                     "並行搜索會同時啟動多個Ghostscript進程（上限為CPU核心數），找到達標結果後立即取消其餘嘗試"
+            )
+            search_strategy_map = {"模型預測": "model", "並行搜索": "parallel", "逐一嘗試": "sequential"}
+            
+            # 抽樣估算
+            use_sampling = st.checkbox(
+                "抽樣估算",
+                value=True,
+                help=f"頁數達到{SAMPLE_MIN_PAGES}頁時，先只壓縮按圖像密度抽取的代表性頁面來推算大小，最後只需壓縮整份文檔一到兩次"
+            )
+            
             # 設定目標壓縮率
             target_ratio = ((file_size_mb - target_size) / file_size_mb) * 100
             st.write(f"目標壓縮率: {target_ratio:.1f}%")
@@ -230,13 +208,9 @@ def pdf_compress_page():
                     # 創建臨時目錄處理文件
                     with tempfile.TemporaryDirectory() as tmpdirname:
                         # 使用短文件名和路徑避免特殊字符問題
-                        temp_input = os.path.join(tmpdirname, "input.pdf")
+                        temp_input = ingest_upload(uploaded_file)
                         temp_output = os.path.join(tmpdirname, "output.pdf")
                         
-                        # 寫入臨時文件
-                        with open(temp_input, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-                        
                         # 讀取文件基本信息
                         reader = PdfReader(temp_input)
                         total_pages = len(reader.pages)
@@ -247,7 +221,7 @@ def pdf_compress_page():
                             gs_params = compression_settings[compression_level]
                             
                             # 進行文檔處理
-                            compressed_file = process_pdf(
+                            result = compress_pdf(
                                 temp_input, 
                                 temp_output, 
                                 dpi=gs_params["dpi"],
@@ -263,20 +237,25 @@ def pdf_compress_page():
                             
                         elif compression_method == "目標大小壓縮":
                             # 目標大小壓縮，進行反覆嘗試以接近目標
-                            compressed_file = target_size_compression(
+                            progress_callback, clear_progress = _streamlit_progress()
+                            result = compress_to_target(
                                 temp_input,
                                 tmpdirname,
                                 target_size,
                                 max_attempts,
-                                total_pages
+                                total_pages,
+                                strategy=search_strategy_map[search_strategy],
+                                use_sampling=use_sampling,
+                                progress_callback=progress_callback
                             )
+                            clear_progress()
                         
                         else:  # 高級自定義壓縮
                             # 顏色設置映射
                             color_settings = {"彩色": "Color", "灰度": "Gray", "黑白": "Mono"}
                             
                             # 進行文檔處理
-                            compressed_file = process_pdf(
+                            result = compress_pdf(
                                 temp_input, 
                                 temp_output, 
                                 dpi=custom_dpi,
@@ -290,6 +269,9 @@ def pdf_compress_page():
                                 remove_unused=remove_unused
                             )
                         
+                        _show_result_messages(result)
+                        compressed_file = result["output_file"]
+                        
                         # 檢查輸出文件是否存在且大小正常
                         if compressed_file and os.path.exists(compressed_file) and os.path.getsize(compressed_file) > 0:
                             compressed_size_mb = os.path.getsize(compressed_file) / (1024 * 1024)
@@ -322,15 +304,9 @@ def pdf_compress_page():
                                 st.info("⚠️ 文件已處理，但壓縮效果有限")
                             
                             # 創建下載按鈕
-                            with open(compressed_file, "rb") as f:
-                                pdf_bytes = f.read()
-                            
                             base_name = os.path.splitext(uploaded_file.name)[0]
                             download_name = f"{base_name}_compressed.pdf"
-                            
-                            b64_pdf = base64.b64encode(pdf_bytes).decode()
-                            href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{download_name}" class="download-button">下載處理後的PDF</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                            offer_download(compressed_file, download_name, "下載處理後的PDF")
                             
                             # 顯示壓縮設置的摘要
                             with st.expander("處理參數摘要"):
@@ -345,6 +321,7 @@ def pdf_compress_page():
                                 elif compression_method == "目標大小壓縮":
                                     st.write(f"• 目標大小: {target_size:.2f} MB")
                                     st.write(f"• 壓縮準確度: {compression_precision}")
+                                    st.write(f"• 搜索策略: {search_strategy}")
                                 else:
                                     st.write(f"• 顏色模式: {color_mode}")
                                     st.write(f"• 圖像分辨率: {custom_dpi} DPI")
@@ -390,251 +367,22 @@ def pdf_compress_page():
         - 優化網站上的PDF文檔大小
         """)
 
-# 目標大小壓縮函數
-def target_size_compression(input_file, temp_dir, target_size_mb, max_attempts, total_pages):
-    """
-    通過多次嘗試接近目標大小的壓縮方法，只調整DPI和壓縮品質，保留原始顏色
-    """
-    # 初始參數
-    current_dpi = 150
-    current_quality = "/default"
-    
-    # 嘗試不同的壓縮參數組合
-    attempts = 0
-    best_file = None
-    best_diff = float('inf')
-    
-    # 顯示進度條
+def _streamlit_progress():
+    """創建Streamlit進度條和進度文字，返回 (progress_callback, 清除函數)"""
     progress_bar = st.progress(0)
     progress_text = st.empty()
     
-    # 根據頁數和目標壓縮率確定DPI值範圍
-    file_size_mb = os.path.getsize(input_file) / (1024 * 1024)
-    compression_ratio = ((file_size_mb - target_size_mb) / file_size_mb) * 100
-    
-    # 確保壓縮率是正數
-    compression_ratio = max(0, compression_ratio)
-    
-    # 根據目標壓縮率選擇合適的DPI範圍
-    if compression_ratio > 80:  # 極度壓縮
-        dpi_values = [72, 60, 50, 40, 30]
-    elif compression_ratio > 60:  # 高度壓縮
-        dpi_values = [90, 80, 72, 60, 50]
-    elif compression_ratio > 40:  # 中度壓縮
-        dpi_values = [110, 100, 90, 80, 72]
-    elif compression_ratio > 20:  # 輕度壓縮
-        dpi_values = [130, 120, 110, 100, 90]
-    else:  # 微度壓縮
-        dpi_values = [150, 140, 130, 120, 110]
-    
-    # 壓縮品質選項
-    quality_values = ["/default", "/ebook", "/printer", "/screen"]
+    def progress_callback(value, message):
+        if value is not None:
+            progress_bar.progress(value)
+        if message is not None:
+            progress_text.text(message)
     
-    # 生成嘗試列表，只使用彩色模式
-    attempts_list = []
-    for dpi in dpi_values:
-        for quality in quality_values:
-            attempts_list.append((dpi, quality, "Color"))
-    
-    # 限制嘗試次數
-    attempts_list = attempts_list[:max_attempts]
-    
-    # 創建一個專門用於測試的輸入文件副本
-    test_input_file = os.path.join(temp_dir, "test_input.pdf")
-    shutil.copy2(input_file, test_input_file)
-    
-    # 開始嘗試
-    for i, (dpi, quality, color) in enumerate(attempts_list):
-        attempts += 1
-        
-        # 更新進度
-        progress = (i + 1) / len(attempts_list)
-        progress_bar.progress(progress)
-        progress_text.text(f"嘗試設置組合 {i+1}/{len(attempts_list)}: DPI={dpi}, 質量={quality}")
-        
-        # 每次嘗試都使用唯一的輸出文件名
-        temp_output = os.path.join(temp_dir, f"attempt_{attempts}.pdf")
-        
-        # 處理文件
-        processed_file = process_pdf(
-            test_input_file, 
-            temp_output, 
-            dpi=dpi,
-            image_quality=quality,
-            color_mode="Color",  # 始終使用彩色模式
-            remove_metadata=True,
-            flatten_forms=True,
-            remove_bookmarks=True,
-            optimize_fonts=True,
-            pdf_version="1.4",  # 使用兼容性最好的版本
-            remove_unused=True
-        )
-        
-        if processed_file and os.path.exists(processed_file):
-            # 計算與目標大小的差距
-            current_size_mb = os.path.getsize(processed_file) / (1024 * 1024)
-            diff = abs(current_size_mb - target_size_mb)
-            
-            # 更新進度文本
-            progress_text.text(f"嘗試 {i+1}/{len(attempts_list)} - 當前大小: {current_size_mb:.2f}MB (目標: {target_size_mb:.2f}MB)")
-            
-            # 如果是最佳結果，保存它
-            if diff < best_diff:
-                best_diff = diff
-                if best_file and best_file != processed_file and os.path.exists(best_file):
-                    try:
-                        os.remove(best_file)  # 刪除之前的最佳文件
-                    except:
-                        pass
-                best_file = processed_file
-            
-            # 目標大小接近時提前退出
-            if diff < 0.05 or current_size_mb <= target_size_mb:
-                progress_text.text(f"✅ 已達到目標大小或足夠接近 - 實際大小: {current_size_mb:.2f}MB")
-                break
-    
-    # 清空進度提示
-    progress_text.empty()
-    
-    # 清理測試文件
-    try:
-        if os.path.exists(test_input_file):
-            os.remove(test_input_file)
-    except:
-        pass
-    
-    return best_file
+    return progress_callback, progress_text.empty
 
-# PDF處理函數
-def process_pdf(input_file, output_file, dpi=120, image_quality="/default", color_mode="Color", 
-               remove_metadata=True, flatten_forms=False, remove_bookmarks=False, 
-               optimize_fonts=True, pdf_version="1.4", remove_unused=True):
-    """
-    使用Ghostscript或pikepdf處理PDF的綜合函數
-    """
-    if GHOSTSCRIPT_AVAILABLE:
-        # 使用Ghostscript處理
-        try:
-            # 確保路徑沒有問題，轉換為適當的格式
-            output_path = output_file.replace('\\', '/')
-            input_path = input_file.replace('\\', '/')
-            
-            # 設置Ghostscript命令
-            gs_cmd = [
-                GHOSTSCRIPT_PATH,
-                "-sDEVICE=pdfwrite",
-                f"-dCompatibilityLevel={pdf_version}",
-                f"-dPDFSETTINGS={image_quality}",
-                "-dNOPAUSE",
-                "-dQUIET",
-                "-dBATCH",
-                f"-r{dpi}"
-            ]
-            
-            # 添加顏色模式設置
-            if color_mode == "Gray":
-                gs_cmd.append("-sColorConversionStrategy=Gray")
-                gs_cmd.append("-dProcessColorModel=/DeviceGray")
-            elif color_mode == "Mono":
-                gs_cmd.append("-sColorConversionStrategy=Mono")
-                gs_cmd.append("-dProcessColorModel=/DeviceGray")
-            
-            # 添加元數據處理
-            if remove_metadata:
-                gs_cmd.append("-dFastWebView=true")
-            
-            # 添加優化選項
-            if remove_unused:
-                gs_cmd.append("-dDetectDuplicateImages=true")
-                gs_cmd.append("-dCompressFonts=true")
-            
-            # 改進字體處理方式，特別是對中文字體的處理
-            if optimize_fonts:
-                # 字體優化但保留嵌入，確保中文正確顯示
-                gs_cmd.append("-dEmbedAllFonts=true")  # 修改為true確保嵌入所有字體
-                gs_cmd.append("-dSubsetFonts=true")
-                gs_cmd.append("-dPrinted=false")  # 優化用於螢幕顯示不是打印
-                gs_cmd.append("-dMaxSubsetPct=100")  # 允許完整子集
-            else:
-                # 如果不優化字體，確保完整嵌入所有字體
-                gs_cmd.append("-dEmbedAllFonts=true")
-                gs_cmd.append("-dSubsetFonts=false")
-            
-            # 添加輸出和輸入文件，放在命令末尾
-            gs_cmd.append(f"-sOutputFile={output_path}")
-            gs_cmd.append(input_path)
-            
-            # 執行Ghostscript命令
-            process = subprocess.run(
-                gs_cmd, 
-                check=True, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # 處理表單和書籤需要進一步處理
-            if flatten_forms or remove_bookmarks:
-                pikepdf_optimize(output_file, output_file, {
-                    "flatten_forms": flatten_forms,
-                    "remove_bookmarks": remove_bookmarks,
-                    "remove_metadata": False,  # 已由GS處理
-                    "optimize_fonts": False    # 已由GS處理
-                })
-            
-            return output_file
-            
-        except Exception as e:
-            st.warning(f"Ghostscript處理失敗: {str(e)}，使用備用方法...")
-            # 如果Ghostscript失敗，回退到pikepdf
-            return pikepdf_optimize(input_file, output_file, {
-                "remove_metadata": remove_metadata,
-                "flatten_forms": flatten_forms,
-                "remove_bookmarks": remove_bookmarks,
-                "optimize_fonts": optimize_fonts
-            })
-    else:
-        # 沒有Ghostscript，使用pikepdf
-        return pikepdf_optimize(input_file, output_file, {
-            "remove_metadata": remove_metadata,
-            "flatten_forms": flatten_forms,
-            "remove_bookmarks": remove_bookmarks,
-            "optimize_fonts": optimize_fonts
-        })
-
-# pikepdf優化輔助函數
-def pikepdf_optimize(input_file, output_file, params):
-    """使用pikepdf進行基本優化"""
-    try:
-        # 檢查輸入和輸出路徑是否相同
-        if os.path.abspath(input_file) == os.path.abspath(output_file):
-            pdf = Pdf.open(input_file, allow_overwriting_input=True)
-        else:
-            pdf = Pdf.open(input_file)
-        
-        # 移除元數據
-        if params["remove_metadata"]:
-            with pdf.open_metadata() as meta:
-                meta.clear()
-        
-        # 壓平表單欄位
-        if params["flatten_forms"]:
-            for page in pdf.pages:
-                if "/Annots" in page:
-                    del page["/Annots"]
-        
-        # 移除書籤
-        if params["remove_bookmarks"]:
-            if "/Outlines" in pdf.Root:
-                del pdf.Root["/Outlines"]
-        
-        # 保存為優化的PDF
-        pdf.save(output_file,
-                object_stream_mode=pikepdf.ObjectStreamMode.generate,
-                compress_streams=True,
-                recompress_flate=True)
-        
-        return output_file
-    except Exception as e:
-        st.error(f"pikepdf處理時出錯: {str(e)}")
-        return None 
\ No newline at end of file
+def _show_result_messages(result):
+    """在頁面上顯示引擎返回的警告和錯誤"""
+    for warning in result["warnings"]:
+        st.warning(warning)
+    if result["error"] and not result.get("cancelled"):
+        st.error(result["error"])
@@ -1,13 +1,21 @@
 import streamlit as st
 import os
 import tempfile
-import zipfile
-from pdf2image import convert_from_path
-import base64
 from io import BytesIO
-from PIL import Image
 import platform
 import sys
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
+from pdf_engine.pages import parse_page_selection
+from pdf_engine.parallel_render import render_page_set
+from pdf_engine.archive import StreamingZipWriter
+from pdf_engine.thumbnails import iter_thumbnails
+from pdf_engine.encoders import IMAGE_FORMATS, available_formats, encoder_options, encode_image
+
+# 編碼設定與色度抽樣、TIFF壓縮方式的選項
+PROFILE_OPTIONS = {"速度優先": "fast", "平衡": "balanced", "體積優先": "small"}
+JPEG_SUBSAMPLING = {"4:4:4（最清晰）": 0, "4:2:2": 1, "4:2:0（最小）": 2}
+TIFF_COMPRESSION_OPTIONS = {"LZW": "lzw", "Deflate": "deflate", "CCITT Group 4（黑白）": "group4", "無壓縮": "none"}
 
 def pdf_to_image_page():
     st.header("🖼️ PDF轉圖片")
@@ -76,10 +84,8 @@ def pdf_to_image_page():
     
     if uploaded_file is not None:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, uploaded_file.name)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
                 
             # 獲取PDF頁數
             try:
@@ -108,7 +114,7 @@ def pdf_to_image_page():
                 # 選擇圖片格式
                 image_format = st.selectbox(
                     "圖片格式",
-                    ["PNG", "JPEG", "TIFF", "BMP"]
+                    available_formats()
                 )
                 
                 # DPI設置
@@ -120,17 +126,44 @@ def pdf_to_image_page():
                     step=10
                 )
                 
-                # 圖像質量（僅適用於JPEG）
-                if image_format == "JPEG":
-                    quality = st.slider(
-                        "JPEG質量",
+                # 編碼設定：大量導出時編碼往往比轉換更耗時
+                profile_label = st.selectbox(
+                    "編碼設定",
+                    list(PROFILE_OPTIONS.keys()),
+                    index=1,
+                    help="速度優先壓縮較少、編碼最快；體積優先花更多CPU時間換取較小的文件"
+                )
+                profile = PROFILE_OPTIONS[profile_label]
+                format_overrides = {}
+                
+                # 圖像質量（僅適用於JPEG和WebP）
+                if image_format in ("JPEG", "WEBP"):
+                    format_overrides["quality"] = st.slider(
+                        f"{image_format}質量",
                         min_value=10,
                         max_value=100,
                         value=80,
                         step=5
                     )
-                else:
-                    quality = 80  # 默認值
+                if image_format == "JPEG":
+                    subsampling_label = st.selectbox("色度抽樣", list(JPEG_SUBSAMPLING.keys()), index=2)
+                    format_overrides["subsampling"] = JPEG_SUBSAMPLING[subsampling_label]
+                    format_overrides["progressive"] = st.checkbox(
+                        "漸進式JPEG",
+                        value=encoder_options("JPEG", profile)["progressive"],
+                        help="網頁上可以先顯示模糊的整張圖片，文件大小通常相近"
+                    )
+                elif image_format == "WEBP":
+                    format_overrides["lossless"] = st.checkbox("無損WebP", value=False)
+                elif image_format == "TIFF":
+                    default_compression = encoder_options("TIFF", profile)["compression"]
+                    compression_label = st.selectbox(
+                        "TIFF壓縮方式",
+                        list(TIFF_COMPRESSION_OPTIONS.keys()),
+                        index=list(TIFF_COMPRESSION_OPTIONS.values()).index(default_compression),
+                        help="Group 4只適用於黑白文檔，頁面會轉換為黑白兩色"
+                    )
+                    format_overrides["compression"] = TIFF_COMPRESSION_OPTIONS[compression_label]
                 
                 # 開始轉換按鈕
                 if st.button("轉換為圖片"):
@@ -140,83 +173,69 @@ def pdf_to_image_page():
                             if page_selection == "所有頁面":
                                 page_nums = list(range(1, total_pages + 1))
                             else:
-                                page_nums = []
-                                parts = page_ranges.split(',')
-                                for part in parts:
-                                    if '-' in part:
-                                        start, end = map(int, part.split('-'))
-                                        # 檢查範圍是否有效
-                                        if start < 1 or end > total_pages or start > end:
-                                            st.error(f"無效的頁數範圍: {part}")
-                                            break
-                                        page_nums.extend(list(range(start, end + 1)))
-                                    else:
-                                        page = int(part)
-                                        if page < 1 or page > total_pages:
-                                            st.error(f"無效的頁數: {part}")
-                                            break
-                                        page_nums.append(page)
+                                try:
+                                    page_nums = parse_page_selection(page_ranges, total_pages)
+                                except ValueError as e:
+                                    st.error(str(e))
+                                    st.stop()
                             
                             # 創建保存圖片的目錄
                             image_dir = os.path.join(tmpdirname, "images")
                             os.makedirs(image_dir, exist_ok=True)
                             
-                            # 轉換PDF頁面為圖片，使用找到的poppler_path
-                            images = convert_from_path(
-                                temp_file, 
-                                dpi=dpi, 
-                                first_page=min(page_nums),
-                                last_page=max(page_nums),
-                                poppler_path=poppler_path
-                            )
+                            # 按選擇的格式和編碼設定生成保存參數
+                            extension = IMAGE_FORMATS[image_format]["extension"]
+                            save_options = encoder_options(image_format, profile, **format_overrides)
                             
-                            # 儲存圖片
-                            image_paths = []
-                            for i, image in enumerate(images):
-                                page_num = page_nums[i] if i < len(page_nums) else min(page_nums) + i
-                                
-                                # 根據選擇的格式設置文件名和格式
-                                if image_format == "PNG":
-                                    img_file = os.path.join(image_dir, f"page_{page_num}.png")
-                                    image.save(img_file, "PNG")
-                                elif image_format == "JPEG":
-                                    img_file = os.path.join(image_dir, f"page_{page_num}.jpg")
-                                    image.save(img_file, "JPEG", quality=quality)
-                                elif image_format == "TIFF":
-                                    img_file = os.path.join(image_dir, f"page_{page_num}.tiff")
-                                    image.save(img_file, "TIFF")
-                                elif image_format == "BMP":
-                                    img_file = os.path.join(image_dir, f"page_{page_num}.bmp")
-                                    image.save(img_file, "BMP")
-                                
-                                image_paths.append(img_file)
+                            def save_page(page_num, image):
+                                img_file = os.path.join(image_dir, f"page_{page_num}.{extension}")
+                                return encode_image(image, img_file, image_format, save_options)
                             
-                            # 創建圖片預覽
+                            # 先以小尺寸直接轉換前6頁的縮圖作為預覽，不必等全部轉換完成
                             st.subheader("圖片預覽")
-                            cols = st.columns(min(3, len(image_paths)))
-                            for idx, img_path in enumerate(image_paths[:6]):  # 最多顯示6張圖片預覽
+                            preview_pages = page_nums[:6]
+                            cols = st.columns(min(3, len(preview_pages)))
+                            for idx, (page_num, thumbnail) in enumerate(
+                                iter_thumbnails(temp_file, preview_pages, poppler_path=poppler_path)
+                            ):
                                 with cols[idx % 3]:
-                                    img = Image.open(img_path)
-                                    st.image(img, caption=f"頁面 {page_nums[idx]}", width=200)
+                                    st.image(thumbnail, caption=f"頁面 {page_num}", width=200)
                             
-                            if len(image_paths) > 6:
-                                st.info(f"只顯示前6張圖片預覽，總共轉換了 {len(image_paths)} 張圖片")
+                            if len(page_nums) > 6:
+                                st.info(f"只顯示前6頁的預覽，總共將轉換 {len(page_nums)} 頁")
                             
-                            # 創建ZIP文件
+                            # 只轉換所選頁面：連續的頁面合併為一個範圍，多個pdftoppm進程並行轉換，結果以真實頁碼返回
+                            # 每頁轉換完成後立即加入ZIP並刪除
+                            progress_bar = st.progress(0)
                             zip_file = os.path.join(tmpdirname, "converted_images.zip")
-                            with zipfile.ZipFile(zip_file, 'w') as zipf:
-                                for img_path in image_paths:
-                                    zipf.write(img_path, os.path.basename(img_path))
+                            encode_stats = []
+                            with StreamingZipWriter(zip_file) as archive:
+                                for page_num, encoded in render_page_set(
+                                    temp_file, page_nums, dpi, save_page,
+                                    poppler_path=poppler_path, work_dir=tmpdirname
+                                ):
+                                    archive.add_file(encoded["path"], remove=True)
+                                    encode_stats.append({
+                                        "頁碼": page_num,
+                                        "編碼時間(ms)": round(encoded["seconds"] * 1000, 1),
+                                        "大小(KB)": round(encoded["bytes"] / 1024, 1),
+                                    })
+                                    progress_bar.progress(archive.count / len(page_nums))
                             
-                            # 提供下載
-                            with open(zip_file, "rb") as f:
-                                zip_bytes = f.read()
+                            # 每頁的編碼時間和大小，用於比較不同的編碼設定
+                            total_seconds = sum(stat["編碼時間(ms)"] for stat in encode_stats) / 1000
+                            total_kb = sum(stat["大小(KB)"] for stat in encode_stats)
+                            st.caption(
+                                f"編碼共 {total_seconds:.2f} 秒（平均每頁 {total_seconds * 1000 / len(encode_stats):.0f} 毫秒），"
+                                f"圖片共 {total_kb / 1024:.2f} MB"
+                            )
+                            with st.expander("每頁編碼時間", expanded=False):
+                                st.dataframe(encode_stats, hide_index=True)
                             
-                            b64_zip = base64.b64encode(zip_bytes).decode()
-                            href = f'<a href="data:application/zip;base64,{b64_zip}" download="converted_images.zip" class="download-button">下載所有圖片</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                            # 提供下載
+                            offer_download(zip_file, "converted_images.zip", "下載所有圖片", mime="application/zip")
                             
-                            st.success(f"成功將 {len(image_paths)} 頁PDF轉換為 {image_format} 格式")
+                            st.success(f"成功將 {len(page_nums)} 頁PDF轉換為 {image_format} 格式")
                         
                         except Exception as e:
                             st.error(f"轉換過程中出錯: {str(e)}")
@@ -233,9 +252,9 @@ def pdf_to_image_page():
         ### 使用說明
         1. 上傳您的PDF文件
         2. 選擇要轉換的頁面（所有頁面或特定頁面）
-        3. 選擇輸出圖片格式（PNG、JPEG、TIFF或BMP）
+        3. 選擇輸出圖片格式（PNG、JPEG、WebP、TIFF或BMP）
         4. 調整DPI（解析度）設置
-        5. 對於JPEG格式，可以調整圖像質量
+        5. 選擇編碼設定（速度優先、平衡或體積優先）；JPEG和WebP可以調整圖像質量，TIFF可以選擇壓縮方式
         6. 點擊"轉換為圖片"按鈕
         7. 下載包含所有圖片的ZIP壓縮包
         
@@ -0,0 +1,106 @@
+# 下載模組：從磁碟提供處理結果，不再把整個文件轉成base64嵌入頁面
+import os
+import time
+import shutil
+import secrets
+import html
+import mimetypes
+from urllib.parse import quote
+import streamlit as st
+
+# 靜態下載目錄，位於應用根目錄的static資料夾下（需要啟用 server.enableStaticServing）
+STATIC_DOWNLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "downloads")
+# 文件達到此大小且已啟用靜態服務時，使用帶令牌的靜態連結下載
+STATIC_DOWNLOAD_MIN_BYTES = int(float(os.environ.get("PDF_TOOLKIT_STATIC_DOWNLOAD_MB", "50")) * 1024 * 1024)
+# 靜態下載連結的有效時間（秒）
+STATIC_DOWNLOAD_TTL = int(float(os.environ.get("PDF_TOOLKIT_STATIC_DOWNLOAD_TTL_MINUTES", "60")) * 60)
+
+_last_cleanup = [0.0]
+
+def _static_serving_enabled():
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+def _publish_static(path, file_name):
+    """把文件放到帶隨機令牌的靜態目錄，返回相對URL"""
+    token = secrets.token_urlsafe(16)
+    token_dir = os.path.join(STATIC_DOWNLOAD_DIR, token)
+    os.makedirs(token_dir, exist_ok=True)
+    # 文件名只用於顯示，磁碟上使用安全的名稱
+    safe_name = "".join(c for c in file_name if c.isalnum() or c in "._-") or "download"
+    target = os.path.join(token_dir, safe_name)
+    try:
+        # 同一文件系統時使用硬連結，避免再複製一次
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return f"app/static/downloads/{token}/{quote(safe_name)}"
+
+def cleanup_static_downloads(ttl=STATIC_DOWNLOAD_TTL, min_interval=60):
+    """
+    刪除已過期的靜態下載，每個進程最多每min_interval秒執行一次
+
+    靜態文件由Streamlit直接提供，無法在下載時檢查有效期，因此在應用每次執行和每次顯示下載時調用
+    """
+    now = time.time()
+    if now - _last_cleanup[0] < min_interval:
+        return
+    _last_cleanup[0] = now
+    try:
+        entries = list(os.scandir(STATIC_DOWNLOAD_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
+
+def offer_download(source, file_name, label, mime=None, key=None):
+    """
+    顯示處理結果的下載按鈕
+
+    較小的文件使用st.download_button，由Streamlit的媒體端點以HTTP傳送；
+    較大的文件在啟用靜態服務時改用帶過期令牌的靜態連結，直接從磁碟分塊傳送
+
+    參數:
+    source (str 或 bytes): 文件路徑或文件內容
+    file_name (str): 下載時的文件名
+    label (str): 按鈕文字
+    mime (str): MIME類型，默認按文件名推斷
+    key (str): 可選，同一頁面有多個相同的下載按鈕時使用
+    """
+    cleanup_static_downloads()
+    if mime is None:
+        mime = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+    if isinstance(source, str):
+        size = os.path.getsize(source)
+        if size >= STATIC_DOWNLOAD_MIN_BYTES and _static_serving_enabled():
+            try:
+                url = _publish_static(source, file_name)
+                st.markdown(
+                    f'<a href="{url}" download="{html.escape(file_name)}" class="download-button">{html.escape(label)}</a>',
+                    unsafe_allow_html=True
+                )
+                st.caption(f"下載連結將在 {STATIC_DOWNLOAD_TTL // 60} 分鐘後失效")
+                return
+            except OSError:
+                pass
+        with open(source, "rb") as f:
+            _download_button(label, f, file_name, mime, key)
+    else:
+        _download_button(label, source, file_name, mime, key)
+
+def _download_button(label, data, file_name, mime, key):
+    try:
+        # 點擊下載時不重新執行腳本，處理結果不會因此消失
+        st.download_button(label, data=data, file_name=file_name, mime=mime, key=key, on_click="ignore")
+    except TypeError:
+        # 舊版Streamlit不支持on_click="ignore"
+        if hasattr(data, "seek"):
+            data.seek(0)
+        st.download_button(label, data=data, file_name=file_name, mime=mime, key=key)
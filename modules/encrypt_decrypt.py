@@ -2,8 +2,9 @@ import streamlit as st
 import os
 import tempfile
 from PyPDF2 import PdfReader, PdfWriter
-import base64
 from io import BytesIO
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
 
 def pdf_encrypt_decrypt_page():
     st.header("🔒 PDF加密/解密")
@@ -20,10 +21,8 @@ def pdf_encrypt_decrypt_page():
     
     if uploaded_file is not None:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, uploaded_file.name)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
             
             # 嘗試讀取PDF以獲取基本信息
             try:
@@ -124,12 +123,7 @@ def pdf_encrypt_decrypt_page():
                                             writer.write(f)
                                         
                                         # 提供下載
-                                        with open(output_file, "rb") as f:
-                                            pdf_bytes = f.read()
-                                        
-                                        b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="encrypted_{uploaded_file.name}" class="download-button">下載加密的PDF</a>'
-                                        st.markdown(href, unsafe_allow_html=True)
+                                        offer_download(output_file, f"encrypted_{uploaded_file.name}", "下載加密的PDF")
                                         
                                         st.success("PDF加密成功！請妥善保管您的密碼。")
                                         
@@ -186,12 +180,7 @@ def pdf_encrypt_decrypt_page():
                                                         writer.write(f)
                                                     
                                                     # 提供下載
-                                                    with open(output_file, "rb") as f:
-                                                        pdf_bytes = f.read()
-                                                    
-                                                    b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="decrypted_{uploaded_file.name}" class="download-button">下載解密的PDF</a>'
-                                                    st.markdown(href, unsafe_allow_html=True)
+                                                    offer_download(output_file, f"decrypted_{uploaded_file.name}", "下載解密的PDF")
                                                     
                                                     st.success("PDF解密成功！文件已完全解密。")
                                                 except Exception as e:
@@ -212,12 +201,7 @@ def pdf_encrypt_decrypt_page():
                                                         pdf.save(alt_output_file)
                                                         
                                                         # 提供下載
-                                                        with open(alt_output_file, "rb") as f:
-                                                            pdf_bytes = f.read()
-                                                        
-                                                        b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                                        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="decrypted_{uploaded_file.name}" class="download-button">下載解密的PDF</a>'
-                                                        st.markdown(href, unsafe_allow_html=True)
+                                                        offer_download(alt_output_file, f"decrypted_{uploaded_file.name}", "下載解密的PDF")
                                                         
                                                         st.success("使用替代方法成功解密PDF！")
                                                     except Exception as alt_error:
@@ -253,12 +237,7 @@ def pdf_encrypt_decrypt_page():
                                                                 writer.write(f)
                                                             
                                                             # 提供下載
-                                                            with open(output_file, "rb") as f:
-                                                                pdf_bytes = f.read()
-                                                            
-                                                            b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                                            href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="decrypted_{uploaded_file.name}" class="download-button">下載解密的PDF</a>'
-                                                            st.markdown(href, unsafe_allow_html=True)
+                                                            offer_download(output_file, f"decrypted_{uploaded_file.name}", "下載解密的PDF")
                                                             
                                                             st.success("PDF解密成功！")
                                                             break
@@ -281,12 +260,7 @@ def pdf_encrypt_decrypt_page():
                                                         pdf.save(alt_output_file)
                                                         
                                                         # 提供下載
-                                                        with open(alt_output_file, "rb") as f:
-                                                            pdf_bytes = f.read()
-                                                        
-                                                        b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                                        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="decrypted_{uploaded_file.name}" class="download-button">下載解密的PDF</a>'
-                                                        st.markdown(href, unsafe_allow_html=True)
+                                                        offer_download(alt_output_file, f"decrypted_{uploaded_file.name}", "下載解密的PDF")
                                                         
                                                         st.success("使用強力方法成功解密PDF！")
                                                     except Exception as e:
@@ -311,12 +285,7 @@ def pdf_encrypt_decrypt_page():
                                                     pdf.save(alt_output_file)
                                                     
                                                     # 提供下載
-                                                    with open(alt_output_file, "rb") as f:
-                                                        pdf_bytes = f.read()
-                                                    
-                                                    b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="decrypted_{uploaded_file.name}" class="download-button">下載解密的PDF</a>'
-                                                    st.markdown(href, unsafe_allow_html=True)
+                                                    offer_download(alt_output_file, f"decrypted_{uploaded_file.name}", "下載解密的PDF")
                                                     
                                                     st.success("最終方法成功解密PDF！")
                                                 except Exception as final_error:
@@ -1,12 +1,123 @@
 import streamlit as st
 import os
 import tempfile
-from pdfminer.high_level import extract_text, extract_pages
-from pdfminer.layout import LTTextContainer
-import base64
 from io import BytesIO
 import platform
 import sys
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
+from pdf_engine.pages import parse_page_selection
+from pdf_engine.ocr import (
+    OCR_WORKERS, ocr_missing_pages, installed_languages, available_language_candidates, detect_language
+)
+from pdf_engine.text_layer import MIN_TEXT_CHARS, split_by_text_layer
+from pdf_engine.text_extract import TEXT_WORKERS, DEFAULT_LAYOUT_PRESET
+from pdf_engine.text_index import indexed_page_texts, search_document
+
+# 版面分析設定的顯示名稱
+LAYOUT_PRESET_LABELS = {
+    "accurate": "精確（計算閱讀順序）",
+    "fast": "快速（只組合行和文字框）",
+    "none": "最快（不分析版面）",
+}
+
+# OCR語言選項的顯示名稱，AUTO_LANGUAGE表示按樣本頁面自動偵測
+AUTO_LANGUAGE = "auto"
+LANGUAGE_LABELS = {
+    AUTO_LANGUAGE: "自動偵測",
+    "chi_tra+eng": "繁體中文+英文",
+    "chi_sim+eng": "簡體中文+英文",
+    "eng": "英文",
+}
+# tesseract附帶的非文字語言數據，不作為選項
+_NON_TEXT_LANGUAGES = {"osd", "equ"}
+
+# 選擇OCR語言：已安裝的語言只查詢一次，返回語言代碼、AUTO_LANGUAGE或None（使用tesseract默認語言）
+def _select_ocr_language():
+    installed = installed_languages()
+    if not installed:
+        st.warning("無法取得Tesseract已安裝的語言，將使用Tesseract的默認語言")
+        return None
+    options = [AUTO_LANGUAGE] + available_language_candidates()
+    options += sorted(lang for lang in installed - _NON_TEXT_LANGUAGES if lang not in options)
+    return st.selectbox(
+        "OCR語言",
+        options,
+        format_func=lambda lang: LANGUAGE_LABELS.get(lang, lang),
+        help="自動偵測會用各個已安裝的語言識別一個樣本頁面，選擇置信度最高的語言"
+    )
+
+# 以OCR識別指定頁面，顯示進度並返回帶頁碼標題的文本
+# min_chars不為None時為混合模式：文字層有足夠文字的頁面直接使用文字層，只有掃描頁面使用OCR
+def _ocr_text(input_file, page_nums, poppler_path, lang=None, min_chars=None):
+    page_nums = sorted(set(page_nums))
+    if min_chars is None:
+        text_layers, scanned_pages = {}, page_nums
+    else:
+        text_layers, scanned_pages = split_by_text_layer(input_file, page_nums, min_chars)
+        st.caption(f"{len(text_layers)} 頁使用文字層，{len(scanned_pages)} 頁使用OCR")
+    if lang == AUTO_LANGUAGE:
+        lang = detect_language(input_file, scanned_pages, poppler_path=poppler_path) if scanned_pages else None
+        if scanned_pages:
+            st.caption(f"偵測到的OCR語言: {LANGUAGE_LABELS.get(lang, lang or 'Tesseract默認')}")
+    progress_bar = st.progress(0)
+    progress_text = st.empty()
+    
+    def progress_callback(value, message):
+        progress_bar.progress(min(1.0, value))
+        progress_text.text(f"{message}（{OCR_WORKERS} 個識別進程）")
+    
+    text = ""
+    for page_num, page_text, _ in ocr_missing_pages(input_file, page_nums, text_layers, lang=lang,
+                                                    poppler_path=poppler_path,
+                                                    progress_callback=progress_callback):
+        text += f"===== 第 {page_num} 頁 =====\n{page_text}\n\n"
+    progress_bar.progress(1.0)
+    progress_text.empty()
+    return text
+
+# 以pdfminer提取指定頁面，返回按頁碼順序的 (頁碼, 文字) 列表
+# 已在文字索引中的頁面直接讀取，其餘頁面只分析所選頁面的版面，多個進程並行，提取後加入索引
+def _layout_page_texts(input_file, page_nums, preset):
+    progress_bar = st.progress(0)
+    progress_text = st.empty()
+    
+    def progress_callback(value, message):
+        progress_bar.progress(min(1.0, value))
+        progress_text.text(f"{message}（{TEXT_WORKERS} 個提取進程）")
+    
+    page_texts, cached = indexed_page_texts(input_file, page_nums, preset, progress_callback=progress_callback)
+    progress_bar.progress(1.0)
+    progress_text.empty()
+    if cached:
+        st.caption(f"{cached}/{len(page_texts)} 頁從文字索引讀取")
+    return page_texts
+
+# 在整個文檔中搜索文字並顯示每頁的結果；第一次搜索時建立文字索引
+def _search_text(input_file, query, page_count, preset):
+    progress_bar = st.progress(0)
+    progress_text = st.empty()
+    
+    def progress_callback(value, message):
+        progress_bar.progress(min(1.0, value))
+        progress_text.text(f"正在建立文字索引：{message}（{TEXT_WORKERS} 個提取進程）")
+    
+    results = search_document(input_file, query, page_count, preset, progress_callback=progress_callback)
+    progress_bar.progress(1.0)
+    progress_text.empty()
+    
+    if not results:
+        st.info(f"沒有找到「{query}」")
+        return
+    st.success(f"在 {len(results)} 頁中找到「{query}」，共 {sum(r['count'] for r in results)} 處")
+    for result in results:
+        st.markdown(f"**第 {result['page']} 頁**（{result['count']} 處）")
+        st.text(result["snippet"])
+        if result["lines"]:
+            # PDF座標的原點在頁面左下角，單位為點（1/72英寸）
+            positions = "、".join(f"({x0:.0f}, {y0:.0f})" for x0, y0, _, _ in result["lines"][:5])
+            more = " 等" if len(result["lines"]) > 5 else ""
+            st.caption(f"所在行的位置（左下角座標，點）：{positions}{more}")
 
 def pdf_extract_text_page():
     st.header("📝 PDF文字提取")
@@ -108,52 +219,56 @@ def pdf_extract_text_page():
             # 獲取安全的基本文件名（不包含擴展名）
             safe_basename = os.path.splitext(safe_filename)[0]
             
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, safe_filename)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
             
             # 選擇提取模式
             st.subheader("選擇提取模式")
             extraction_mode = st.radio(
                 "提取模式",
-                ["提取所有文本", "提取特定頁面", "提取表格數據(試驗性)"]
+                ["提取所有文本", "提取特定頁面", "搜索文檔內容", "提取表格數據(試驗性)"]
             )
             
-            # 提供檢測OCR選項
-            use_ocr = st.checkbox("使用OCR識別掃描文檔中的文字（需要Tesseract）", value=False, key="ocr_checkbox")
+            # 提供檢測OCR選項（搜索只使用文字層，不提供OCR）
+            use_ocr = extraction_mode != "搜索文檔內容" and st.checkbox(
+                "使用OCR識別掃描文檔中的文字（需要Tesseract）", value=False, key="ocr_checkbox"
+            )
+            ocr_language = _select_ocr_language() if use_ocr else None
+            ocr_min_chars = None
+            if use_ocr and st.checkbox(
+                "只對沒有文字層的頁面使用OCR（混合模式）",
+                value=True,
+                help="先檢查每頁已有的文字，只把掃描頁面交給OCR，其餘頁面直接使用原有文字，混合文檔可以快很多"
+            ):
+                ocr_min_chars = st.number_input(
+                    "文字少於多少個字元的頁面視為掃描頁面",
+                    min_value=1,
+                    max_value=1000,
+                    value=MIN_TEXT_CHARS
+                )
+            layout_preset = DEFAULT_LAYOUT_PRESET
+            if not use_ocr:
+                layout_preset = st.selectbox(
+                    "版面分析",
+                    list(LAYOUT_PRESET_LABELS),
+                    format_func=LAYOUT_PRESET_LABELS.get,
+                    help="版面分析決定文字的行和閱讀順序；單欄文檔使用快速或最快設定通常結果相同，但速度快很多"
+                )
             
             if extraction_mode == "提取所有文本":
                 if st.button("提取文本"):
                     with st.spinner("正在提取文本..."):
                         try:
+                            from PyPDF2 import PdfReader
+                            page_count = len(PdfReader(temp_file).pages)
                             if use_ocr:
                                 st.warning("OCR模式可能需要較長時間，請耐心等待")
-                                # 這裡可以集成Tesseract OCR處理，但需要額外的庫
-                                # 以下是簡化的OCR處理
-                                import pytesseract
-                                from pdf2image import convert_from_path
-                                
-                                # 將PDF轉換為圖像，使用找到的poppler_path
-                                images = convert_from_path(temp_file, poppler_path=poppler_path)
-                                
-                                # 從圖像中提取文本
-                                text = ""
-                                for i, image in enumerate(images):
-                                    # 嘗試使用簡體中文和繁體中文
-                                    try:
-                                        page_text = pytesseract.image_to_string(image, lang='chi_tra+eng')
-                                    except:
-                                        try:
-                                            page_text = pytesseract.image_to_string(image, lang='chi_sim+eng')
-                                        except:
-                                            # 如果中文語言包不可用，退回到英文
-                                            page_text = pytesseract.image_to_string(image)
-                                    
-                                    text += f"===== 第 {i+1} 頁 =====\n{page_text}\n\n"
+                                # 逐頁轉換並由多個tesseract進程並行識別，結果按頁碼順序合併
+                                text = _ocr_text(temp_file, range(1, page_count + 1), poppler_path, ocr_language, ocr_min_chars)
                             else:
-                                # 使用pdfminer提取文本
-                                text = extract_text(temp_file)
+                                # 使用pdfminer提取文本，頁面分組並行分析，頁面之間以換頁符分隔（與extract_text相同）
+                                page_texts = _layout_page_texts(temp_file, range(1, page_count + 1), layout_preset)
+                                text = "".join(f"{page_text}\f" for _, page_text in page_texts)
                                 
                             # 顯示提取的文本
                             st.subheader("提取的文本：")
@@ -164,13 +279,8 @@ def pdf_extract_text_page():
                             with open(output_file, "w", encoding="utf-8") as f:
                                 f.write(text)
                                 
-                            with open(output_file, "rb") as f:
-                                txt_bytes = f.read()
-                                
-                            b64_txt = base64.b64encode(txt_bytes).decode()
                             original_basename = os.path.splitext(uploaded_file.name)[0]
-                            href = f'<a href="data:text/plain;base64,{b64_txt}" download="{original_basename}.txt" class="download-button">下載文本文件</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                            offer_download(output_file, f"{original_basename}.txt", "下載文本文件", mime="text/plain")
                             
                             st.success("文本提取完成！")
                         except Exception as e:
@@ -195,59 +305,22 @@ def pdf_extract_text_page():
                         with st.spinner("正在提取文本..."):
                             try:
                                 # 解析頁面範圍
-                                pages_to_extract = []
-                                parts = page_ranges.split(',')
-                                for part in parts:
-                                    if '-' in part:
-                                        start, end = map(int, part.split('-'))
-                                        # 檢查範圍是否有效
-                                        if start < 1 or end > total_pages or start > end:
-                                            st.error(f"無效的頁數範圍: {part}")
-                                            break
-                                        pages_to_extract.extend(range(start, end + 1))
-                                    else:
-                                        page = int(part)
-                                        if page < 1 or page > total_pages:
-                                            st.error(f"無效的頁數: {part}")
-                                            break
-                                        pages_to_extract.append(page)
+                                try:
+                                    pages_to_extract = parse_page_selection(page_ranges, total_pages)
+                                except ValueError as e:
+                                    st.error(str(e))
+                                    st.stop()
                                 
                                 # 提取特定頁面的文本
                                 if use_ocr:
                                     st.warning("OCR模式可能需要較長時間，請耐心等待")
-                                    import pytesseract
-                                    from pdf2image import convert_from_path
-                                    
-                                    # 將PDF轉換為圖像，使用找到的poppler_path
-                                    images = convert_from_path(temp_file, first_page=min(pages_to_extract), last_page=max(pages_to_extract), poppler_path=poppler_path)
-                                    
-                                    # 從圖像中提取文本
-                                    text = ""
-                                    for i, image in enumerate(images):
-                                        page_num = pages_to_extract[i] if i < len(pages_to_extract) else i + min(pages_to_extract)
-                                        
-                                        # 嘗試使用簡體中文和繁體中文
-                                        try:
-                                            page_text = pytesseract.image_to_string(image, lang='chi_tra+eng')
-                                        except:
-                                            try:
-                                                page_text = pytesseract.image_to_string(image, lang='chi_sim+eng')
-                                            except:
-                                                # 如果中文語言包不可用，退回到英文
-                                                page_text = pytesseract.image_to_string(image)
-                                                
-                                        text += f"===== 第 {page_num} 頁 =====\n{page_text}\n\n"
+                                    # 只轉換並識別所選頁面，結果以真實頁碼返回
+                                    text = _ocr_text(temp_file, pages_to_extract, poppler_path, ocr_language, ocr_min_chars)
                                 else:
-                                    # 使用pdfminer提取特定頁面文本
+                                    # 使用pdfminer只分析所選頁面的版面
                                     text = ""
-                                    for page_layout in extract_pages(temp_file):
-                                        page_num = page_layout.pageid + 1  # 頁碼從1開始
-                                        if page_num in pages_to_extract:
-                                            page_text = ""
-                                            for element in page_layout:
-                                                if isinstance(element, LTTextContainer):
-                                                    page_text += element.get_text()
-                                            text += f"===== 第 {page_num} 頁 =====\n{page_text}\n\n"
+                                    for page_num, page_text in _layout_page_texts(temp_file, pages_to_extract, layout_preset):
+                                        text += f"===== 第 {page_num} 頁 =====\n{page_text}\n\n"
                                 
                                 # 顯示提取的文本
                                 st.subheader("提取的文本：")
@@ -258,13 +331,8 @@ def pdf_extract_text_page():
                                 with open(output_file, "w", encoding="utf-8") as f:
                                     f.write(text)
                                     
-                                with open(output_file, "rb") as f:
-                                    txt_bytes = f.read()
-                                    
-                                b64_txt = base64.b64encode(txt_bytes).decode()
                                 original_basename = os.path.splitext(uploaded_file.name)[0]
-                                href = f'<a href="data:text/plain;base64,{b64_txt}" download="{original_basename}_selected_pages.txt" class="download-button">下載文本文件</a>'
-                                st.markdown(href, unsafe_allow_html=True)
+                                offer_download(output_file, f"{original_basename}_selected_pages.txt", "下載文本文件", mime="text/plain")
                                 
                                 st.success("選定頁面的文本提取完成！")
                             except Exception as e:
@@ -273,6 +341,18 @@ def pdf_extract_text_page():
                 except Exception as e:
                     st.error(f"讀取PDF頁數時出錯: {str(e)}")
             
+            elif extraction_mode == "搜索文檔內容":
+                query = st.text_input("搜索文字", help="不區分大小寫；第一次搜索時會建立文字索引，之後的搜索和提取直接使用索引")
+                
+                if st.button("搜索") and query.strip():
+                    with st.spinner("正在搜索..."):
+                        try:
+                            from PyPDF2 import PdfReader
+                            page_count = len(PdfReader(temp_file).pages)
+                            _search_text(temp_file, query.strip(), page_count, layout_preset)
+                        except Exception as e:
+                            st.error(f"搜索過程中出錯: {str(e)}")
+            
             elif extraction_mode == "提取表格數據(試驗性)":
                 st.warning("表格提取功能為試驗性功能，可能無法準確識別所有表格")
                 
@@ -318,12 +398,7 @@ def pdf_extract_text_page():
                                             zipf.write(file, os.path.basename(file))
                                     
                                     # 提供ZIP下載
-                                    with open(zip_file, "rb") as f:
-                                        zip_bytes = f.read()
-                                    
-                                    b64_zip = base64.b64encode(zip_bytes).decode()
-                                    href = f'<a href="data:application/zip;base64,{b64_zip}" download="tables.zip" class="download-button">下載CSV表格</a>'
-                                    st.markdown(href, unsafe_allow_html=True)
+                                    offer_download(zip_file, "tables.zip", "下載CSV表格", mime="application/zip")
                                 
                                 else:  # Excel
                                     # 將所有表格保存到一個Excel文件的不同工作表
@@ -335,12 +410,7 @@ def pdf_extract_text_page():
                                             table.to_excel(writer, sheet_name=f"表格_{i+1}", index=False)
                                     
                                     # 提供Excel下載
-                                    with open(excel_file, "rb") as f:
-                                        excel_bytes = f.read()
-                                    
-                                    b64_excel = base64.b64encode(excel_bytes).decode()
-                                    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64_excel}" download="tables.xlsx" class="download-button">下載Excel表格</a>'
-                                    st.markdown(href, unsafe_allow_html=True)
+                                    offer_download(excel_file, "tables.xlsx", "下載Excel表格", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
                                 
                                 st.success("表格提取完成！")
                             else:
@@ -359,10 +429,12 @@ def pdf_extract_text_page():
         2. 選擇提取模式：
            - 提取所有文本：從整個文件中提取
            - 提取特定頁面：只從選定頁面提取
+           - 搜索文檔內容：在整個文件中搜索文字，顯示所在頁面和位置
            - 提取表格數據：嘗試識別和提取表格(試驗性功能)
-        3. 對於掃描的文檔，可啟用OCR功能
-        4. 點擊相應的提取按鈕
-        5. 下載提取的結果
+        3. 對於掃描的文檔，可啟用OCR功能；混合文檔只有掃描頁面會使用OCR
+        4. 不使用OCR時可選擇版面分析設定，單欄文檔選擇快速設定可以大幅縮短提取時間
+        5. 點擊相應的提取按鈕
+        6. 下載提取的結果
         
         ### 適用場景
         - 從PDF報告中提取文字進行分析
@@ -1,13 +1,23 @@
 import streamlit as st
 import os
 import tempfile
-import base64
-from io import BytesIO
-from pdf2image import convert_from_path
-from PIL import Image
 import shutil
 import sys
 import platform
+import pikepdf
+from pdf_engine.sampling import SAMPLE_MIN_PAGES, plan_sample
+# 頁面轉換和大小搜索由pdf_engine.raster處理
+from pdf_engine.raster import (
+    AUTO_MAX_DPI, PageRenderCache, render_to_pdf, estimate_rendered_size, find_target_dpi,
+    find_target_settings
+)
+from pdf_engine.image_pdf import CCITT_AVAILABLE
+from pdf_engine.parallel_render import resolve_backend
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
+
+# 色度抽樣選項與Pillow的subsampling參數對應
+SUBSAMPLING_OPTIONS = {"4:4:4（最清晰）": 0, "4:2:2": 1, "4:2:0（最小）": 2}
 
 def legacy_compress_page():
     st.header("⚙️ 舊版PDF壓縮工具")
@@ -78,7 +88,8 @@ def legacy_compress_page():
         except Exception as e:
             st.warning(f"搜索pdftoppm時出錯: {str(e)}")
     
-    if not poppler_installed and poppler_path is None:
+    # 使用pdfium轉換後端時不需要Poppler
+    if resolve_backend() == "poppler" and not poppler_installed and poppler_path is None:
         st.error("此功能需要安裝Poppler! 請參考以下說明進行安裝：")
         
         with st.expander("Poppler安裝指南", expanded=True):
@@ -109,10 +120,8 @@ def legacy_compress_page():
     
     if uploaded_file is not None:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            # 保存上傳的文件
-            input_file = os.path.join(tmpdirname, uploaded_file.name)
-            with open(input_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            input_file = ingest_upload(uploaded_file)
             
             # 檢查文件大小
             original_size = os.path.getsize(input_file) / 1024  # KB
@@ -126,6 +135,15 @@ def legacy_compress_page():
                 # DPI 設定
                 dpi = st.slider("DPI設定", min_value=72, max_value=300, value=200, 
                                 help="較低的DPI產生較小的文件，但可能降低品質")
+                
+                # JPEG編碼設定
+                jpeg_quality = st.slider("JPEG質量", min_value=10, max_value=95, value=75,
+                                         help="較低的質量產生較小的文件，但可能出現壓縮痕跡")
+                subsampling_label = st.selectbox("色度抽樣", list(SUBSAMPLING_OPTIONS.keys()), index=2,
+                                                 help="4:2:0最小；彩色文字邊緣要求較高時可選4:4:4")
+                use_ccitt = st.checkbox("黑白頁面使用CCITT G4編碼", value=CCITT_AVAILABLE,
+                                        disabled=not CCITT_AVAILABLE,
+                                        help="只有黑白兩色的頁面（例如掃描文字）改用無損的傳真壓縮，通常比JPEG小得多")
             
             with col2:
                 # 自動模式
@@ -135,6 +153,11 @@ def legacy_compress_page():
                 if auto_mode:
                     target_size = st.number_input("目標檔案大小 (KB)", 
                                                min_value=100, max_value=10000, value=4096)
+                    tune_quality = st.checkbox("同時調整JPEG質量", value=True,
+                                               help="在DPI和JPEG質量之間尋找最清晰的組合，上面的JPEG質量作為上限；"
+                                                    "適度降低質量通常比降低DPI更能保留文字清晰度")
+                    allow_grayscale = st.checkbox("允許轉為灰階", value=False, disabled=not tune_quality,
+                                                  help="彩色內容不重要時，轉為灰階可以使用更高的DPI")
             
             # 預覽
             with st.expander("處理預覽", expanded=False):
@@ -147,131 +170,97 @@ def legacy_compress_page():
                 with st.spinner("正在處理中..."):
                     try:
                         output_path = os.path.join(tmpdirname, f"compressed_{uploaded_file.name}")
+                        encode_options = {
+                            "quality": jpeg_quality,
+                            "subsampling": SUBSAMPLING_OPTIONS[subsampling_label],
+                            "bilevel": use_ccitt,
+                            "grayscale": False,
+                        }
                         
                         if auto_mode:
                             # 自動調整模式
                             # 先使用較低DPI嘗試獲得小於目標大小的結果
-                            current_dpi = min(dpi, 150)  # 以較低DPI開始
-                            max_attempts = 15  # 增加嘗試次數以獲得更精確的結果
-                            attempt = 0
+                            start_dpi = min(dpi, 150)  # 以較低DPI開始
                             
-                            # 階段1: 找到一個小於目標大小的DPI
-                            last_success_dpi = 0
-                            last_success_size = 0
+                            # 頁數較多時只轉換抽樣頁面來估算大小
+                            plan = None
+                            try:
+                                with pikepdf.open(input_file) as pdf:
+                                    total_pages = len(pdf.pages)
+                                if total_pages >= SAMPLE_MIN_PAGES:
+                                    plan = plan_sample(input_file)
+                                    st.write(f"文檔共 {total_pages} 頁，使用 {len(plan['pages'])} 個抽樣頁面估算大小")
+                            except Exception:
+                                plan = None
                             
-                            while attempt < max_attempts:
-                                attempt += 1
-                                st.write(f"嘗試 #{attempt}，使用DPI: {current_dpi}")
-                                
-                                # 轉換PDF為圖像，使用找到的poppler_path
-                                images = convert_from_path(input_file, dpi=current_dpi, poppler_path=poppler_path)
-                                jpg_files = []
-                                
-                                # 保存為臨時JPG文件
-                                for i, image in enumerate(images):
-                                    jpg_path = os.path.join(tmpdirname, f"temp_page_{i}.jpg")
-                                    image = image.convert("RGB")
-                                    image.save(jpg_path, 'JPEG')
-                                    jpg_files.append(jpg_path)
-                                
-                                # 創建新的PDF
-                                image_objects = [Image.open(jpg_file) for jpg_file in jpg_files]
-                                if image_objects:
-                                    image_objects[0].save(
-                                        output_path, 
-                                        save_all=True, 
-                                        append_images=image_objects[1:] if len(image_objects) > 1 else []
+                            # 搜索時每頁只以範圍內的最高DPI轉換一次，各次嘗試由母版縮小得到
+                            render_cache = PageRenderCache(input_file, AUTO_MAX_DPI, poppler_path, tmpdirname)
+                            
+                            def search(measure, search_target):
+                                # 返回 (DPI, 編碼設定, 大小KB)；measure(DPI, JPEG質量, 灰階) -> 大小KB
+                                if tune_quality:
+                                    found = find_target_settings(
+                                        measure, search_target, max_quality=jpeg_quality,
+                                        allow_grayscale=allow_grayscale, start_dpi=start_dpi, log=st.write
                                     )
-                                
-                                # 清理臨時文件
-                                for jpg_file in jpg_files:
-                                    os.remove(jpg_file)
-                                
-                                # 檢查輸出大小
-                                output_size = os.path.getsize(output_path) / 1024  # KB
-                                
-                                if output_size <= target_size:
-                                    # 達到了目標大小以下，記錄這個DPI和大小
-                                    last_success_dpi = current_dpi
-                                    last_success_size = output_size
+                                    options = dict(encode_options, quality=found["quality"], grayscale=found["grayscale"])
+                                    return found["dpi"], options, found["size"]
+                                found_dpi, found_size, _ = find_target_dpi(
+                                    lambda current_dpi: measure(current_dpi, jpeg_quality, False),
+                                    start_dpi, search_target, log=st.write
+                                )
+                                return found_dpi, encode_options, found_size
+                            
+                            try:
+                                if plan is None:
+                                    # 每次嘗試都組合整份文檔，保留各組設定的結果
+                                    attempt_files = {}
+                                    
+                                    def measure(current_dpi, quality, grayscale):
+                                        attempt_path = os.path.join(
+                                            tmpdirname, f"attempt_{current_dpi}_{quality}_{int(grayscale)}.pdf"
+                                        )
+                                        attempt_files[(current_dpi, quality, grayscale)] = attempt_path
+                                        return render_to_pdf(input_file, attempt_path, current_dpi, poppler_path, tmpdirname,
+                                                             render_cache=render_cache,
+                                                             **dict(encode_options, quality=quality, grayscale=grayscale))
                                     
-                                    # 結束條件: 已達到最小DPI或已非常接近目標大小
-                                    if current_dpi >= 300 or (target_size - output_size) < target_size * 0.05:
-                                        st.write("已找到最佳DPI設定")
-                                        break
-                                        
-                                    # 嘗試更高一點的DPI，看能否更接近目標大小
-                                    next_dpi = min(300, int(current_dpi * 1.1))
-                                    if next_dpi == current_dpi:
-                                        next_dpi += 5  # 確保至少增加一點
-                                    current_dpi = next_dpi
+                                    current_dpi, encode_options, output_size = search(measure, target_size)
+                                    
+                                    # 直接使用選定設定那次嘗試的結果，無需重新生成
+                                    chosen = (current_dpi, encode_options["quality"], encode_options["grayscale"])
+                                    shutil.move(attempt_files.pop(chosen), output_path)
+                                    for attempt_path in attempt_files.values():
+                                        if os.path.exists(attempt_path):
+                                            os.remove(attempt_path)
                                 else:
-                                    # 超過目標大小，需要降低DPI
-                                    if last_success_dpi > 0:
-                                        # 我們之前已找到一個成功的DPI，找最大的可行值
-                                        current_dpi = int((last_success_dpi + current_dpi) / 2)
-                                        # 如果差距很小，就結束嘗試
-                                        if abs(current_dpi - last_success_dpi) <= 2:
-                                            current_dpi = last_success_dpi
-                                            output_size = last_success_size
-                                            st.write(f"確定最終DPI: {current_dpi}")
-                                            break
-                                    else:
-                                        # 首次嘗試就超過目標大小，大幅降低DPI
-                                        size_ratio = output_size / target_size
-                                        current_dpi = max(72, int(current_dpi / size_ratio))
-                                        
-                            # 如果沒有找到合適的值，使用最後一次成功的設定
-                            if last_success_dpi > 0 and output_size > target_size:
-                                st.write(f"使用之前找到的最佳DPI: {last_success_dpi}")
-                                current_dpi = last_success_dpi
-                                
-                                # 重新生成一次PDF以確保大小正確
-                                images = convert_from_path(input_file, dpi=current_dpi, poppler_path=poppler_path)
-                                jpg_files = []
-                                for i, image in enumerate(images):
-                                    jpg_path = os.path.join(tmpdirname, f"temp_page_{i}.jpg")
-                                    image = image.convert("RGB")
-                                    image.save(jpg_path, 'JPEG')
-                                    jpg_files.append(jpg_path)
-                                
-                                image_objects = [Image.open(jpg_file) for jpg_file in jpg_files]
-                                if image_objects:
-                                    image_objects[0].save(
-                                        output_path, 
-                                        save_all=True, 
-                                        append_images=image_objects[1:] if len(image_objects) > 1 else []
-                                    )
-                                
-                                for jpg_file in jpg_files:
-                                    os.remove(jpg_file)
+                                    def measure(current_dpi, quality, grayscale):
+                                        return estimate_rendered_size(input_file, plan, current_dpi, poppler_path,
+                                                                      render_cache=render_cache,
+                                                                      **dict(encode_options, quality=quality, grayscale=grayscale))
                                     
-                                output_size = os.path.getsize(output_path) / 1024  # KB
+                                    # 在樣本上搜索後轉換整份文檔，實際大小超出目標時校正一次
+                                    search_target = target_size
+                                    rendered = []
+                                    for round_index in range(2):
+                                        current_dpi, options, estimated_size = search(measure, search_target)
+                                        settings = (current_dpi, options["quality"], options["grayscale"])
+                                        if settings in rendered:
+                                            break
+                                        encode_options = options
+                                        st.write(f"以DPI {current_dpi} 轉換整份文檔（預估 {estimated_size:.2f} KB）")
+                                        # 整份文檔最多轉換兩次，直接以選定設定轉換比先轉換全部母版更快
+                                        output_size = render_to_pdf(input_file, output_path, current_dpi, poppler_path, tmpdirname,
+                                                                    **encode_options)
+                                        rendered.append(settings)
+                                        if output_size <= target_size:
+                                            break
+                                        search_target = target_size * estimated_size / output_size
+                            finally:
+                                render_cache.close()
                         else:
                             # 標準模式
-                            # 轉換PDF為圖像，使用找到的poppler_path
-                            images = convert_from_path(input_file, dpi=dpi, poppler_path=poppler_path)
-                            jpg_files = []
-                            
-                            # 保存為臨時JPG文件
-                            for i, image in enumerate(images):
-                                jpg_path = os.path.join(tmpdirname, f"temp_page_{i}.jpg")
-                                image = image.convert("RGB")
-                                image.save(jpg_path, 'JPEG')
-                                jpg_files.append(jpg_path)
-                            
-                            # 創建新的PDF
-                            image_objects = [Image.open(jpg_file) for jpg_file in jpg_files]
-                            if image_objects:
-                                image_objects[0].save(
-                                    output_path, 
-                                    save_all=True, 
-                                    append_images=image_objects[1:] if len(image_objects) > 1 else []
-                                )
-                            
-                            # 清理臨時文件
-                            for jpg_file in jpg_files:
-                                os.remove(jpg_file)
+                            render_to_pdf(input_file, output_path, dpi, poppler_path, tmpdirname, **encode_options)
                         
                         # 顯示結果
                         output_size = os.path.getsize(output_path) / 1024  # KB
@@ -285,15 +274,13 @@ def legacy_compress_page():
                         # 提供的DPI
                         if auto_mode:
                             st.write(f"最終使用的DPI: {current_dpi}")
+                            if tune_quality:
+                                st.write(f"最終使用的JPEG質量: {encode_options['quality']}"
+                                         f"{'（灰階）' if encode_options['grayscale'] else ''}")
                         
                         # 提供下載
-                        with open(output_path, "rb") as f:
-                            pdf_bytes = f.read()
-                        
                         download_filename = f"compressed_{uploaded_file.name}"
-                        b64_pdf = base64.b64encode(pdf_bytes).decode()
-                        href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{download_filename}" class="download-button">下載壓縮後的PDF</a>'
-                        st.markdown(href, unsafe_allow_html=True)
+                        offer_download(output_path, download_filename, "下載壓縮後的PDF")
                     
                     except Exception as e:
                         st.error(f"處理過程中出錯: {str(e)}")
@@ -327,4 +314,4 @@ def legacy_compress_page():
         ### 注意事項
         
         此功能需要安裝Poppler庫。如果您遇到"需要安裝Poppler"的錯誤，請參照安裝指南進行安裝。
-        """) 
\ No newline at end of file
+        """)
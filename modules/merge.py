@@ -2,8 +2,9 @@ import streamlit as st
 import os
 import tempfile
 from PyPDF2 import PdfMerger, PdfReader
-import base64
 from io import BytesIO
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
 
 def pdf_merge_page():
     st.header("📄 PDF合併")
@@ -24,20 +25,17 @@ def pdf_merge_page():
         
         # 檢查是否有加密的PDF文件
         encrypted_files = []
-        with tempfile.TemporaryDirectory() as check_tmpdirname:
-            for i, file in enumerate(uploaded_files):
-                temp_check_file = os.path.join(check_tmpdirname, f"check_{i}.pdf")
-                with open(temp_check_file, "wb") as f:
-                    f.write(file.getbuffer())
-                
-                # 檢查文件是否加密
-                try:
-                    reader = PdfReader(temp_check_file)
-                    if reader.is_encrypted:
-                        encrypted_files.append((i, file.name))
-                except Exception as e:
-                    if "encrypted" in str(e).lower():
-                        encrypted_files.append((i, file.name))
+        for i, file in enumerate(uploaded_files):
+            temp_check_file = ingest_upload(file)
+            
+            # 檢查文件是否加密
+            try:
+                reader = PdfReader(temp_check_file)
+                if reader.is_encrypted:
+                    encrypted_files.append((i, file.name))
+            except Exception as e:
+                if "encrypted" in str(e).lower():
+                    encrypted_files.append((i, file.name))
         
         # 如果有加密文件，顯示密碼輸入區域
         file_passwords = {}
@@ -124,9 +122,7 @@ def pdf_merge_page():
                             error_files = []
                             
                             for i, file in enumerate(uploaded_files):
-                                temp_file = os.path.join(tmpdirname, f"file_{i}.pdf")
-                                with open(temp_file, "wb") as f:
-                                    f.write(file.getbuffer())
+                                temp_file = ingest_upload(file)
                                 
                                 # 檢查是否為加密文件，如果是則嘗試解密
                                 is_encrypted_idx = next((idx for idx, _ in encrypted_files if idx == i), None)
@@ -200,14 +196,8 @@ def pdf_merge_page():
                                     merger.write(merged_file)
                                     merger.close()
                                     
-                                    # 讀取合併後的文件
-                                    with open(merged_file, "rb") as f:
-                                        pdf_bytes = f.read()
-                                    
                                     # 創建下載按鈕
-                                    b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{output_name}" class="download-button">下載合併後的PDF</a>'
-                                    st.markdown(href, unsafe_allow_html=True)
+                                    offer_download(merged_file, output_name, "下載合併後的PDF")
                                     
                                     # 顯示成功消息
                                     if encrypted_files:
@@ -2,9 +2,10 @@ import streamlit as st
 import os
 import tempfile
 from PyPDF2 import PdfReader, PdfWriter
-import base64
 from io import BytesIO
 from datetime import datetime
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
 
 def pdf_metadata_page():
     st.header("📋 PDF元數據編輯")
@@ -15,10 +16,8 @@ def pdf_metadata_page():
     
     if uploaded_file is not None:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, uploaded_file.name)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
             
             # 讀取PDF
             try:
@@ -139,12 +138,7 @@ def pdf_metadata_page():
                                 writer.write(f)
                             
                             # 提供下載
-                            with open(output_file, "rb") as f:
-                                pdf_bytes = f.read()
-                            
-                            b64_pdf = base64.b64encode(pdf_bytes).decode()
-                            href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="updated_{uploaded_file.name}" class="download-button">下載更新後的PDF</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                            offer_download(output_file, f"updated_{uploaded_file.name}", "下載更新後的PDF")
                             
                             st.success("PDF元數據更新成功！")
                         
@@ -1,24 +1,15 @@
 import streamlit as st
 import os
 import tempfile
-import pikepdf
-from pikepdf import Pdf
-import base64
 from io import BytesIO
 from PyPDF2 import PdfReader, PdfWriter
 import subprocess
-import shutil
 
-# 檢查Ghostscript是否可用
-GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin64c.exe")
-if not os.path.exists(GHOSTSCRIPT_PATH):
-    GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin32c.exe")
-    if not os.path.exists(GHOSTSCRIPT_PATH):
-        # 嘗試在系統路徑中查找
-        GHOSTSCRIPT_PATH = shutil.which("gswin64c") or shutil.which("gswin32c") or "gs"
-
-# 檢查Ghostscript是否可用
-GHOSTSCRIPT_AVAILABLE = os.path.exists(GHOSTSCRIPT_PATH)
+# 檢查Ghostscript是否可用，並共用gs_backend的執行後端
+from pdf_engine.gs_backend import GHOSTSCRIPT_PATH, GHOSTSCRIPT_AVAILABLE, run_ghostscript
+from pdf_engine.compress import pikepdf_optimize
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
 
 def pdf_optimize_page():
     st.header("📱 PDF優化")
@@ -37,12 +28,9 @@ def pdf_optimize_page():
                 safe_filename += '.pdf'
                 
             # 使用短文件名和路徑避免特殊字符問題
-            temp_input = os.path.join(tmpdirname, "input.pdf")
+            temp_input = ingest_upload(uploaded_file)
             temp_output = os.path.join(tmpdirname, "output.pdf")
             
-            with open(temp_input, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
             # 獲取原始文件大小
             original_size = os.path.getsize(temp_input) / (1024 * 1024)  # 轉換為MB
             
@@ -195,13 +183,7 @@ def pdf_optimize_page():
                                 
                                 # 執行命令
                                 try:
-                                    process = subprocess.run(
-                                        gs_cmd,
-                                        check=True,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        text=True
-                                    )
+                                    process = run_ghostscript(gs_cmd)
                                     
                                     # 使用Ghostscript優化後的文件作為輸出
                                     final_output_file = temp_output
@@ -242,12 +224,7 @@ def pdf_optimize_page():
                                     st.info("文件已處理，但優化效果有限")
                                 
                                 # 提供下載
-                                with open(final_output_file, "rb") as f:
-                                    pdf_bytes = f.read()
-                                    
-                                b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="optimized_{uploaded_file.name}" class="download-button">下載優化後的PDF</a>'
-                                st.markdown(href, unsafe_allow_html=True)
+                                offer_download(final_output_file, f"optimized_{uploaded_file.name}", "下載優化後的PDF")
                                 
                                 # 顯示應用的優化選項摘要
                                 with st.expander("優化選項摘要"):
@@ -312,32 +289,3 @@ def pdf_optimize_page():
         - 節省雲存儲空間
         - 優化電子郵件附件大小
         """)
-
-# pikepdf優化輔助函數
-def pikepdf_optimize(input_file, output_file, params):
-    """使用pikepdf進行基本優化"""
-    pdf = Pdf.open(input_file)
-    
-    # 移除元數據
-    if params["remove_metadata"]:
-        with pdf.open_metadata() as meta:
-            meta.clear()
-    
-    # 壓平表單欄位
-    if params["flatten_forms"]:
-        for page in pdf.pages:
-            if "/Annots" in page:
-                del page["/Annots"]
-    
-    # 移除書籤
-    if params["remove_bookmarks"]:
-        if "/Outlines" in pdf.Root:
-            del pdf.Root["/Outlines"]
-    
-    # 保存為優化的PDF
-    pdf.save(output_file,
-            object_stream_mode=pikepdf.ObjectStreamMode.generate,
-            compress_streams=True,
-            recompress_flate=True)
-    
-    return output_file 
\ No newline at end of file
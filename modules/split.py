@@ -1,10 +1,20 @@
 import streamlit as st
 import os
 import tempfile
-import zipfile
 from PyPDF2 import PdfReader, PdfWriter
-import base64
 from io import BytesIO
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
+from pdf_engine.archive import StreamingZipWriter
+
+# 把指定頁面寫成一個PDF並直接加入壓縮檔
+def _add_split(archive, pdf, page_indices, name):
+    output = PdfWriter()
+    for page_num in page_indices:
+        output.add_page(pdf.pages[page_num])
+    buffer = BytesIO()
+    output.write(buffer)
+    archive.add_bytes(name, buffer.getvalue())
 
 def pdf_split_page():
     st.header("✂️ PDF分割")
@@ -22,10 +32,8 @@ def pdf_split_page():
             elif not safe_filename.lower().endswith('.pdf'):
                 safe_filename += '.pdf'
                 
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, safe_filename)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
             
             # 先檢查文件是否加密
             try:
@@ -131,37 +139,16 @@ def pdf_split_page():
                                 
                                 # 執行分割
                                 with st.spinner("正在分割PDF..."):
-                                    # 創建分割文件目錄
-                                    split_dir = os.path.join(tmpdirname, "split")
-                                    os.makedirs(split_dir, exist_ok=True)
-                                    
-                                    # 對每個範圍創建一個新的PDF
-                                    output_files = []
-                                    for i, (start, end) in enumerate(ranges):
-                                        output = PdfWriter()
-                                        for page_num in range(start, end + 1):
-                                            output.add_page(pdf.pages[page_num])
-                                        
-                                        output_file = os.path.join(split_dir, f"split_{i+1}.pdf")
-                                        with open(output_file, "wb") as f:
-                                            output.write(f)
-                                        output_files.append(output_file)
-                                    
-                                    # 創建ZIP文件
+                                    # 每個範圍生成後立即加入ZIP，不在磁碟上保留分割文件
                                     zip_file = os.path.join(tmpdirname, "split_files.zip")
-                                    with zipfile.ZipFile(zip_file, 'w') as zipf:
-                                        for file in output_files:
-                                            zipf.write(file, os.path.basename(file))
+                                    with StreamingZipWriter(zip_file) as archive:
+                                        for i, (start, end) in enumerate(ranges):
+                                            _add_split(archive, pdf, range(start, end + 1), f"split_{i+1}.pdf")
                                     
                                     # 提供下載
-                                    with open(zip_file, "rb") as f:
-                                        zip_bytes = f.read()
-                                    
-                                    b64_zip = base64.b64encode(zip_bytes).decode()
-                                    href = f'<a href="data:application/zip;base64,{b64_zip}" download="split_files.zip" class="download-button">下載分割後的PDF文件</a>'
-                                    st.markdown(href, unsafe_allow_html=True)
+                                    offer_download(zip_file, "split_files.zip", "下載分割後的PDF文件", mime="application/zip")
                                     
-                                    st.success(f"成功創建 {len(output_files)} 個分割文件")
+                                    st.success(f"成功創建 {archive.count} 個分割文件")
                             except Exception as e:
                                 st.error(f"處理過程中出錯: {str(e)}")
                     
@@ -171,76 +158,34 @@ def pdf_split_page():
                         
                         if st.button("分割PDF"):
                             with st.spinner("正在分割PDF..."):
-                                # 創建分割文件目錄
-                                split_dir = os.path.join(tmpdirname, "split")
-                                os.makedirs(split_dir, exist_ok=True)
-                                
                                 # 計算需要創建的文件數
                                 num_output_files = (total_pages + pages_per_doc - 1) // pages_per_doc
                                 
-                                # 分割PDF
-                                output_files = []
-                                for i in range(num_output_files):
-                                    output = PdfWriter()
-                                    start_page = i * pages_per_doc
-                                    end_page = min(start_page + pages_per_doc, total_pages)
-                                    
-                                    for page_num in range(start_page, end_page):
-                                        output.add_page(pdf.pages[page_num])
-                                    
-                                    output_file = os.path.join(split_dir, f"split_{i+1}.pdf")
-                                    with open(output_file, "wb") as f:
-                                        output.write(f)
-                                    output_files.append(output_file)
-                                
-                                # 創建ZIP文件
+                                # 分割PDF，每個文件生成後立即加入ZIP
                                 zip_file = os.path.join(tmpdirname, "split_files.zip")
-                                with zipfile.ZipFile(zip_file, 'w') as zipf:
-                                    for file in output_files:
-                                        zipf.write(file, os.path.basename(file))
+                                with StreamingZipWriter(zip_file) as archive:
+                                    for i in range(num_output_files):
+                                        start_page = i * pages_per_doc
+                                        end_page = min(start_page + pages_per_doc, total_pages)
+                                        _add_split(archive, pdf, range(start_page, end_page), f"split_{i+1}.pdf")
                                 
                                 # 提供下載
-                                with open(zip_file, "rb") as f:
-                                    zip_bytes = f.read()
-                                
-                                b64_zip = base64.b64encode(zip_bytes).decode()
-                                href = f'<a href="data:application/zip;base64,{b64_zip}" download="split_files.zip" class="download-button">下載分割後的PDF文件</a>'
-                                st.markdown(href, unsafe_allow_html=True)
+                                offer_download(zip_file, "split_files.zip", "下載分割後的PDF文件", mime="application/zip")
                                 
-                                st.success(f"成功創建 {len(output_files)} 個分割文件")
+                                st.success(f"成功創建 {archive.count} 個分割文件")
                     
                     # 每頁分割為單獨文件
                     else:  # "每頁分割為單獨文件"
                         if st.button("分割PDF"):
                             with st.spinner("正在分割PDF..."):
-                                # 創建分割文件目錄
-                                split_dir = os.path.join(tmpdirname, "split")
-                                os.makedirs(split_dir, exist_ok=True)
-                                
-                                # 分割PDF，每頁一個文件
-                                output_files = []
-                                for page_num in range(total_pages):
-                                    output = PdfWriter()
-                                    output.add_page(pdf.pages[page_num])
-                                    
-                                    output_file = os.path.join(split_dir, f"page_{page_num+1}.pdf")
-                                    with open(output_file, "wb") as f:
-                                        output.write(f)
-                                    output_files.append(output_file)
-                                
-                                # 創建ZIP文件
+                                # 分割PDF，每頁一個文件，生成後立即加入ZIP
                                 zip_file = os.path.join(tmpdirname, "split_files.zip")
-                                with zipfile.ZipFile(zip_file, 'w') as zipf:
-                                    for file in output_files:
-                                        zipf.write(file, os.path.basename(file))
+                                with StreamingZipWriter(zip_file) as archive:
+                                    for page_num in range(total_pages):
+                                        _add_split(archive, pdf, [page_num], f"page_{page_num+1}.pdf")
                                 
                                 # 提供下載
-                                with open(zip_file, "rb") as f:
-                                    zip_bytes = f.read()
-                                
-                                b64_zip = base64.b64encode(zip_bytes).decode()
-                                href = f'<a href="data:application/zip;base64,{b64_zip}" download="split_files.zip" class="download-button">下載分割後的PDF文件</a>'
-                                st.markdown(href, unsafe_allow_html=True)
+                                offer_download(zip_file, "split_files.zip", "下載分割後的PDF文件", mime="application/zip")
                                 
                                 st.success(f"成功將PDF分割為 {total_pages} 個單頁文件")
                 except Exception as e:
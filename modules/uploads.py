@@ -0,0 +1,114 @@
+# 上傳文件處理模組：分塊把上傳內容寫入磁碟並同時計算哈希，Streamlit重新執行腳本時直接重用已保存的文件
+import os
+import mmap
+import time
+import hashlib
+import tempfile
+import streamlit as st
+from pdf_engine.result_cache import remember_sha256
+
+# 上傳文件保存目錄，可通過環境變量調整；文件以內容哈希命名，多個會話上傳同一文件時共用
+UPLOAD_DIR = os.environ.get("PDF_TOOLKIT_UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "pdf_toolkit_uploads")
+# 超過此時間未被使用的上傳文件會被清理（秒）
+UPLOAD_MAX_AGE = int(float(os.environ.get("PDF_TOOLKIT_UPLOAD_MAX_AGE_HOURS", "6")) * 3600)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_SESSION_KEY = "_ingested_uploads"
+_last_cleanup = [0.0]
+
+def _write_upload(uploaded_file, suffix, chunk_size):
+    """分塊寫入臨時文件並計算SHA-256，返回 (臨時文件路徑, 哈希)"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".tmp-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            uploaded_file.seek(0)
+            while True:
+                chunk = uploaded_file.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        uploaded_file.seek(0)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return temp_path, digest.hexdigest()
+
+def ingest_upload(uploaded_file, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    將Streamlit上傳的文件保存到磁碟並返回路徑
+
+    同一會話中同一個上傳文件（相同file_id）只寫入一次，之後的重新執行直接返回已保存的路徑。
+    返回的文件可能被多個會話共用，只能讀取，不要在原地修改或刪除
+
+    參數:
+    uploaded_file (UploadedFile): st.file_uploader返回的文件
+    chunk_size (int): 每次寫入的位元組數
+
+    返回:
+    str: 已保存文件的路徑
+    """
+    memo = st.session_state.setdefault(_SESSION_KEY, {})
+    file_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    saved = memo.get(file_id)
+    if saved and os.path.exists(saved[0]):
+        _touch(saved[0])
+        # 更新修改時間後重新登記哈希，否則之後的快取鍵、縮圖和文字索引查找都要重新讀取整個文件
+        remember_sha256(saved[0], saved[1])
+        return saved[0]
+
+    suffix = os.path.splitext(uploaded_file.name)[1].lower() or ".bin"
+    temp_path, sha256 = _write_upload(uploaded_file, suffix, chunk_size)
+    path = os.path.join(UPLOAD_DIR, sha256 + suffix)
+    if os.path.exists(path):
+        # 其他會話已上傳過相同內容
+        os.remove(temp_path)
+        _touch(path)
+    else:
+        os.replace(temp_path, path)
+
+    remember_sha256(path, sha256)
+    memo[file_id] = (path, sha256)
+    cleanup_uploads()
+    return path
+
+def upload_sha256(path):
+    """返回ingest_upload保存過的文件的SHA-256，未知時返回None"""
+    for saved_path, sha256 in st.session_state.get(_SESSION_KEY, {}).values():
+        if saved_path == path:
+            return sha256
+    return None
+
+def open_upload_mmap(path):
+    """以唯讀記憶體映射方式打開文件，適合需要隨機讀取但不想整個載入記憶體的處理"""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def cleanup_uploads(max_age=UPLOAD_MAX_AGE, min_interval=600):
+    """刪除長時間未使用的上傳文件和中斷的寫入，每個進程最多每min_interval秒執行一次"""
+    now = time.time()
+    if now - _last_cleanup[0] < min_interval:
+        return
+    _last_cleanup[0] = now
+    try:
+        entries = list(os.scandir(UPLOAD_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+        except OSError:
+            # Windows上正被使用的文件無法刪除，下次再試
+            continue
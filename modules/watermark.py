@@ -1,66 +1,15 @@
 import streamlit as st
 import os
 import tempfile
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.colors import Color
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import base64
-from io import BytesIO
+from PyPDF2 import PdfReader
 from PIL import Image
-import numpy as np
-import sys
-
-# 註冊中文字體
-def register_fonts():
-    # 註冊內置中文字體(用於支持中文水印)
-    font_path = None
-    
-    # 根據不同操作系統查找合適的中文字體
-    if sys.platform.startswith('win'):
-        # Windows 系統字體路徑
-        possible_fonts = [
-            "C:\\Windows\\Fonts\\mingliu.ttc",
-            "C:\\Windows\\Fonts\\msjh.ttc",
-            "C:\\Windows\\Fonts\\simsun.ttc",
-            "C:\\Windows\\Fonts\\simhei.ttf"
-        ]
-    elif sys.platform.startswith('darwin'):
-        # macOS 系統字體路徑
-        possible_fonts = [
-            "/System/Library/Fonts/PingFang.ttc",
-            "/Library/Fonts/Microsoft/PMingLiU.ttf",
-            "/Library/Fonts/Microsoft/SimHei.ttf"
-        ]
-    else:
-        # Linux 系統字體路徑
-        possible_fonts = [
-            "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
-            "/usr/share/fonts/truetype/arphic/uming.ttc",
-            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc"
-        ]
-    
-    # 檢查字體文件是否存在並註冊第一個找到的字體
-    for font_file in possible_fonts:
-        if os.path.exists(font_file):
-            font_path = font_file
-            break
-    
-    # 如果找到系統字體，註冊它
-    if font_path:
-        try:
-            pdfmetrics.registerFont(TTFont("ChineseFont", font_path))
-            return "ChineseFont"
-        except:
-            pass
-    
-    # 如果找不到系統字體，返回默認字體
-    return "Helvetica"
-
-# 获取默认中文字体
-DEFAULT_CHINESE_FONT = register_fonts()
+from modules.uploads import ingest_upload
+from modules.downloads import offer_download
+# 水印的生成和疊加由pdf_engine處理，本模組只負責頁面
+from pdf_engine.watermark import (
+    DEFAULT_CHINESE_FONT,
+    create_text_watermark, create_image_watermark, add_watermark_to_pdf
+)
 
 def pdf_watermark_page():
     st.header("🖊️ PDF水印")
@@ -71,10 +20,8 @@ def pdf_watermark_page():
     
     if uploaded_file is not None:
         with tempfile.TemporaryDirectory() as tmpdirname:
-            # 保存上傳的文件
-            temp_file = os.path.join(tmpdirname, uploaded_file.name)
-            with open(temp_file, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # 保存上傳的文件（分塊寫入磁碟，重新執行時重用已保存的文件）
+            temp_file = ingest_upload(uploaded_file)
             
             # 先檢查PDF是否加密
             try:
@@ -267,9 +214,7 @@ def pdf_watermark_page():
                                         )
                                     else:
                                         # 創建圖片水印
-                                        image_path = os.path.join(tmpdirname, "watermark_image")
-                                        with open(image_path, "wb") as f:
-                                            f.write(uploaded_image.getbuffer())
+                                        image_path = ingest_upload(uploaded_image)
                                         
                                         create_image_watermark(
                                             watermark_file,
@@ -281,21 +226,19 @@ def pdf_watermark_page():
                                     
                                     # 應用水印
                                     output_file = os.path.join(tmpdirname, f"watermarked_{uploaded_file.name}")
-                                    add_watermark_to_pdf(temp_file, watermark_file, output_file, pages_to_watermark, password)
+                                    result = add_watermark_to_pdf(temp_file, watermark_file, output_file, pages_to_watermark, password)
                                     
-                                    # 提供下載
-                                    with open(output_file, "rb") as f:
-                                        pdf_bytes = f.read()
-                                    
-                                    b64_pdf = base64.b64encode(pdf_bytes).decode()
-                                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="watermarked_{uploaded_file.name}" class="download-button">下載添加水印的PDF</a>'
-                                    st.markdown(href, unsafe_allow_html=True)
-                                    
-                                    # 成功消息
-                                    if len(pages_to_watermark) == total_pages:
-                                        st.success(f"已成功為所有 {total_pages} 頁添加水印！")
+                                    if result["success"]:
+                                        # 提供下載
+                                        offer_download(result["output_file"], f"watermarked_{uploaded_file.name}", "下載添加水印的PDF")
+                                        
+                                        # 成功消息
+                                        if result["pages"] == total_pages:
+                                            st.success(f"已成功為所有 {total_pages} 頁添加水印！")
+                                        else:
+                                            st.success(f"已成功為 {result['pages']} 頁添加水印！")
                                     else:
-                                        st.success(f"已成功為 {len(pages_to_watermark)} 頁添加水印！")
+                                        st.error(result["error"])
                                 
                                 except Exception as e:
                                     st.error(f"添加水印時出錯: {str(e)}")
@@ -331,86 +274,3 @@ def pdf_watermark_page():
         - 添加公司標誌或品牌元素
         - 標示文檔的狀態（如"草稿"、"待審核"等）
         """)
-
-# 創建文字水印
-def create_text_watermark(output_file, text, font_size, color, angle, x_gap, y_gap, font_name="Helvetica"):
-    c = canvas.Canvas(output_file, pagesize=A4)
-    width, height = A4
-    
-    # 設置透明度和顏色
-    r, g, b, alpha = color
-    c.setFillColorRGB(r, g, b, alpha=alpha)
-    
-    # 設置字體和大小
-    c.setFont(font_name, font_size)
-    
-    # 在整個頁面上重複添加文字
-    for y in range(0, int(height), y_gap):
-        for x in range(0, int(width), x_gap):
-            c.saveState()
-            c.translate(x, y)
-            c.rotate(angle)
-            c.drawString(0, 0, text)
-            c.restoreState()
-    
-    c.save()
-
-# 創建圖片水印
-def create_image_watermark(output_file, image_path, opacity, size_percent, position):
-    c = canvas.Canvas(output_file, pagesize=A4)
-    width, height = A4
-    
-    # 加載圖片並計算大小
-    img = Image.open(image_path)
-    img_width, img_height = img.size
-    
-    # 計算水印大小（根據頁面寬度的百分比）
-    new_width = width * size_percent / 100
-    new_height = img_height * (new_width / img_width)
-    
-    # 計算位置
-    if position == "居中":
-        x = (width - new_width) / 2
-        y = (height - new_height) / 2
-    elif position == "左上角":
-        x = 20
-        y = height - new_height - 20
-    elif position == "右上角":
-        x = width - new_width - 20
-        y = height - new_height - 20
-    elif position == "左下角":
-        x = 20
-        y = 20
-    else:  # 右下角
-        x = width - new_width - 20
-        y = 20
-    
-    # 繪製圖片
-    c.drawImage(image_path, x, y, width=new_width, height=new_height, mask='auto', alpha=opacity)
-    c.save()
-
-# 將水印應用到PDF
-def add_watermark_to_pdf(input_pdf, watermark_pdf, output_pdf, pages_to_watermark, password=None):
-    # 讀取輸入PDF
-    reader = PdfReader(input_pdf)
-    
-    # 如果文件已加密且提供了密碼，嘗試解密
-    if reader.is_encrypted and password:
-        reader.decrypt(password)
-        
-    watermark = PdfReader(watermark_pdf)
-    watermark_page = watermark.pages[0]
-    
-    # 創建輸出PDF
-    writer = PdfWriter()
-    
-    # 處理每一頁
-    for i, page in enumerate(reader.pages):
-        if i in pages_to_watermark:
-            # 將水印疊加到頁面上
-            page.merge_page(watermark_page)
-        writer.add_page(page)
-    
-    # 保存輸出PDF
-    with open(output_pdf, "wb") as f:
-        writer.write(f) 
\ No newline at end of file
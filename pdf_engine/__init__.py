@@ -0,0 +1,6 @@
+# PDF處理引擎：不依賴Streamlit的處理函數，返回結構化結果並通過回調報告進度
+# 網頁頁面（modules）、批量處理命令和工作進程都調用這裡的函數
+from pdf_engine.results import make_result
+from pdf_engine.compress import COMPRESSION_PRESETS, compress_pdf, compress_to_target, pikepdf_optimize
+from pdf_engine.watermark import create_text_watermark, create_image_watermark, add_watermark_to_pdf
+from pdf_engine.security import decrypt_pdf
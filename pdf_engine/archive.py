@@ -0,0 +1,69 @@
+# 流式ZIP寫入：每產生一個文件就立即加入壓縮檔，不必等全部完成，也不必先把所有結果保留在磁碟或記憶體中
+import os
+import time
+import zipfile
+
+# 本身已經壓縮過的格式直接存儲（STORED），再次deflate幾乎不會變小，只會浪費CPU
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".pdf", ".zip", ".gif", ".webp", ".gz", ".7z"}
+
+def zip_compress_type(name):
+    """按文件擴展名選擇ZIP壓縮方式"""
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+class StreamingZipWriter:
+    """
+    逐個加入文件的ZIP寫入器
+
+    用法:
+    with StreamingZipWriter(zip_path) as archive:
+        for path in produce_files():
+            archive.add_file(path, remove=True)
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.count = 0
+        self._zip = zipfile.ZipFile(output_path, "w", allowZip64=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_file(self, path, arcname=None, remove=False):
+        """
+        把磁碟上的文件加入壓縮檔
+
+        參數:
+        path (str): 文件路徑
+        arcname (str): 壓縮檔中的名稱，默認為文件名
+        remove (bool): 加入後刪除原文件，中間文件不會在磁碟上累積
+        """
+        arcname = arcname or os.path.basename(path)
+        self._zip.write(path, arcname, compress_type=zip_compress_type(arcname))
+        self.count += 1
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def add_bytes(self, arcname, data):
+        """把記憶體中的內容加入壓縮檔"""
+        self._zip.writestr(arcname, data, compress_type=zip_compress_type(arcname))
+        self.count += 1
+
+    def open(self, arcname):
+        """
+        返回可寫入的文件對象，內容邊寫入邊壓縮（只支持順序寫入，不支持seek/tell）
+        """
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = zip_compress_type(arcname)
+        self.count += 1
+        return self._zip.open(info, "w", force_zip64=True)
+
+    def close(self):
+        self._zip.close()
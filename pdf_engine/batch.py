@@ -0,0 +1,322 @@
+# 批量壓縮命令行工具：不經過Streamlit，直接使用pdf_engine的compress_pdf / compress_to_target處理大量PDF
+#
+# 用法示例:
+#   python -m pdf_engine.batch batch ./archive --output-dir ./compressed --preset 中度
+#   python -m pdf_engine.batch batch files.txt --target-mb 2 --workers 8 --log run.jsonl
+#
+# 每個文件處理完成後立即在JSON Lines日誌中寫入一行結果；中斷後以相同參數重新執行，
+# 已成功、輸入未改變且壓縮參數相同的文件會被跳過
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf_engine.compress import COMPRESSION_PRESETS, compress_pdf, compress_to_target
+from pdf_engine.gs_backend import set_pool_size
+from pdf_engine import result_cache
+
+# 預設名稱的英文別名，方便在腳本中使用
+PRESET_ALIASES = {"light": "輕度", "medium": "中度", "strong": "強力", "extreme": "極限"}
+
+def collect_inputs(source, recursive=False):
+    """
+    收集要處理的PDF文件
+
+    參數:
+    source (str): 目錄，或每行一個路徑的清單文件（#開頭的行為註釋）
+    recursive (bool): 處理目錄時是否包含子目錄
+
+    返回:
+    tuple: (文件路徑列表, 計算輸出相對路徑時使用的根目錄)
+    """
+    if os.path.isdir(source):
+        root = os.path.abspath(source)
+        files = []
+        if recursive:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.lower().endswith(".pdf"):
+                        files.append(os.path.join(dirpath, name))
+        else:
+            for name in sorted(os.listdir(root)):
+                path = os.path.join(root, name)
+                if name.lower().endswith(".pdf") and os.path.isfile(path):
+                    files.append(path)
+        return files, root
+
+    base = os.path.dirname(os.path.abspath(source))
+    files = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                files.append(os.path.abspath(os.path.join(base, line)))
+    root = os.path.commonpath(files) if files else base
+    if os.path.isfile(root):
+        root = os.path.dirname(root)
+    return files, root
+
+def output_path_for(input_file, root, output_dir, suffix):
+    """按輸入文件相對於根目錄的位置生成輸出路徑"""
+    relative = os.path.relpath(input_file, root)
+    stem, ext = os.path.splitext(relative)
+    return os.path.join(output_dir, stem + suffix + (ext or ".pdf"))
+
+def load_completed(log_file):
+    """
+    讀取已有的結果日誌，返回 {輸入路徑: 最後一條成功記錄}
+
+    只要日誌中有同一輸入的更新記錄（例如後來失敗），以最後一條為準
+    """
+    completed = {}
+    if not log_file or not os.path.exists(log_file):
+        return completed
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 上次中斷時可能留下寫了一半的行
+                continue
+            if record.get("status") == "ok":
+                completed[record["input"]] = record
+            else:
+                completed.pop(record.get("input"), None)
+    return completed
+
+def job_params(job):
+    """返回會影響輸出的作業參數，寫入日誌並在續跑時比較"""
+    return {key: job[key] for key in ("mode", "preset", "target_mb", "max_attempts", "strategy", "use_sampling")
+            if key in job}
+
+def _is_done(record, job):
+    """判斷上次的成功記錄是否仍然有效：輸出路徑和壓縮參數相同、輸出存在且輸入未被修改"""
+    try:
+        stat = os.stat(job["input"])
+    except OSError:
+        return False
+    return (
+        record.get("output") == job["output"]
+        and record.get("params") == job_params(job)
+        and os.path.exists(record["output"])
+        and record.get("input_bytes") == stat.st_size
+        and record.get("input_mtime") == int(stat.st_mtime)
+    )
+
+def compress_one(job):
+    """
+    在工作進程中壓縮一個文件
+
+    參數:
+    job (dict): input、output、mode（preset或target）及對應參數
+
+    返回:
+    dict: 寫入日誌的結果記錄
+    """
+
+    input_file = job["input"]
+    output_file = job["output"]
+    record = {
+        "input": input_file,
+        "output": output_file,
+        "mode": job["mode"],
+        "params": job_params(job),
+    }
+    started = time.time()
+    try:
+        # 清單中的文件可能不存在或無法讀取，記錄為該文件失敗
+        stat = os.stat(input_file)
+        record["input_bytes"] = stat.st_size
+        record["input_mtime"] = int(stat.st_mtime)
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix="pdf_batch_") as temp_dir:
+            temp_output = os.path.join(temp_dir, "output.pdf")
+            if job["mode"] == "target":
+                record["target_mb"] = job["target_mb"]
+                result = compress_to_target(
+                    input_file, temp_dir, job["target_mb"], job["max_attempts"],
+                    strategy=job["strategy"], max_workers=1, use_sampling=job["use_sampling"],
+                    # 已在文件之間並行，不再對單個文件分段
+                    allow_sharding=False
+                )
+            else:
+                preset = COMPRESSION_PRESETS[job["preset"]]
+                record["preset"] = job["preset"]
+                result = compress_pdf(
+                    input_file,
+                    temp_output,
+                    dpi=preset["dpi"],
+                    image_quality=preset["image_quality"],
+                    color_mode=preset["color_mode"],
+                    remove_metadata=preset["metadata"],
+                    flatten_forms=False,
+                    remove_bookmarks=False,
+                    optimize_fonts=True,
+                    pdf_version="1.4",
+                    remove_unused=True,
+                    use_cache=job["use_cache"],
+                    # 已在文件之間並行，不再對單個文件分段
+                    allow_sharding=False
+                )
+
+            if result["warnings"]:
+                record["warnings"] = result["warnings"]
+            if not result["success"] or result["output_bytes"] == 0:
+                raise RuntimeError(result["error"] or "沒有生成輸出文件")
+
+            # 先複製到目標目錄的臨時文件再替換，中斷時不會留下不完整的輸出
+            partial = output_file + ".partial"
+            shutil.copyfile(result["output_file"], partial)
+            os.replace(partial, output_file)
+
+        record["output_bytes"] = os.path.getsize(output_file)
+        record["ratio"] = round(1 - record["output_bytes"] / stat.st_size, 4) if stat.st_size else 0
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["traceback"] = traceback.format_exc(limit=5)
+    return _finish_record(record, started)
+
+def _finish_record(record, started):
+    record["seconds"] = round(time.time() - started, 3)
+    record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return record
+
+def _init_worker(use_cache):
+    # 工作進程之間已經並行，每個進程只需要一個Ghostscript實例
+    # （gs_backend在父進程導入時已讀取環境變量，必須直接設置）
+    set_pool_size(1)
+    # 批量處理默認不使用共用的結果快取，避免大量輸出擠掉互動會話的快取項
+    # （目標大小模式的各次嘗試也經由compress_pdf寫入快取，因此在進程層面關閉）
+    if not use_cache:
+        result_cache.CACHE_ENABLED = False
+
+def run_batch(args):
+    """執行batch子命令，返回退出碼"""
+    files, root = collect_inputs(args.source, args.recursive)
+    if not files:
+        print("沒有找到PDF文件", file=sys.stderr)
+        return 1
+
+    output_dir = os.path.abspath(args.output_dir or os.path.join(root, "compressed"))
+    log_file = args.log or os.path.join(output_dir, "batch_results.jsonl")
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+
+    # 不處理輸出目錄中的文件（輸出目錄位於輸入目錄內時）
+    files = [f for f in files if not os.path.abspath(f).startswith(output_dir + os.sep)]
+
+    completed = {} if args.no_resume else load_completed(log_file)
+    jobs = []
+    skipped = 0
+    for input_file in files:
+        job = {
+            "input": input_file,
+            "output": output_path_for(input_file, root, output_dir, args.suffix),
+            "mode": "target" if args.target_mb is not None else "preset",
+            "use_cache": args.use_cache,
+        }
+        if args.target_mb is not None:
+            job.update({
+                "target_mb": args.target_mb,
+                "max_attempts": args.max_attempts,
+                "strategy": args.strategy,
+                "use_sampling": not args.no_sampling,
+            })
+        else:
+            job["preset"] = PRESET_ALIASES.get(args.preset, args.preset)
+        record = completed.get(input_file)
+        if record is not None and _is_done(record, job):
+            skipped += 1
+            continue
+        jobs.append(job)
+
+    print(f"共 {len(files)} 個文件，跳過已完成 {skipped} 個，待處理 {len(jobs)} 個，使用 {args.workers} 個進程", file=sys.stderr)
+    if not jobs:
+        return 0
+
+    failed = 0
+    done = 0
+    saved_bytes = 0
+    started = time.time()
+    executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                   initargs=(args.use_cache,))
+    try:
+        futures = {executor.submit(compress_one, job): job for job in jobs}
+        with open(log_file, "a", encoding="utf-8") as log:
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # 工作進程異常退出等compress_one本身無法記錄的錯誤，只算作這個文件失敗
+                    job = futures[future]
+                    record = _finish_record({
+                        "input": job["input"],
+                        "output": job["output"],
+                        "mode": job["mode"],
+                        "params": job_params(job),
+                        "status": "failed",
+                        "error": f"{type(e).__name__}: {e}",
+                    }, time.time())
+                log.write(json.dumps(record, ensure_ascii=False) + "\n")
+                log.flush()
+                done += 1
+                name = os.path.relpath(record["input"], root)
+                if record["status"] == "ok":
+                    saved_bytes += record["input_bytes"] - record["output_bytes"]
+                    print(f"[{done}/{len(jobs)}] ok {name} "
+                          f"{record['input_bytes'] / 1048576:.2f}MB -> {record['output_bytes'] / 1048576:.2f}MB "
+                          f"({record['seconds']:.1f}s)", file=sys.stderr)
+                else:
+                    failed += 1
+                    print(f"[{done}/{len(jobs)}] failed {name}: {record['error']}", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("已中斷，已完成的結果已寫入日誌，重新執行相同命令即可繼續", file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    executor.shutdown()
+
+    elapsed = time.time() - started
+    print(f"完成 {done - failed} 個，失敗 {failed} 個，節省 {saved_bytes / 1048576:.1f}MB，"
+          f"耗時 {elapsed:.1f}s，日誌: {log_file}", file=sys.stderr)
+    return 1 if failed else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m pdf_engine.batch", description="PDF壓縮命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="批量壓縮目錄或清單中的PDF文件")
+    batch.add_argument("source", help="包含PDF的目錄，或每行一個路徑的清單文件")
+    batch.add_argument("--output-dir", help="輸出目錄，默認為輸入目錄下的compressed")
+    batch.add_argument("--suffix", default="", help="輸出文件名後綴，例如 _compressed")
+    batch.add_argument("--recursive", action="store_true", help="包含子目錄")
+    batch.add_argument("--preset", default="中度",
+                       choices=list(COMPRESSION_PRESETS) + list(PRESET_ALIASES),
+                       help="標準壓縮預設（默認: 中度）")
+    batch.add_argument("--target-mb", type=float, help="目標大小壓縮，指定後忽略--preset")
+    batch.add_argument("--strategy", default="model", choices=["model", "parallel", "sequential"],
+                       help="目標大小的搜索策略")
+    batch.add_argument("--max-attempts", type=int, default=6, help="目標大小模式的最大嘗試次數")
+    batch.add_argument("--no-sampling", action="store_true", help="目標大小模式不使用抽樣估算")
+    batch.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並行處理的進程數")
+    batch.add_argument("--log", help="JSON Lines結果日誌，默認為輸出目錄下的batch_results.jsonl")
+    batch.add_argument("--use-cache", action="store_true", help="讀寫與互動界面共用的結果快取（默認不使用）")
+    batch.add_argument("--no-resume", action="store_true", help="忽略已有日誌，重新處理所有文件")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        if args.target_mb is not None and args.target_mb <= 0:
+            parser.error("--target-mb 必須大於0")
+        return run_batch(args)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
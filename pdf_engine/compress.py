@@ -0,0 +1,821 @@
+# PDF壓縮引擎：標準壓縮、目標大小壓縮和pikepdf優化
+# 本模組不依賴Streamlit，可以在工作進程、線程池或命令行中調用；結果以字典返回，進度通過回調報告
+import os
+import time
+import math
+import shutil
+import tempfile
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pikepdf
+from pikepdf import Pdf
+
+from pdf_engine.results import make_result, report_progress
+from pdf_engine.result_cache import make_cache_key, cache_get, cache_put
+from pdf_engine.sampling import SAMPLE_MIN_PAGES, plan_sample, build_sample_pdf, extrapolate_by_weight
+from pdf_engine.gs_backend import (
+    GHOSTSCRIPT_PATH, GHOSTSCRIPT_AVAILABLE,
+    GhostscriptCancelled, run_ghostscript, ghostscript_identity, pool_size
+)
+from pdf_engine.sharding import plan_shards, split_pdf, stitch_pdfs
+
+logger = logging.getLogger(__name__)
+
+# 標準壓縮的預設參數，網頁界面和批量處理命令共用
+COMPRESSION_PRESETS = {
+    "輕度": {"dpi": 150, "image_quality": "/default", "color_mode": "Color", "metadata": False},
+    "中度": {"dpi": 120, "image_quality": "/ebook", "color_mode": "Color", "metadata": True},
+    "強力": {"dpi": 90, "image_quality": "/printer", "color_mode": "Color", "metadata": True},
+    "極限": {"dpi": 72, "image_quality": "/screen", "color_mode": "Gray", "metadata": True}
+}
+
+# 目標大小壓縮函數
+def compress_to_target(input_file, temp_dir, target_size_mb, max_attempts, total_pages=None,
+                       strategy="model", max_workers=None, use_sampling=True, progress_callback=None,
+                       allow_sharding=True):
+    """
+    通過多次嘗試接近目標大小的壓縮方法，只調整DPI和壓縮品質，保留原始顏色
+    
+    參數:
+    input_file (str): 輸入文件路徑
+    temp_dir (str): 存放各次嘗試結果的目錄，最佳結果也保存在此目錄中
+    target_size_mb (float): 目標大小（MB）
+    max_attempts (int): 最多嘗試次數
+    total_pages (int): 頁數，未提供時自動讀取
+    strategy (str): "sequential" 逐一嘗試；"parallel" 同時執行多個嘗試，找到達標結果後取消其餘嘗試；
+                    "model" 根據已完成的嘗試預測下一組設置
+    max_workers (int): 並行模式下同時執行的Ghostscript進程數，默認為CPU核心數
+    use_sampling (bool): 頁數較多時先在抽樣頁面上搜索參數，再壓縮整份文檔一到兩次
+    progress_callback (callable): 可選，progress_callback(進度0~1或None, 文字或None)
+    allow_sharding (bool): 大型文檔的各次嘗試是否分段並行處理；調用者已在文件之間並行時應設為False
+    
+    返回:
+    dict: make_result的結果，另含 target_mb、size_mb、reached、sampled、seconds
+    """
+    started = time.time()
+    if total_pages is None:
+        with pikepdf.open(input_file) as pdf:
+            total_pages = len(pdf.pages)
+    
+    def search(search_input, search_target_mb, size_scale):
+        if strategy == "model":
+            return _model_target_search(
+                search_input, temp_dir, search_target_mb, max_attempts,
+                progress_callback, size_scale, allow_sharding
+            )
+        attempts_list = _grid_attempts(input_file, target_size_mb, max_attempts)
+        if strategy == "parallel" and len(attempts_list) > 1:
+            return _parallel_target_search(
+                search_input, temp_dir, search_target_mb, attempts_list,
+                max_workers, progress_callback, size_scale
+            )
+        return _sequential_target_search(
+            search_input, temp_dir, search_target_mb, attempts_list,
+            progress_callback, size_scale, allow_sharding
+        )
+    
+    plan = None
+    if use_sampling and total_pages >= SAMPLE_MIN_PAGES:
+        try:
+            plan = plan_sample(input_file)
+            sample_file = build_sample_pdf(input_file, plan["pages"], os.path.join(temp_dir, "sample_input.pdf"))
+        except Exception:
+            plan = None
+    
+    try:
+        if plan is None:
+            best_file, _, _ = search(input_file, target_size_mb, 1.0)
+        else:
+            best_file = _sampled_target_search(
+                input_file, sample_file, plan, temp_dir, target_size_mb,
+                search, progress_callback, allow_sharding
+            )
+        error = None
+    except Exception as e:
+        best_file, error = None, str(e)
+    
+    size_mb = os.path.getsize(best_file) / (1024 * 1024) if best_file and os.path.exists(best_file) else None
+    reached = size_mb is not None and _is_target_reached(size_mb, target_size_mb)
+    warnings = []
+    if size_mb is not None and not reached:
+        warnings.append(f"未能達到目標大小，最接近的結果為 {size_mb:.2f}MB")
+    return make_result(
+        best_file, error, warnings,
+        target_mb=target_size_mb,
+        size_mb=size_mb,
+        reached=reached,
+        sampled=plan is not None,
+        seconds=round(time.time() - started, 3)
+    )
+
+# 在抽樣頁面上搜索參數，再壓縮整份文檔
+def _sampled_target_search(input_file, sample_file, plan, temp_dir, target_size_mb, search, progress_callback,
+                           allow_sharding=True):
+    """
+    先在樣本文件上搜索（大小按權重推算到整份文檔），再用選出的參數壓縮整份文檔。
+    
+    若整份文檔的實際大小未達標，用實際大小與推算大小的比例校正目標後再搜索一次，
+    因此整份文檔最多只壓縮兩次。
+    """
+    size_scale = extrapolate_by_weight(plan, 1.0)
+    search_target_mb = target_size_mb
+    full_results = []
+    
+    for round_index in range(2):
+        sample_result, settings, estimated_mb = search(sample_file, search_target_mb, size_scale)
+        if sample_result and os.path.exists(sample_result):
+            try:
+                os.remove(sample_result)
+            except:
+                pass
+        if settings is None or any(r[0:2] == settings[0:2] for r in full_results):
+            # 校正後選出的參數與上一輪相同，無需再壓縮整份文檔
+            break
+        
+        dpi, quality, downsample_images = settings
+        report_progress(progress_callback, None, f"以抽樣結果壓縮整份文檔: DPI={dpi}, 質量={quality}（預估 {estimated_mb:.2f}MB）")
+        full_output = os.path.join(temp_dir, f"full_attempt_{round_index + 1}.pdf")
+        processed_file = _target_attempt(input_file, full_output, dpi, quality, downsample_images=downsample_images,
+                                         allow_sharding=allow_sharding)
+        if not processed_file or not os.path.exists(processed_file):
+            break
+        
+        actual_mb = os.path.getsize(processed_file) / (1024 * 1024)
+        full_results.append((dpi, quality, actual_mb, processed_file))
+        if _is_target_reached(actual_mb, target_size_mb) or estimated_mb <= 0:
+            break
+        
+        # 用實際與預估的偏差校正下一輪的搜索目標
+        search_target_mb = target_size_mb * estimated_mb / actual_mb
+    
+    best = _pick_best_result(full_results, target_size_mb)
+    for result in full_results:
+        if result is not best and os.path.exists(result[3]):
+            try:
+                os.remove(result[3])
+            except:
+                pass
+    return best[3] if best else None
+
+# 根據目標壓縮率生成網格搜索的嘗試列表
+def _grid_attempts(input_file, target_size_mb, max_attempts):
+    # 根據頁數和目標壓縮率確定DPI值範圍
+    file_size_mb = os.path.getsize(input_file) / (1024 * 1024)
+    compression_ratio = ((file_size_mb - target_size_mb) / file_size_mb) * 100
+    
+    # 確保壓縮率是正數
+    compression_ratio = max(0, compression_ratio)
+    
+    # 根據目標壓縮率選擇合適的DPI範圍
+    if compression_ratio > 80:  # 極度壓縮
+        dpi_values = [72, 60, 50, 40, 30]
+    elif compression_ratio > 60:  # 高度壓縮
+        dpi_values = [90, 80, 72, 60, 50]
+    elif compression_ratio > 40:  # 中度壓縮
+        dpi_values = [110, 100, 90, 80, 72]
+    elif compression_ratio > 20:  # 輕度壓縮
+        dpi_values = [130, 120, 110, 100, 90]
+    else:  # 微度壓縮
+        dpi_values = [150, 140, 130, 120, 110]
+    
+    # 壓縮品質選項
+    quality_values = ["/default", "/ebook", "/printer", "/screen"]
+    
+    # 生成嘗試列表，只使用彩色模式
+    attempts_list = []
+    for dpi in dpi_values:
+        for quality in quality_values:
+            attempts_list.append((dpi, quality, "Color"))
+    
+    # 限制嘗試次數
+    return attempts_list[:max_attempts]
+
+# 判斷嘗試結果是否已足夠接近目標大小
+def _is_target_reached(size_mb, target_size_mb):
+    return abs(size_mb - target_size_mb) < 0.05 or size_mb <= target_size_mb
+
+# 目標大小壓縮使用的統一參數（只調整DPI和品質），返回輸出文件或None
+def _target_attempt(input_file, output_file, dpi, quality, cancel_event=None, downsample_images=False,
+                    allow_sharding=True):
+    result = compress_pdf(
+        input_file, 
+        output_file, 
+        dpi=dpi,
+        image_quality=quality,
+        color_mode="Color",  # 始終使用彩色模式
+        remove_metadata=True,
+        flatten_forms=True,
+        remove_bookmarks=True,
+        optimize_fonts=True,
+        pdf_version="1.4",  # 使用兼容性最好的版本
+        remove_unused=True,
+        cancel_event=cancel_event,
+        downsample_images=downsample_images,
+        allow_sharding=allow_sharding
+    )
+    for warning in result["warnings"]:
+        logger.warning(warning)
+    return result["output_file"]
+
+# 逐一嘗試各參數組合
+def _sequential_target_search(input_file, temp_dir, target_size_mb, attempts_list, progress_callback, size_scale=1.0,
+                              allow_sharding=True):
+    """返回 (最佳文件, (DPI, 品質, 是否重新採樣), 大小MB)，大小已乘以size_scale"""
+    best_file = None
+    best_settings = None
+    best_size_mb = None
+    best_diff = float('inf')
+    
+    # 創建一個專門用於測試的輸入文件副本
+    test_input_file = os.path.join(temp_dir, "test_input.pdf")
+    shutil.copy2(input_file, test_input_file)
+    
+    # 開始嘗試
+    for i, (dpi, quality, color) in enumerate(attempts_list):
+        # 更新進度
+        progress = (i + 1) / len(attempts_list)
+        report_progress(progress_callback, progress)
+        report_progress(progress_callback, None, f"嘗試設置組合 {i+1}/{len(attempts_list)}: DPI={dpi}, 質量={quality}")
+        
+        # 每次嘗試都使用唯一的輸出文件名
+        temp_output = os.path.join(temp_dir, f"attempt_{i+1}.pdf")
+        
+        # 處理文件
+        processed_file = _target_attempt(test_input_file, temp_output, dpi, quality, allow_sharding=allow_sharding)
+        
+        if processed_file and os.path.exists(processed_file):
+            # 計算與目標大小的差距
+            current_size_mb = os.path.getsize(processed_file) / (1024 * 1024) * size_scale
+            diff = abs(current_size_mb - target_size_mb)
+            
+            # 更新進度文本
+            report_progress(progress_callback, None, f"嘗試 {i+1}/{len(attempts_list)} - 當前大小: {current_size_mb:.2f}MB (目標: {target_size_mb:.2f}MB)")
+            
+            # 如果是最佳結果，保存它
+            if diff < best_diff:
+                best_diff = diff
+                if best_file and best_file != processed_file and os.path.exists(best_file):
+                    try:
+                        os.remove(best_file)  # 刪除之前的最佳文件
+                    except:
+                        pass
+                best_file = processed_file
+                best_settings = (dpi, quality, False)
+                best_size_mb = current_size_mb
+            
+            # 目標大小接近時提前退出
+            if _is_target_reached(current_size_mb, target_size_mb):
+                report_progress(progress_callback, None, f"✅ 已達到目標大小或足夠接近 - 實際大小: {current_size_mb:.2f}MB")
+                break
+    
+    # 清理測試文件
+    try:
+        if os.path.exists(test_input_file):
+            os.remove(test_input_file)
+    except:
+        pass
+    
+    return best_file, best_settings, best_size_mb
+
+# 並行嘗試各參數組合
+def _parallel_target_search(input_file, temp_dir, target_size_mb, attempts_list, max_workers, progress_callback, size_scale=1.0):
+    """
+    同時執行多個嘗試，進程數不超過CPU核心數。
+    
+    當某個嘗試達到目標時，取消排在它之後（質量更低）的所有嘗試，但仍等待排在它之前的嘗試完成，
+    因此最終結果與逐一嘗試模式一致，只是耗時更短。返回值與_sequential_target_search相同。
+    """
+    workers = max(1, min(len(attempts_list), max_workers or os.cpu_count() or 1))
+    cancel_events = [threading.Event() for _ in attempts_list]
+    
+    # 第一個達到目標的嘗試序號，其後的結果不再考慮
+    stop_index = len(attempts_list)
+    results = {}
+    finished = 0
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, (dpi, quality, color) in enumerate(attempts_list):
+            temp_output = os.path.join(temp_dir, f"attempt_{i+1}.pdf")
+            # 各嘗試已經並行執行，不再分段，以免Ghostscript進程數超過CPU核心數
+            future = executor.submit(_target_attempt, input_file, temp_output, dpi, quality, cancel_events[i],
+                                     allow_sharding=False)
+            futures[future] = i
+        
+        report_progress(progress_callback, None, f"正在並行嘗試 {len(attempts_list)} 組設置（{workers} 個進程）...")
+        
+        for future in as_completed(futures):
+            i = futures[future]
+            finished += 1
+            report_progress(progress_callback, finished / len(attempts_list))
+            
+            if future.cancelled():
+                continue
+            try:
+                processed_file = future.result()
+            except Exception:
+                processed_file = None
+            
+            if not processed_file or not os.path.exists(processed_file):
+                continue
+            
+            current_size_mb = os.path.getsize(processed_file) / (1024 * 1024) * size_scale
+            results[i] = (processed_file, current_size_mb)
+            dpi, quality, color = attempts_list[i]
+            report_progress(progress_callback, None, f"嘗試 {i+1}/{len(attempts_list)} (DPI={dpi}, 質量={quality}) - 大小: {current_size_mb:.2f}MB (目標: {target_size_mb:.2f}MB)")
+            
+            # 達到目標時取消所有排在後面的嘗試
+            if i < stop_index and _is_target_reached(current_size_mb, target_size_mb):
+                stop_index = i
+                for other_future, j in futures.items():
+                    if j > i:
+                        cancel_events[j].set()
+                        other_future.cancel()
+    
+    # 在有效結果中選擇最接近目標的文件，差距相同時優先選擇序號較小（質量較高）的
+    best_index = None
+    best_diff = float('inf')
+    for i in sorted(results):
+        if i > stop_index:
+            continue
+        diff = abs(results[i][1] - target_size_mb)
+        if diff < best_diff:
+            best_diff = diff
+            best_index = i
+    
+    # 刪除其他嘗試產生的文件
+    for i, (processed_file, _) in results.items():
+        if i != best_index and os.path.exists(processed_file):
+            try:
+                os.remove(processed_file)
+            except:
+                pass
+    
+    if best_index is None:
+        return None, None, None
+    
+    best_file, best_size_mb = results[best_index]
+    if _is_target_reached(best_size_mb, target_size_mb):
+        report_progress(progress_callback, None, f"✅ 已達到目標大小或足夠接近 - 實際大小: {best_size_mb:.2f}MB")
+    dpi, quality, color = attempts_list[best_index]
+    return best_file, (dpi, quality, False), best_size_mb
+
+# 模型預測搜索使用的品質階梯，由大到小排列
+MODEL_QUALITY_LADDER = ["/printer", "/ebook", "/screen"]
+MODEL_MIN_DPI = 30
+MODEL_MAX_DPI = 300
+# 沒有足夠數據擬合時假設的 log(大小)/log(DPI) 斜率，圖像像素數與DPI平方成正比，再扣除文字等固定部分
+MODEL_DEFAULT_SLOPE = 1.5
+
+def _predict_dpi(points, target_size_mb, default_slope=MODEL_DEFAULT_SLOPE):
+    """
+    根據同一品質下已測得的 (DPI, 大小) 點，以log-log線性插值預測達到目標大小所需的DPI
+    
+    參數:
+    points (list): [(dpi, size_mb), ...]
+    target_size_mb (float): 目標大小
+    
+    返回:
+    tuple: (預測的DPI（未取整、未限制範圍）, 使用的斜率)
+    """
+    log_target = math.log(target_size_mb)
+    # 以最接近目標的點作為錨點
+    ordered = sorted(points, key=lambda p: abs(math.log(p[1]) - log_target))
+    anchor_dpi, anchor_size = ordered[0]
+    
+    slope = default_slope
+    for other_dpi, other_size in ordered[1:]:
+        if other_dpi != anchor_dpi and other_size != anchor_size:
+            # 割線斜率，限制在合理範圍內避免噪聲導致的大幅跳躍
+            slope = (math.log(anchor_size) - math.log(other_size)) / (math.log(anchor_dpi) - math.log(other_dpi))
+            slope = min(2.5, max(0.2, slope))
+            break
+    
+    return anchor_dpi * math.exp((log_target - math.log(anchor_size)) / slope), slope
+
+def model_target_search(measure, target_size_mb, max_runs, start_dpi, start_quality="/ebook", on_result=None):
+    """
+    模型驅動的目標大小搜索：擬合大小與DPI的關係並直接跳到預測的DPI/品質組合
+    
+    參數:
+    measure (callable): measure(dpi, quality) -> (大小MB, 附帶數據)，失敗時返回 (None, None)
+    target_size_mb (float): 目標大小
+    max_runs (int): 最多調用measure的次數
+    start_dpi (int): 初始DPI
+    start_quality (str): 初始品質，必須在MODEL_QUALITY_LADDER中
+    on_result (callable): 可選，每次測量後調用 on_result(run, dpi, quality, size_mb)
+    
+    返回:
+    list: 所有測量結果 [(dpi, quality, size_mb, 附帶數據), ...]，按測量順序排列
+    """
+    results = []
+    points = {}  # 品質 -> [(dpi, size_mb)]
+    quality_index = MODEL_QUALITY_LADDER.index(start_quality)
+    dpi = int(min(MODEL_MAX_DPI, max(MODEL_MIN_DPI, start_dpi)))
+    
+    for run in range(max_runs):
+        quality = MODEL_QUALITY_LADDER[quality_index]
+        size_mb, payload = measure(dpi, quality)
+        if size_mb is None:
+            break
+        results.append((dpi, quality, size_mb, payload))
+        points.setdefault(quality, []).append((dpi, size_mb))
+        if on_result:
+            on_result(run + 1, dpi, quality, size_mb)
+        
+        # 足夠接近目標（不超過目標且差距在10%或0.05MB以內）時結束
+        if size_mb <= target_size_mb and (target_size_mb - size_mb < max(0.05, target_size_mb * 0.1)):
+            break
+        
+        predicted, slope = _predict_dpi(points[quality], target_size_mb)
+        # 向下取整：四捨五入可能回到剛超出目標的DPI，導致搜索在目標之上停止
+        next_dpi = int(math.floor(min(MODEL_MAX_DPI, max(MODEL_MIN_DPI, predicted))))
+        
+        if predicted < MODEL_MIN_DPI and size_mb > target_size_mb:
+            # 當前品質在最低DPI下仍無法達到目標，改用更強的品質設置
+            if quality_index + 1 >= len(MODEL_QUALITY_LADDER):
+                if dpi == MODEL_MIN_DPI:
+                    break
+            else:
+                quality_index += 1
+        elif predicted > MODEL_MAX_DPI and size_mb < target_size_mb:
+            # 最高DPI下仍遠小於目標，改用更高的品質設置
+            if quality_index == 0:
+                if dpi == MODEL_MAX_DPI:
+                    break
+            else:
+                quality_index -= 1
+        
+        next_quality = MODEL_QUALITY_LADDER[quality_index]
+        if next_quality != quality:
+            # 換品質後不能沿用上一品質的擬合：有該品質的測量點時用它們預測，
+            # 否則保持當前DPI，只改變品質，下一次測量就是該品質自己的第一個點
+            if points.get(next_quality):
+                predicted, _ = _predict_dpi(points[next_quality], target_size_mb)
+                next_dpi = int(math.floor(min(MODEL_MAX_DPI, max(MODEL_MIN_DPI, predicted))))
+            else:
+                next_dpi = dpi
+        tried = [d for d, _ in points.get(next_quality, [])]
+        if next_dpi in tried:
+            # 預測結果已嘗試過，模型無法再改進
+            break
+        dpi = next_dpi
+    
+    return results
+
+def _pick_best_result(results, target_size_mb):
+    """在測量結果中選擇最佳項：優先選擇達到目標的結果，其次選擇最接近目標的結果"""
+    if not results:
+        return None
+    reached = [r for r in results if _is_target_reached(r[2], target_size_mb)]
+    candidates = reached or results
+    return min(candidates, key=lambda r: abs(r[2] - target_size_mb))
+
+# 模型預測搜索
+def _model_target_search(input_file, temp_dir, target_size_mb, max_attempts, progress_callback, size_scale=1.0,
+                         allow_sharding=True):
+    """返回值與_sequential_target_search相同"""
+    file_size_mb = os.path.getsize(input_file) / (1024 * 1024) * size_scale
+    if file_size_mb <= 0:
+        # 空文件或截斷的上傳無法壓縮，與其他搜索策略所有嘗試都失敗時的結果相同
+        report_progress(progress_callback, 1.0, "輸入文件為空，無法壓縮")
+        return None, None, None
+    # 假設圖像大小與DPI平方成正比，從150 DPI推算初始值
+    start_dpi = 150 * math.sqrt(min(1.0, target_size_mb / file_size_mb))
+    outputs = []
+    
+    def measure(dpi, quality):
+        temp_output = os.path.join(temp_dir, f"model_attempt_{len(outputs) + 1}.pdf")
+        report_progress(progress_callback, None, f"預測嘗試 {len(outputs) + 1}: DPI={dpi}, 質量={quality}")
+        outputs.append(temp_output)
+        processed_file = _target_attempt(input_file, temp_output, dpi, quality, downsample_images=True,
+                                         allow_sharding=allow_sharding)
+        if not processed_file or not os.path.exists(processed_file):
+            return None, None
+        return os.path.getsize(processed_file) / (1024 * 1024) * size_scale, processed_file
+    
+    def on_result(run, dpi, quality, size_mb):
+        report_progress(progress_callback, min(1.0, run / max_attempts))
+        report_progress(progress_callback, None, f"嘗試 {run} (DPI={dpi}, 質量={quality}) - 大小: {size_mb:.2f}MB (目標: {target_size_mb:.2f}MB)")
+    
+    results = model_target_search(measure, target_size_mb, max_attempts, start_dpi, on_result=on_result)
+    best = _pick_best_result(results, target_size_mb)
+    best_file = best[3] if best else None
+    
+    # 刪除其他嘗試產生的文件
+    for path in outputs:
+        if path != best_file and os.path.exists(path):
+            try:
+                os.remove(path)
+            except:
+                pass
+    
+    report_progress(progress_callback, 1.0)
+    if best is None:
+        return None, None, None
+    return best_file, (best[0], best[1], True), best[2]
+
+# PDF處理函數
+def compress_pdf(input_file, output_file, dpi=120, image_quality="/default", color_mode="Color", 
+                 remove_metadata=True, flatten_forms=False, remove_bookmarks=False, 
+                 optimize_fonts=True, pdf_version="1.4", remove_unused=True, cancel_event=None,
+                 downsample_images=False, use_cache=True, allow_sharding=True):
+    """
+    使用Ghostscript或pikepdf處理PDF的綜合函數
+    
+    cancel_event (threading.Event): 可選，設置後會終止正在執行的Ghostscript，結果的cancelled為True
+    downsample_images (bool): 將彩色和灰度圖像重新採樣到指定DPI，使輸出大小隨DPI穩定變化
+    use_cache (bool): 相同輸入和參數的結果直接從磁碟快取讀取
+    allow_sharding (bool): 大型文檔按頁面範圍拆分，由多個Ghostscript進程並行處理
+    
+    返回:
+    dict: make_result的結果，另含 backend（ghostscript、pikepdf或cache）、cancelled、seconds
+    """
+    started = time.time()
+    if cancel_event is not None and cancel_event.is_set():
+        return make_result(error="處理已取消", backend=None, cancelled=True, seconds=0.0)
+    
+    # 以輸入內容、標準化後的參數和Ghostscript後端及版本作為快取鍵
+    cache_key = None
+    if use_cache:
+        try:
+            cache_key = make_cache_key(input_file, {
+                "dpi": int(dpi),
+                "image_quality": str(image_quality),
+                "color_mode": str(color_mode),
+                "pdf_version": str(pdf_version),
+                "remove_metadata": bool(remove_metadata),
+                "flatten_forms": bool(flatten_forms),
+                "remove_bookmarks": bool(remove_bookmarks),
+                "optimize_fonts": bool(optimize_fonts),
+                "remove_unused": bool(remove_unused),
+                "downsample_images": bool(downsample_images),
+                # 分段處理後拼接的結果與整份處理的對象結構和大小不同
+                "allow_sharding": bool(allow_sharding),
+                # 沒有Ghostscript時使用pikepdf；有時按實際使用的後端（gsapi動態庫或gs命令行）及其版本區分
+                "ghostscript": list(ghostscript_identity()) if GHOSTSCRIPT_AVAILABLE else None,
+                "pikepdf": pikepdf.__version__
+            })
+            if cache_get(cache_key, output_file):
+                return make_result(output_file, backend="cache", cancelled=False,
+                                   seconds=round(time.time() - started, 3))
+        except OSError:
+            cache_key = None
+    
+    warnings = []
+    result, cacheable, backend, error = _process_pdf_uncached(
+        input_file, output_file, dpi, image_quality, color_mode,
+        remove_metadata, flatten_forms, remove_bookmarks,
+        optimize_fonts, pdf_version, remove_unused, cancel_event,
+        downsample_images, allow_sharding, warnings
+    )
+    
+    # Ghostscript失敗後的備用結果不寫入快取，避免暫時性錯誤被長期保留
+    if cache_key and cacheable and result and os.path.exists(result):
+        cache_put(cache_key, result)
+    return make_result(result, error, warnings, backend=backend,
+                       cancelled=backend is None and error is None,
+                       seconds=round(time.time() - started, 3))
+
+def _process_pdf_uncached(input_file, output_file, dpi, image_quality, color_mode,
+                          remove_metadata, flatten_forms, remove_bookmarks,
+                          optimize_fonts, pdf_version, remove_unused, cancel_event,
+                          downsample_images, allow_sharding=True, warnings=None):
+    """
+    compress_pdf的實際處理部分
+    
+    返回:
+    tuple: (輸出文件或None, 結果是否可以寫入快取, 使用的後端（已取消時為None）, 錯誤信息或None)
+    """
+    pikepdf_params = {
+        "remove_metadata": remove_metadata,
+        "flatten_forms": flatten_forms,
+        "remove_bookmarks": remove_bookmarks,
+        "optimize_fonts": optimize_fonts
+    }
+    if GHOSTSCRIPT_AVAILABLE:
+        # 使用Ghostscript處理
+        try:
+            def build_command(source, target):
+                return _build_gs_command(
+                    source, target, dpi, image_quality, color_mode, pdf_version,
+                    remove_metadata, remove_unused, optimize_fonts, downsample_images
+                )
+            
+            # 頁數很多時分段並行處理，否則整份文檔交給一個Ghostscript進程
+            shard_ranges = plan_shards(input_file, pool_size()) if allow_sharding else []
+            if shard_ranges:
+                _run_sharded_ghostscript(
+                    input_file, output_file, shard_ranges, build_command, cancel_event,
+                    restore_outlines=not remove_bookmarks,
+                    keep_metadata=not remove_metadata,
+                    pdf_version=pdf_version
+                )
+            else:
+                run_ghostscript(build_command(input_file, output_file), cancel_event=cancel_event)
+            
+            # 處理表單和書籤需要進一步處理
+            if flatten_forms or remove_bookmarks:
+                pikepdf_optimize(output_file, output_file, {
+                    "flatten_forms": flatten_forms,
+                    "remove_bookmarks": remove_bookmarks,
+                    "remove_metadata": False,  # 已由GS處理
+                    "optimize_fonts": False    # 已由GS處理
+                })
+            
+            return output_file, True, "ghostscript", None
+            
+        except GhostscriptCancelled:
+            # 被取消的嘗試不回退到pikepdf，並清理不完整的輸出
+            if os.path.exists(output_file):
+                try:
+                    os.remove(output_file)
+                except:
+                    pass
+            return None, False, None, None
+        except Exception as e:
+            if warnings is not None:
+                warnings.append(f"Ghostscript處理失敗: {str(e)}，使用備用方法...")
+            # 如果Ghostscript失敗，回退到pikepdf
+            try:
+                return pikepdf_optimize(input_file, output_file, pikepdf_params), False, "pikepdf", None
+            except Exception as e:
+                return None, False, "pikepdf", f"pikepdf處理時出錯: {str(e)}"
+    else:
+        # 沒有Ghostscript，使用pikepdf
+        try:
+            return pikepdf_optimize(input_file, output_file, pikepdf_params), True, "pikepdf", None
+        except Exception as e:
+            return None, False, "pikepdf", f"pikepdf處理時出錯: {str(e)}"
+
+def _build_gs_command(input_file, output_file, dpi, image_quality, color_mode, pdf_version,
+                      remove_metadata, remove_unused, optimize_fonts, downsample_images):
+    """根據處理參數生成Ghostscript命令"""
+    # 確保路徑沒有問題，轉換為適當的格式
+    output_path = output_file.replace('\\', '/')
+    input_path = input_file.replace('\\', '/')
+    
+    # 設置Ghostscript命令
+    gs_cmd = [
+        GHOSTSCRIPT_PATH,
+        "-sDEVICE=pdfwrite",
+        f"-dCompatibilityLevel={pdf_version}",
+        f"-dPDFSETTINGS={image_quality}",
+        "-dNOPAUSE",
+        "-dQUIET",
+        "-dBATCH",
+        f"-r{dpi}"
+    ]
+    
+    # 添加顏色模式設置
+    if color_mode == "Gray":
+        gs_cmd.append("-sColorConversionStrategy=Gray")
+        gs_cmd.append("-dProcessColorModel=/DeviceGray")
+    elif color_mode == "Mono":
+        gs_cmd.append("-sColorConversionStrategy=Mono")
+        gs_cmd.append("-dProcessColorModel=/DeviceGray")
+    
+    # 按DPI重新採樣圖像
+    if downsample_images:
+        gs_cmd.append("-dDownsampleColorImages=true")
+        gs_cmd.append("-dDownsampleGrayImages=true")
+        gs_cmd.append(f"-dColorImageResolution={dpi}")
+        gs_cmd.append(f"-dGrayImageResolution={dpi}")
+        gs_cmd.append("-dColorImageDownsampleThreshold=1.0")
+        gs_cmd.append("-dGrayImageDownsampleThreshold=1.0")
+    
+    # 添加元數據處理
+    if remove_metadata:
+        gs_cmd.append("-dFastWebView=true")
+    
+    # 添加優化選項
+    if remove_unused:
+        gs_cmd.append("-dDetectDuplicateImages=true")
+        gs_cmd.append("-dCompressFonts=true")
+    
+    # 改進字體處理方式，特別是對中文字體的處理
+    if optimize_fonts:
+        # 字體優化但保留嵌入，確保中文正確顯示
+        gs_cmd.append("-dEmbedAllFonts=true")  # 修改為true確保嵌入所有字體
+        gs_cmd.append("-dSubsetFonts=true")
+        gs_cmd.append("-dPrinted=false")  # 優化用於螢幕顯示不是打印
+        gs_cmd.append("-dMaxSubsetPct=100")  # 允許完整子集
+    else:
+        # 如果不優化字體，確保完整嵌入所有字體
+        gs_cmd.append("-dEmbedAllFonts=true")
+        gs_cmd.append("-dSubsetFonts=false")
+    
+    # 添加輸出和輸入文件，放在命令末尾
+    gs_cmd.append(f"-sOutputFile={output_path}")
+    gs_cmd.append(input_path)
+    return gs_cmd
+
+class _AnyEvent:
+    """任一事件被設置即視為已設置，用於合併外部取消和分段失敗兩種取消來源"""
+    
+    def __init__(self, *events):
+        self.events = [e for e in events if e is not None]
+    
+    def is_set(self):
+        return any(e.is_set() for e in self.events)
+
+def _run_sharded_ghostscript(input_file, output_file, shard_ranges, build_command, cancel_event=None,
+                             restore_outlines=True, keep_metadata=True, pdf_version=None):
+    """
+    分段並行執行Ghostscript，再把各分段合併為一個文件
+    
+    參數:
+    input_file (str): 輸入文件路徑
+    output_file (str): 輸出文件路徑
+    shard_ranges (list): plan_shards返回的頁面範圍
+    build_command (callable): build_command(輸入, 輸出) 返回Ghostscript命令
+    cancel_event (threading.Event): 可選，設置後終止所有分段
+    restore_outlines (bool): 合併時是否恢復原始書籤
+    keep_metadata (bool): 合併時是否保留原始文檔信息
+    pdf_version (str): 合併後輸出的PDF版本，與Ghostscript的兼容級別相同
+    
+    任一分段失敗時會取消其餘分段並拋出原始異常
+    """
+    shard_dir = tempfile.mkdtemp(prefix="shards_", dir=os.path.dirname(os.path.abspath(output_file)))
+    failed = threading.Event()
+    shard_cancel = _AnyEvent(cancel_event, failed)
+    
+    def run_shard(shard_input):
+        shard_output = shard_input[:-4] + "_out.pdf"
+        try:
+            run_ghostscript(build_command(shard_input, shard_output), cancel_event=shard_cancel)
+        except Exception:
+            failed.set()
+            raise
+        return shard_output
+    
+    try:
+        shard_inputs = split_pdf(input_file, shard_ranges, shard_dir)
+        with ThreadPoolExecutor(max_workers=min(pool_size(), len(shard_inputs))) as executor:
+            futures = [executor.submit(run_shard, shard_input) for shard_input in shard_inputs]
+            errors = []
+            shard_outputs = []
+            for future in futures:
+                try:
+                    shard_outputs.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            raise GhostscriptCancelled("Ghostscript處理已取消")
+        if errors:
+            # 優先報告真正的失敗，而不是因此被取消的分段
+            real_errors = [e for e in errors if not isinstance(e, GhostscriptCancelled)]
+            raise (real_errors or errors)[0]
+        
+        stitch_pdfs(shard_outputs, input_file, output_file,
+                    restore_outlines=restore_outlines, keep_metadata=keep_metadata,
+                    pdf_version=pdf_version)
+        return output_file
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+# pikepdf優化輔助函數
+def pikepdf_optimize(input_file, output_file, params):
+    """
+    使用pikepdf進行基本優化，出錯時拋出異常
+    
+    參數:
+    input_file (str): 輸入文件路徑，可以與輸出相同
+    output_file (str): 輸出文件路徑
+    params (dict): remove_metadata、flatten_forms、remove_bookmarks、optimize_fonts
+    
+    返回:
+    str: 輸出文件路徑
+    """
+    # 檢查輸入和輸出路徑是否相同
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        pdf = Pdf.open(input_file, allow_overwriting_input=True)
+    else:
+        pdf = Pdf.open(input_file)
+    
+    with pdf:
+        # 移除元數據
+        if params.get("remove_metadata"):
+            with pdf.open_metadata() as meta:
+                meta.clear()
+        
+        # 壓平表單欄位
+        if params.get("flatten_forms"):
+            for page in pdf.pages:
+                if "/Annots" in page:
+                    del page["/Annots"]
+        
+        # 移除書籤
+        if params.get("remove_bookmarks"):
+            if "/Outlines" in pdf.Root:
+                del pdf.Root["/Outlines"]
+        
+        # 保存為優化的PDF
+        pdf.save(output_file,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                compress_streams=True,
+                recompress_flate=True)
+    
+    return output_file
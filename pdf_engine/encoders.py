@@ -0,0 +1,121 @@
+# 圖片編碼：各輸出格式的速度/體積設定及計時，批量導出時編碼往往比轉換更耗時
+import os
+import time
+from PIL import features
+
+# 編碼設定：fast為速度優先，balanced為平衡，small為體積優先
+ENCODE_PROFILES = ("fast", "balanced", "small")
+
+# WebP和TIFF的壓縮需要Pillow附帶相應的庫
+WEBP_AVAILABLE = features.check("webp")
+LIBTIFF_AVAILABLE = features.check("libtiff")
+
+# TIFF壓縮方式與Pillow參數的對應；group4只適用於黑白圖像，保存前會轉換為1位
+TIFF_COMPRESSIONS = {
+    "none": None,
+    "lzw": "tiff_lzw",
+    "deflate": "tiff_adobe_deflate",
+    "group4": "group4",
+}
+
+# 各格式（鍵為Pillow格式名稱）的擴展名，以及每個設定的保存參數
+IMAGE_FORMATS = {
+    "PNG": {
+        "extension": "png",
+        "profiles": {
+            "fast": {"compress_level": 1},
+            "balanced": {"compress_level": 6},
+            "small": {"compress_level": 9, "optimize": True},
+        },
+    },
+    "JPEG": {
+        "extension": "jpg",
+        "profiles": {
+            "fast": {"optimize": False, "progressive": False},
+            "balanced": {"optimize": True, "progressive": False},
+            "small": {"optimize": True, "progressive": True},
+        },
+    },
+    "WEBP": {
+        "extension": "webp",
+        "profiles": {
+            "fast": {"method": 0},
+            "balanced": {"method": 4},
+            "small": {"method": 6},
+        },
+    },
+    "TIFF": {
+        "extension": "tiff",
+        "profiles": {
+            "fast": {"compression": "lzw"},
+            "balanced": {"compression": "lzw"},
+            "small": {"compression": "deflate"},
+        },
+    },
+    "BMP": {
+        "extension": "bmp",
+        "profiles": {"fast": {}, "balanced": {}, "small": {}},
+    },
+}
+
+def available_formats():
+    """返回當前環境可以輸出的圖片格式"""
+    return [name for name in IMAGE_FORMATS if name != "WEBP" or WEBP_AVAILABLE]
+
+def encoder_options(image_format, profile="balanced", **overrides):
+    """
+    生成某個格式的保存參數
+
+    參數:
+    image_format (str): PNG、JPEG、WEBP、TIFF或BMP
+    profile (str): fast、balanced或small
+    overrides: 覆蓋設定中的參數，例如 quality=85、subsampling=0、progressive=True、
+               compression="group4"（TIFF）、lossless=True（WebP）；值為None的參數會被忽略
+
+    返回:
+    dict: 傳給encode_image的參數
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的圖片格式: {image_format}")
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f"未知的編碼設定: {profile}")
+    options = dict(IMAGE_FORMATS[image_format]["profiles"][profile])
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+def encode_image(image, path, image_format, options=None):
+    """
+    按格式和參數保存圖像，並計時
+
+    參數:
+    image (PIL.Image): 要保存的圖像
+    path (str): 輸出路徑
+    image_format (str): 圖片格式
+    options (dict): encoder_options返回的參數
+
+    返回:
+    dict: path、bytes（文件大小）、seconds（編碼時間）
+    """
+    options = dict(options or {})
+    start = time.perf_counter()
+
+    if image_format == "JPEG" and image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    elif image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    elif image_format == "TIFF":
+        # Pillow的TIFF壓縮需要libtiff，沒有時只能保存為無壓縮
+        compression = options.pop("compression", None) if LIBTIFF_AVAILABLE else None
+        options.pop("compression", None)
+        if compression == "group4":
+            # CCITT Group 4只能編碼1位黑白圖像，以閾值二值化（默認的抖動會讓文字邊緣產生雜點）
+            image = image.convert("L").point(lambda value: 255 if value >= 128 else 0, mode="1")
+        if compression is not None:
+            options["compression"] = TIFF_COMPRESSIONS[compression]
+
+    image.save(path, image_format, **options)
+    return {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,434 @@
+# Ghostscript執行後端：檢測Ghostscript，並在可用時通過常駐工作進程調用Ghostscript C API (gsapi)
+# 避免每次處理都啟動新的gs進程；找不到Ghostscript動態庫時回退到subprocess
+import os
+import logging
+import shutil
+import ctypes
+import ctypes.util
+import platform
+import subprocess
+import threading
+import queue
+import atexit
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+# 後端選擇：auto（默認，優先gsapi）、gsapi、subprocess
+GS_BACKEND_SETTING = os.environ.get("PDF_TOOLKIT_GS_BACKEND", "auto").strip().lower()
+# 常駐工作進程數量，默認為CPU核心數
+GS_POOL_SIZE = int(os.environ.get("PDF_TOOLKIT_GS_POOL_SIZE", "0") or 0) or (os.cpu_count() or 1)
+
+# 檢查Ghostscript是否可用的函數（適用於所有平台，尤其是Linux）
+def check_ghostscript():
+    try:
+        # 直接嘗試執行gs命令
+        result = subprocess.run(["gs", "--version"], capture_output=True, text=True, timeout=5)
+        if result.returncode == 0:
+            return True, "gs", result.stdout.strip()
+
+        # 如果直接執行失敗，嘗試其他可能的路徑
+        for cmd in ["gswin64c", "gswin32c"]:
+            try:
+                result = subprocess.run([cmd, "--version"], capture_output=True, text=True, timeout=5)
+                if result.returncode == 0:
+                    return True, cmd, result.stdout.strip()
+            except:
+                pass
+
+        return False, None, None
+    except Exception as e:
+        return False, None, str(e)
+
+# 設置Ghostscript路徑
+# 首先嘗試命令行檢測
+GS_AVAILABLE, GS_CMD, GS_VERSION = check_ghostscript()
+
+if GS_AVAILABLE:
+    GHOSTSCRIPT_PATH = GS_CMD
+    GHOSTSCRIPT_AVAILABLE = True
+else:
+    # 如果命令行檢測失敗，回退到傳統路徑檢測
+    GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin64c.exe")
+    if not os.path.exists(GHOSTSCRIPT_PATH):
+        GHOSTSCRIPT_PATH = os.path.join(os.getcwd(), "gs10.05.0", "bin", "gswin32c.exe")
+        if not os.path.exists(GHOSTSCRIPT_PATH):
+            # 嘗試在系統路徑中查找
+            GHOSTSCRIPT_PATH = shutil.which("gswin64c") or shutil.which("gswin32c") or shutil.which("gs") or "gs"
+
+    # 最後檢查路徑是否可用
+    try:
+        result = subprocess.run([GHOSTSCRIPT_PATH, "--version"], capture_output=True, text=True, timeout=5)
+        GHOSTSCRIPT_AVAILABLE = result.returncode == 0
+        if GHOSTSCRIPT_AVAILABLE:
+            GS_VERSION = result.stdout.strip()
+    except:
+        GHOSTSCRIPT_AVAILABLE = False
+
+class GhostscriptCancelled(Exception):
+    """Ghostscript執行被取消時拋出"""
+
+# gsapi常量
+_GS_ARG_ENCODING_UTF8 = 1
+_GS_ERROR_QUIT = -101
+_STDIO_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_char), ctypes.c_int)
+
+def find_gsapi_library():
+    """
+    查找Ghostscript動態庫
+
+    返回:
+    str: 動態庫路徑或名稱，找不到時返回None
+    """
+    override = os.environ.get("PDF_TOOLKIT_GSAPI_LIB")
+    if override:
+        return override
+
+    candidates = []
+    if platform.system() == "Windows":
+        # Windows版Ghostscript的DLL與gswin64c.exe位於同一目錄
+        gs_dirs = [os.path.dirname(os.path.abspath(p)) for p in [GHOSTSCRIPT_PATH, shutil.which(GHOSTSCRIPT_PATH) or ""] if p]
+        for gs_dir in gs_dirs:
+            candidates.append(os.path.join(gs_dir, "gsdll64.dll"))
+            candidates.append(os.path.join(gs_dir, "gsdll32.dll"))
+        found = [c for c in candidates if os.path.exists(c)]
+        return found[0] if found else ctypes.util.find_library("gsdll64")
+
+    found = ctypes.util.find_library("gs")
+    if found:
+        return found
+    for name in ["libgs.so.10", "libgs.so.9", "libgs.dylib", "/opt/homebrew/lib/libgs.dylib", "/usr/local/lib/libgs.dylib"]:
+        try:
+            ctypes.CDLL(name)
+            return name
+        except OSError:
+            continue
+    return None
+
+def _load_gsapi(library):
+    """載入Ghostscript動態庫並設置函數簽名"""
+    if platform.system() == "Windows":
+        lib = ctypes.WinDLL(library)
+    else:
+        lib = ctypes.CDLL(library)
+    lib.gsapi_new_instance.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p]
+    lib.gsapi_new_instance.restype = ctypes.c_int
+    lib.gsapi_delete_instance.argtypes = [ctypes.c_void_p]
+    lib.gsapi_delete_instance.restype = None
+    lib.gsapi_set_arg_encoding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.gsapi_set_arg_encoding.restype = ctypes.c_int
+    lib.gsapi_init_with_args.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+    lib.gsapi_init_with_args.restype = ctypes.c_int
+    lib.gsapi_exit.argtypes = [ctypes.c_void_p]
+    lib.gsapi_exit.restype = ctypes.c_int
+    lib.gsapi_set_stdio.argtypes = [ctypes.c_void_p, _STDIO_CALLBACK, _STDIO_CALLBACK, _STDIO_CALLBACK]
+    lib.gsapi_set_stdio.restype = ctypes.c_int
+    return lib
+
+class _GsapiRevision(ctypes.Structure):
+    _fields_ = [
+        ("product", ctypes.c_char_p),
+        ("copyright", ctypes.c_char_p),
+        ("revision", ctypes.c_long),
+        ("revisiondate", ctypes.c_long)
+    ]
+
+def _gsapi_version(lib):
+    """讀取動態庫版本，格式與 gs --version 相同，例如 10.05.0"""
+    try:
+        info = _GsapiRevision()
+        lib.gsapi_revision.argtypes = [ctypes.POINTER(_GsapiRevision), ctypes.c_int]
+        if lib.gsapi_revision(ctypes.byref(info), ctypes.sizeof(info)) != 0:
+            return None
+        revision = info.revision
+        return f"{revision // 1000}.{(revision // 10) % 100:02d}.{revision % 10}"
+    except Exception:
+        return None
+
+def _gsapi_worker(library, conn):
+    """
+    常駐工作進程：載入一次Ghostscript動態庫，之後循環接收命令並在本進程內執行
+
+    每個任務使用新的Ghostscript實例（gsapi每個進程同時只允許一個實例），
+    但動態庫、字體映射文件和進程本身在任務之間保持不變
+    """
+    try:
+        lib = _load_gsapi(library)
+        conn.send(("ready", _gsapi_version(lib)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+
+    while True:
+        try:
+            args = conn.recv()
+        except (EOFError, OSError):
+            break
+        if args is None:
+            break
+
+        output = {"stdout": [], "stderr": []}
+
+        def make_writer(name):
+            def write(handle, data, length):
+                output[name].append(ctypes.string_at(data, length))
+                return length
+            return _STDIO_CALLBACK(write)
+
+        def read_stdin(handle, data, length):
+            return 0
+
+        stdin_cb = _STDIO_CALLBACK(read_stdin)
+        stdout_cb = make_writer("stdout")
+        stderr_cb = make_writer("stderr")
+
+        instance = ctypes.c_void_p()
+        code = lib.gsapi_new_instance(ctypes.byref(instance), None)
+        if code == 0:
+            try:
+                lib.gsapi_set_stdio(instance, stdin_cb, stdout_cb, stderr_cb)
+                lib.gsapi_set_arg_encoding(instance, _GS_ARG_ENCODING_UTF8)
+                encoded = [a.encode("utf-8") for a in args]
+                argv = (ctypes.c_char_p * len(encoded))(*encoded)
+                code = lib.gsapi_init_with_args(instance, len(encoded), argv)
+                exit_code = lib.gsapi_exit(instance)
+                if code in (0, _GS_ERROR_QUIT):
+                    code = exit_code
+            finally:
+                lib.gsapi_delete_instance(instance)
+
+        stdout = b"".join(output["stdout"]).decode("utf-8", errors="replace")
+        stderr = b"".join(output["stderr"]).decode("utf-8", errors="replace")
+        try:
+            conn.send(("done", code, stdout, stderr))
+        except (EOFError, OSError):
+            break
+
+class _GsapiWorker:
+    """常駐工作進程的句柄"""
+
+    def __init__(self, library, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_gsapi_worker, args=(library, child_conn), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # 等待動態庫載入完成
+        if not self.conn.poll(30):
+            self.kill()
+            raise RuntimeError("Ghostscript工作進程啟動超時")
+        status = self.conn.recv()
+        if status[0] != "ready":
+            self.kill()
+            raise RuntimeError(f"無法載入Ghostscript動態庫: {status[1]}")
+        self.version = status[1]
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.conn.send(None)
+            self.process.join(2)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+class GsapiPool:
+    """
+    gsapi工作進程池，可被多個線程同時使用
+
+    工作進程按需創建，最多max_workers個；任務取消或出錯時直接結束對應進程，
+    下次需要時再創建新的進程
+    """
+
+    def __init__(self, library, max_workers=GS_POOL_SIZE):
+        self.library = library
+        self.max_workers = max(1, max_workers)
+        # 使用spawn避免在Streamlit的多線程進程中fork
+        self.context = multiprocessing.get_context("spawn")
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(self.max_workers)
+        self.version = None
+
+    def _acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            worker = _GsapiWorker(self.library, self.context)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.created += 1
+            self.version = worker.version
+        return worker
+
+    def _release(self, worker, reuse=True):
+        if reuse:
+            self.idle.put(worker)
+        else:
+            worker.kill()
+        self.slots.release()
+
+    def warm_up(self):
+        """預先啟動一個工作進程，同時確認動態庫可以正常載入"""
+        worker = self._acquire()
+        self._release(worker)
+        return self.version
+
+    def run(self, gs_cmd, cancel_event=None, poll_interval=0.1):
+        """
+        在工作進程中執行Ghostscript命令，行為與run_ghostscript相同
+        """
+        worker = self._acquire()
+        reuse = False
+        try:
+            worker.conn.send(list(gs_cmd))
+            while not worker.conn.poll(poll_interval):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise GhostscriptCancelled("Ghostscript處理已取消")
+                if not worker.process.is_alive():
+                    raise subprocess.CalledProcessError(-1, gs_cmd, "", "Ghostscript工作進程意外退出")
+            try:
+                _, code, stdout, stderr = worker.conn.recv()
+            except (EOFError, OSError):
+                raise subprocess.CalledProcessError(-1, gs_cmd, "", "Ghostscript工作進程意外退出")
+            reuse = True
+        finally:
+            self._release(worker, reuse)
+
+        if code != 0:
+            raise subprocess.CalledProcessError(code, gs_cmd, stdout, stderr)
+        return subprocess.CompletedProcess(gs_cmd, code, stdout, stderr)
+
+    def shutdown(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_failed = False
+# 工作進程池的大小，也是大型文檔分段並行的數量；默認為GS_POOL_SIZE，可由set_pool_size修改
+_pool_size = GS_POOL_SIZE
+
+def set_pool_size(max_workers):
+    """
+    設置gsapi工作進程數及分段並行的數量
+
+    GS_POOL_SIZE在模組導入時讀取環境變量，之後修改環境變量不會生效，需要調整時調用此函數；
+    已創建的進程池大小不同時會被關閉，下次執行時按新的大小創建
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        _pool_size = max(1, int(max_workers))
+        if _pool is not None and _pool.max_workers != _pool_size:
+            _pool.shutdown()
+            _pool = None
+
+def pool_size():
+    """返回目前的工作進程數"""
+    return _pool_size
+
+def _get_pool():
+    """按後端設置返回gsapi工作進程池，不可用時返回None（使用subprocess）"""
+    global _pool, _pool_failed
+    if GS_BACKEND_SETTING == "subprocess" or _pool_failed:
+        return None
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            library = find_gsapi_library()
+            if library is None:
+                _pool_failed = True
+                return None
+            pool = GsapiPool(library, _pool_size)
+            try:
+                pool.warm_up()
+                _pool = pool
+            except Exception as e:
+                _pool_failed = True
+                if GS_BACKEND_SETTING == "gsapi":
+                    logger.warning("Ghostscript gsapi後端不可用，改用subprocess: %s", e)
+    return _pool
+
+def ghostscript_backend():
+    """返回目前使用的執行後端名稱：gsapi 或 subprocess"""
+    return "gsapi" if _get_pool() is not None else "subprocess"
+
+def ghostscript_identity():
+    """
+    返回實際執行Ghostscript的後端及其版本，例如 ("gsapi", "10.05.0")，用於結果快取鍵
+
+    gsapi後端的輸出來自載入的動態庫，其版本可能與gs命令行不同
+    """
+    pool = _get_pool()
+    if pool is not None:
+        return "gsapi", pool.version
+    return "subprocess", GS_VERSION if GHOSTSCRIPT_AVAILABLE else None
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown()
+
+atexit.register(_shutdown_pool)
+
+def _run_subprocess(gs_cmd, cancel_event=None, poll_interval=0.1):
+    """以獨立gs進程執行命令"""
+    if cancel_event is None:
+        return subprocess.run(
+            gs_cmd,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+
+    process = subprocess.Popen(gs_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise GhostscriptCancelled("Ghostscript處理已取消")
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, gs_cmd, stdout, stderr)
+    return subprocess.CompletedProcess(gs_cmd, process.returncode, stdout, stderr)
+
+def run_ghostscript(gs_cmd, cancel_event=None, poll_interval=0.1):
+    """
+    執行Ghostscript命令，失敗時拋出subprocess.CalledProcessError
+
+    參數:
+    gs_cmd (list): 完整的Ghostscript命令（第一項為gs可執行文件，gsapi後端會忽略）
+    cancel_event (threading.Event): 可選，設置後終止Ghostscript並拋出GhostscriptCancelled
+    poll_interval (float): 檢查取消狀態的間隔（秒）
+
+    返回:
+    subprocess.CompletedProcess: 執行結果
+    """
+    pool = _get_pool()
+    if pool is not None:
+        return pool.run(gs_cmd, cancel_event=cancel_event, poll_interval=poll_interval)
+    return _run_subprocess(gs_cmd, cancel_event=cancel_event, poll_interval=poll_interval)
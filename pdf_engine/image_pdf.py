@@ -0,0 +1,222 @@
+# 圖像PDF寫入器：逐頁把已編碼的JPEG（黑白頁面可用CCITT G4）直接寫成PDF圖像對象，不經過Pillow的PDF寫入器重新編碼
+# 每頁寫入後立即落盤，只在記憶體中保留各對象的偏移量，峰值記憶體與頁數無關
+from io import BytesIO
+from PIL import Image, features
+
+# 黑白頁面使用CCITT Group 4編碼需要Pillow附帶libtiff
+CCITT_AVAILABLE = features.check("libtiff")
+# 灰階值介於此範圍的像素視為非黑白（抗鋸齒邊緣等）
+_BILEVEL_GRAY_RANGE = (48, 208)
+
+# PDF顏色空間與每個像素的分量數
+_COLOR_SPACES = {"L": ("/DeviceGray", 1), "RGB": ("/DeviceRGB", 3), "CMYK": ("/DeviceCMYK", 4)}
+
+def encode_jpeg(image, quality=None, subsampling=None):
+    """
+    把PIL圖像編碼為JPEG，L和RGB以外的模式會轉換為RGB
+
+    參數:
+    image (PIL.Image): 要編碼的圖像
+    quality (int): JPEG質量（1-95），None時使用Pillow的默認值
+    subsampling (int): 色度抽樣，0為4:4:4、1為4:2:2、2為4:2:0，None時使用Pillow的默認值
+
+    返回:
+    tuple: (JPEG位元組, 寬度, 高度, 圖像模式)，可直接傳給ImagePdfWriter.add_jpeg
+    """
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    options = {}
+    if quality is not None:
+        options["quality"] = quality
+    if subsampling is not None and image.mode == "RGB":
+        options["subsampling"] = subsampling
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", **options)
+    return buffer.getvalue(), image.width, image.height, image.mode
+
+def is_bilevel(image, tolerance=0.005):
+    """判斷頁面是否基本只有黑白兩色（中間灰階像素比例不超過tolerance）"""
+    if image.mode == "1":
+        return True
+    histogram = image.convert("L").histogram()
+    low, high = _BILEVEL_GRAY_RANGE
+    total = image.width * image.height
+    return total > 0 and sum(histogram[low:high]) <= total * tolerance
+
+def encode_ccitt(image, threshold=128):
+    """
+    把圖像二值化後以CCITT Group 4編碼
+
+    返回:
+    tuple: (CCITT位元組, 寬度, 高度)，可直接傳給ImagePdfWriter.add_ccitt
+    """
+    if image.mode != "1":
+        image = image.convert("L").point(lambda value: 255 if value >= threshold else 0, mode="1")
+    buffer = BytesIO()
+    # 整張圖像作為一個條帶，條帶內容即為PDF可直接使用的CCITT數據
+    image.save(buffer, "TIFF", compression="group4", tiffinfo={278: image.height})
+    with Image.open(BytesIO(buffer.getvalue())) as tiff:
+        offset = tiff.tag_v2[273][0]
+        length = tiff.tag_v2[279][0]
+    return buffer.getvalue()[offset:offset + length], image.width, image.height
+
+def encode_page_image(image, quality=None, subsampling=None, bilevel=False, grayscale=False):
+    """
+    按參數選擇編碼方式並編碼頁面圖像，可以在線程池中執行；grayscale為True時以灰階JPEG編碼
+
+    返回:
+    tuple: ("ccitt", 數據, 寬度, 高度) 或 ("jpeg", 數據, 寬度, 高度, 圖像模式)，傳給ImagePdfWriter.add_encoded
+    """
+    if bilevel and CCITT_AVAILABLE and is_bilevel(image):
+        return ("ccitt",) + encode_ccitt(image)
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    return ("jpeg",) + encode_jpeg(image, quality, subsampling)
+
+class ImagePdfWriter:
+    """
+    逐頁寫入以圖像組成的PDF
+
+    用法:
+    with ImagePdfWriter(output_path) as writer:
+        for image in images:
+            writer.add_image(image, dpi)
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._file = open(output_path, "wb")
+        self._offsets = {}
+        self._page_refs = []
+        # 1號對象為目錄，2號對象為頁面樹，在關閉時寫入
+        self._next_id = 3
+        self._closed = False
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 出錯時不寫入結尾，只關閉文件
+            self._file.close()
+            self._closed = True
+
+    @property
+    def page_count(self):
+        return len(self._page_refs)
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self._file.write(body.encode("ascii"))
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def _allocate(self, count):
+        first = self._next_id
+        self._next_id += count
+        return range(first, first + count)
+
+    def add_jpeg(self, jpeg_bytes, width, height, mode="RGB", dpi=72):
+        """
+        把已編碼的JPEG作為新的一頁寫入，頁面大小按DPI換算
+
+        參數:
+        jpeg_bytes (bytes): JPEG文件內容
+        width (int): 圖像寬度（像素）
+        height (int): 圖像高度（像素）
+        mode (str): 圖像模式，L、RGB或CMYK
+        dpi (float): 圖像分辨率，用於計算頁面的實際大小
+        """
+        color_space, _ = _COLOR_SPACES[mode]
+        extra = " /Decode [1 0 1 0 1 0 1 0]" if mode == "CMYK" else ""
+        self._add_image_page(
+            f"/Filter /DCTDecode /ColorSpace {color_space} /BitsPerComponent 8{extra}",
+            jpeg_bytes, width, height, dpi
+        )
+
+    def add_ccitt(self, ccitt_bytes, width, height, dpi=72):
+        """
+        把CCITT Group 4編碼的黑白圖像作為新的一頁寫入
+
+        參數:
+        ccitt_bytes (bytes): encode_ccitt返回的數據
+        width (int): 圖像寬度（像素）
+        height (int): 圖像高度（像素）
+        dpi (float): 圖像分辨率
+        """
+        self._add_image_page(
+            f"/Filter /CCITTFaxDecode /DecodeParms << /K -1 /Columns {width} /Rows {height} /BlackIs1 true >> "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 1",
+            ccitt_bytes, width, height, dpi
+        )
+
+    def add_image(self, image, dpi=72, quality=None, subsampling=None, bilevel=False):
+        """
+        把PIL圖像編碼後寫入為新的一頁，每頁可以使用不同的編碼參數
+
+        參數:
+        image (PIL.Image): 頁面圖像，L和RGB以外的模式會轉換為RGB
+        dpi (float): 圖像分辨率
+        quality (int): JPEG質量，None時使用Pillow的默認值
+        subsampling (int): JPEG色度抽樣，見encode_jpeg
+        bilevel (bool): 頁面只有黑白兩色時改用CCITT Group 4編碼（需要libtiff）
+
+        返回:
+        int: 寫入的圖像位元組數
+        """
+        return self.add_encoded(encode_page_image(image, quality, subsampling, bilevel), dpi)
+
+    def add_encoded(self, encoded, dpi=72):
+        """寫入encode_page_image的結果，返回寫入的圖像位元組數"""
+        if encoded[0] == "ccitt":
+            self.add_ccitt(*encoded[1:], dpi=dpi)
+        else:
+            self.add_jpeg(*encoded[1:], dpi=dpi)
+        return len(encoded[1])
+
+    def _add_image_page(self, image_dict, data, width, height, dpi):
+        image_id, content_id, page_id = self._allocate(3)
+        self._write_object(
+            image_id,
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"{image_dict} /Length {len(data)} >>",
+            data
+        )
+        # 以點為單位的頁面大小（1英寸 = 72點）
+        page_width = width * 72.0 / dpi
+        page_height = height * 72.0 / dpi
+        content = f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._write_object(content_id, f"<< /Length {len(content)} >>", content)
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        self._page_refs.append(page_id)
+
+    def close(self):
+        """寫入頁面樹、目錄和交叉引用表並關閉文件"""
+        if self._closed:
+            return
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_refs)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_refs)} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            lines.append(f"{self._offsets[obj_id]:010d} 00000 n \n")
+        self._file.write("".join(lines).encode("ascii"))
+        self._file.write(
+            f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii")
+        )
+        self._file.close()
+        self._closed = True
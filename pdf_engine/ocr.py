@@ -0,0 +1,244 @@
+# OCR引擎：頁面邊轉換邊交給多個並行的tesseract進程識別，結果按頁碼順序返回
+# pytesseract每次識別都會啟動一個tesseract進程，識別線程只負責等待進程，多個頁面可以同時在不同核心上識別
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_engine.parallel_render import render_page_set
+from pdf_engine.results import report_progress
+
+# 同時運行的tesseract進程數，默認為CPU核心數
+OCR_WORKERS = int(os.environ.get("PDF_TOOLKIT_OCR_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+# OCR轉換頁面使用的DPI（與pdf2image的默認值相同）
+OCR_DPI = 200
+# 自動選擇語言時依次考慮的語言組合，只有全部語言都已安裝的組合才會被使用
+OCR_LANGUAGE_CANDIDATES = ("chi_tra+eng", "chi_sim+eng", "eng")
+
+# 正在執行的並行識別數，大於0時才限制tesseract的OpenMP線程數
+_omp_limit_users = 0
+_omp_limit_lock = threading.Lock()
+
+# 已安裝語言的快取：tesseract路徑 -> 語言集合，每個進程只查詢一次
+_installed_languages = {}
+_languages_lock = threading.Lock()
+
+def installed_languages(refresh=False):
+    """
+    返回tesseract已安裝的語言（例如 {"eng", "chi_tra", "osd"}），查詢失敗時返回空集合
+
+    結果按tesseract路徑快取，refresh為True時重新查詢
+    """
+    import pytesseract
+
+    command = pytesseract.pytesseract.tesseract_cmd
+    with _languages_lock:
+        if refresh or command not in _installed_languages:
+            try:
+                languages = set(pytesseract.get_languages(config=""))
+            except Exception:
+                languages = set()
+            _installed_languages[command] = languages
+        return set(_installed_languages[command])
+
+def language_available(lang):
+    """判斷語言組合（例如 "chi_tra+eng"）中的所有語言是否都已安裝"""
+    installed = installed_languages()
+    return bool(lang) and all(part in installed for part in lang.split("+"))
+
+def available_language_candidates():
+    """返回OCR_LANGUAGE_CANDIDATES中已安裝的語言組合"""
+    return [lang for lang in OCR_LANGUAGE_CANDIDATES if language_available(lang)]
+
+def default_language():
+    """
+    不偵測文檔時使用的語言：第一個已安裝的候選組合；
+    一個都沒有時返回None，由tesseract使用其默認語言
+    """
+    candidates = available_language_candidates()
+    return candidates[0] if candidates else None
+
+def _mean_confidence(image, lang, config=""):
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    # 以每個詞的字數加權，沒有識別出文字的區塊（conf為-1）不計入
+    total = weight = 0.0
+    for conf, word in zip(data["conf"], data["text"]):
+        conf = float(conf)
+        word = str(word).strip()
+        if conf >= 0 and word:
+            total += conf * len(word)
+            weight += len(word)
+    return total / weight if weight else 0.0
+
+def detect_language(input_file, page_nums, dpi=OCR_DPI, poppler_path=None, candidates=None, config=""):
+    """
+    以一個樣本頁面偵測文檔的語言：用每個已安裝的候選組合識別樣本頁，選平均置信度最高的組合
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 要識別的頁碼（從1開始），取中間的一頁作為樣本
+    candidates (list): 候選語言組合，默認為available_language_candidates()
+
+    返回:
+    str: 選定的語言組合；沒有已安裝的候選組合時返回None
+    """
+    candidates = list(candidates) if candidates is not None else available_language_candidates()
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+    page_nums = sorted(set(page_nums))
+    if not page_nums:
+        return candidates[0]
+    sample = page_nums[len(page_nums) // 2]
+    scores = {}
+    try:
+        for _, image in render_page_set(input_file, [sample], dpi, _keep_image, poppler_path=poppler_path):
+            try:
+                scores = {lang: _mean_confidence(image, lang, config) for lang in candidates}
+            finally:
+                image.close()
+    except Exception:
+        # 樣本頁無法轉換或識別時不中斷提取，使用第一個候選組合
+        return candidates[0]
+    if not scores:
+        return candidates[0]
+    # 置信度相同時保留候選順序中較前的組合
+    return max(candidates, key=lambda lang: (scores[lang], -candidates.index(lang)))
+
+@contextmanager
+def _omp_thread_limit():
+    """
+    並行識別期間把tesseract的OpenMP線程數限制為1，最後一個識別結束後恢復原來的環境變量
+
+    pytesseract不支持為子進程傳入環境變量，只能臨時修改本進程的環境；
+    用戶已自行設置OMP_THREAD_LIMIT時不作改動
+    """
+    global _omp_limit_users
+    with _omp_limit_lock:
+        if _omp_limit_users == 0 and "OMP_THREAD_LIMIT" in os.environ:
+            managed = False
+        else:
+            managed = True
+            _omp_limit_users += 1
+            os.environ["OMP_THREAD_LIMIT"] = "1"
+    try:
+        yield
+    finally:
+        if managed:
+            with _omp_limit_lock:
+                _omp_limit_users -= 1
+                if _omp_limit_users == 0:
+                    os.environ.pop("OMP_THREAD_LIMIT", None)
+
+def ocr_image(image, lang=None, config=""):
+    """
+    識別單張圖像中的文字
+
+    lang為None時使用default_language()；語言只在每個進程中查詢一次，
+    不會在每頁嘗試多個語言組合
+    """
+    import pytesseract
+
+    if lang is None:
+        lang = default_language()
+    if lang is None:
+        return pytesseract.image_to_string(image, config=config)
+    return pytesseract.image_to_string(image, lang=lang, config=config)
+
+def _keep_image(page_num, image):
+    # render_page_set在返回後會關閉原圖像，識別在另一個線程中進行，需要保留一份
+    return image.copy()
+
+def ocr_pages(input_file, page_nums, lang=None, dpi=OCR_DPI, workers=None, poppler_path=None,
+              config="", progress_callback=None):
+    """
+    轉換並識別指定頁面
+
+    頁面轉換完成後立即交給識別線程，同時最多保留約兩倍識別線程數的頁面圖像；
+    多個tesseract並行時在每次識別期間把該進程的OpenMP線程數限制為1，避免互相爭用CPU
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    lang (str): tesseract語言，例如 "chi_tra+eng"；None時使用default_language()
+    dpi (int): 轉換分辨率
+    workers (int): 同時運行的tesseract進程數，默認為OCR_WORKERS
+    poppler_path (str): poppler所在目錄
+    config (str): 傳給tesseract的其他參數
+    progress_callback (callable): progress_callback(進度0~1, 文字)
+
+    返回:
+    generator: 按頁碼順序依次產生 (頁碼, 識別出的文字)
+    """
+    page_nums = sorted(set(page_nums))
+    if not page_nums:
+        return
+    workers = max(1, workers or OCR_WORKERS)
+    if lang is None:
+        lang = default_language()
+
+    ocr_pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    done = 0
+    rendered = render_page_set(input_file, page_nums, dpi, _keep_image, poppler_path=poppler_path)
+
+    def collect():
+        nonlocal done
+        page_num, future = pending.popleft()
+        text = future.result()
+        done += 1
+        report_progress(progress_callback, done / len(page_nums), f"已識別 {done}/{len(page_nums)} 頁")
+        return page_num, text
+
+    def recognize(image):
+        # 只在tesseract運行期間限制線程數，調用者提前放棄生成器時也不會一直保留限制
+        try:
+            with _omp_thread_limit() if workers > 1 else nullcontext():
+                return ocr_image(image, lang, config)
+        finally:
+            image.close()
+
+    try:
+        for page_num, image in rendered:
+            pending.append((page_num, ocr_pool.submit(recognize, image)))
+            # 識別跟不上轉換時先取出最早的結果，限制記憶體中的頁面數
+            while len(pending) >= workers * 2:
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        rendered.close()
+        for _, future in pending:
+            future.cancel()
+        ocr_pool.shutdown(wait=True, cancel_futures=True)
+
+def ocr_missing_pages(input_file, page_nums, text_layers, lang=None, dpi=OCR_DPI, workers=None,
+                      poppler_path=None, config="", progress_callback=None):
+    """
+    混合提取：已有文字層的頁面直接使用文字層，其餘頁面以OCR識別，按頁碼順序合併
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    text_layers (dict): 頁碼 -> 文字層中的文字，見text_layer.split_by_text_layer；不在其中的頁面使用OCR
+    其餘參數見ocr_pages，進度只按需要OCR的頁面計算
+
+    返回:
+    generator: 按頁碼順序依次產生 (頁碼, 文字, 是否使用了OCR)
+    """
+    page_nums = sorted(set(page_nums))
+    scanned_pages = [page_num for page_num in page_nums if page_num not in text_layers]
+    recognized = ocr_pages(input_file, scanned_pages, lang=lang, dpi=dpi, workers=workers,
+                           poppler_path=poppler_path, config=config, progress_callback=progress_callback)
+    try:
+        for page_num in page_nums:
+            if page_num in text_layers:
+                yield page_num, text_layers[page_num], False
+            else:
+                # ocr_pages同樣按頁碼順序返回，下一個結果就是這一頁
+                _, text = next(recognized)
+                yield page_num, text, True
+    finally:
+        recognized.close()
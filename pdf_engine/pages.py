@@ -0,0 +1,52 @@
+# 頁面選擇：解析使用者輸入的頁數範圍，並把頁碼整理為連續的範圍
+def parse_page_selection(text, total_pages):
+    """
+    解析頁數範圍文字（例如 "1-5,7,9-12"）
+
+    參數:
+    text (str): 頁數範圍，以逗號分隔，每項為單個頁碼或「起始-結束」範圍，頁碼從1開始
+    total_pages (int): 文檔總頁數
+
+    返回:
+    list: 去除重複並排序後的頁碼（從1開始）
+
+    異常:
+    ValueError: 格式錯誤或頁碼超出範圍，錯誤信息可以直接顯示給使用者
+    """
+    page_nums = set()
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"無效的頁數: {part}")
+        if start < 1 or end > total_pages or start > end:
+            raise ValueError(f"無效的頁數範圍: {part}（文檔共 {total_pages} 頁）")
+        page_nums.update(range(start, end + 1))
+    if not page_nums:
+        raise ValueError("請至少指定一個頁碼")
+    return sorted(page_nums)
+
+def page_runs(page_nums, max_length=None):
+    """
+    把頁碼分成連續的範圍
+
+    參數:
+    page_nums (iterable): 頁碼，會先去除重複並排序
+    max_length (int): 每個範圍最多的頁數，None表示不限制
+
+    返回:
+    list: 每個範圍為一個頁碼列表，例如 [1, 2, 3, 500] -> [[1, 2, 3], [500]]
+    """
+    runs = []
+    for page in sorted(set(page_nums)):
+        if runs and page == runs[-1][-1] + 1 and (max_length is None or len(runs[-1]) < max_length):
+            runs[-1].append(page)
+        else:
+            runs.append([page])
+    return runs
@@ -0,0 +1,276 @@
+# 並行頁面轉換：把頁面分成多個範圍，由多個進程同時轉換，再在線程池中編碼，按頁面順序返回結果
+# 轉換後端可選：
+#   pdfium  - pypdfium2在進程內直接轉換到記憶體，沒有臨時文件
+#   poppler - 每個範圍啟動一個pdftoppm子進程，經由臨時PPM文件傳遞圖像
+import os
+import math
+import shutil
+import atexit
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pikepdf
+from pdf2image import convert_from_path
+from PIL import Image
+
+from pdf_engine.pages import page_runs
+
+# pypdfium2可選，未安裝時只能使用poppler後端
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# 轉換後端：auto（有pypdfium2時使用pdfium，否則使用poppler）、pdfium或poppler
+RENDER_BACKEND = os.environ.get("PDF_TOOLKIT_RENDER_BACKEND", "auto").strip().lower()
+RENDER_BACKENDS = ("pdfium", "poppler")
+# 轉換進程數，默認為CPU核心數；實際數量還會受可用記憶體限制
+RENDER_WORKERS = int(os.environ.get("PDF_TOOLKIT_RENDER_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+# 每個pdftoppm進程一次轉換的頁數
+RENDER_RUN_PAGES = 4
+# 最多使用可用記憶體的比例
+RENDER_MEMORY_FRACTION = 0.5
+
+# pdfium不是線程安全的，同一進程內（包括不同的Streamlit會話）的所有調用都要經過這個鎖
+PDFIUM_LOCK = threading.Lock()
+
+# pdfium轉換進程池，所有調用共用，避免每次轉換都重新啟動進程
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def _pdfium_process_pool(workers):
+    """返回至少有workers個進程的共用進程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None and _process_pool._max_workers < workers:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+        if _process_pool is None:
+            # 使用spawn避免在Streamlit的多線程進程中fork（其他線程可能正持有PDFIUM_LOCK或在pdfium內部）
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max(workers, RENDER_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+def _discard_process_pool(pool):
+    # 工作進程異常退出後進程池不能再使用，下次調用時重新創建
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+def _shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(_shutdown_process_pool)
+
+def resolve_backend(backend=None):
+    """
+    決定實際使用的轉換後端
+
+    參數:
+    backend (str): auto、pdfium或poppler，None時使用RENDER_BACKEND
+
+    返回:
+    str: pdfium或poppler
+    """
+    backend = (backend or RENDER_BACKEND).lower()
+    if backend == "auto":
+        return "pdfium" if pdfium is not None else "poppler"
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"未知的轉換後端: {backend}")
+    if backend == "pdfium" and pdfium is None:
+        raise ValueError("未安裝pypdfium2，無法使用pdfium轉換後端")
+    return backend
+
+def pdfium_render(input_file, pages, dpi):
+    """
+    以pdfium在當前進程內轉換頁面（調用者需持有PDFIUM_LOCK或位於單獨的進程中）
+
+    返回:
+    list: 每頁一個RGB PIL圖像
+    """
+    images = []
+    pdf = pdfium.PdfDocument(input_file)
+    try:
+        for page_index in pages:
+            page = pdf[page_index]
+            try:
+                images.append(page.render(scale=dpi / 72).to_pil())
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+    return images
+
+def _pdfium_render_raw(input_file, pages, dpi):
+    # 在工作進程中執行，返回可跨進程傳遞的原始像素
+    return [(image.mode, image.size, image.tobytes()) for image in pdfium_render(input_file, pages, dpi)]
+
+def available_memory():
+    """返回可用的物理記憶體位元組數，無法取得時返回None"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def page_pixel_bytes(input_file, dpi, pages=None):
+    """估算指定DPI下最大一頁的RGB點陣大小（位元組）"""
+    largest = 0
+    with pikepdf.open(input_file) as pdf:
+        indices = range(len(pdf.pages)) if pages is None else pages
+        for index in indices:
+            try:
+                box = [float(v) for v in pdf.pages[index].mediabox]
+                width, height = abs(box[2] - box[0]), abs(box[3] - box[1])
+            except Exception:
+                # 無法讀取頁面大小時按A4計算
+                width, height = 595, 842
+            largest = max(largest, width * height)
+    return int(largest / (72 * 72) * dpi * dpi * 3)
+
+def render_worker_count(input_file, dpi, workers=None, pages=None, pages_per_worker=2):
+    """
+    決定並行轉換的進程數：不超過設定值、CPU核心數和頁面範圍數，並保證點陣圖不超出可用記憶體
+
+    pages_per_worker為每個工作單位同時在記憶體中持有的頁數；默認的兩頁對應poppler
+    （pdftoppm正在轉換的一頁和編碼線程正在處理的一頁，其餘頁面在磁碟上等待編碼）
+    """
+    workers = max(1, workers or RENDER_WORKERS)
+    memory = available_memory()
+    if memory:
+        try:
+            per_worker = pages_per_worker * max(1, page_pixel_bytes(input_file, dpi, pages))
+            workers = min(workers, max(1, int(memory * RENDER_MEMORY_FRACTION // per_worker)))
+        except Exception:
+            pass
+    return workers
+
+def _load_and_encode(page, source, encode):
+    # source為poppler輸出的文件路徑、pdfium的PIL圖像，或工作進程返回的原始像素
+    if isinstance(source, str):
+        try:
+            with Image.open(source) as image:
+                image.load()
+                return encode(page, image)
+        finally:
+            try:
+                os.remove(source)
+            except OSError:
+                pass
+    image = source if isinstance(source, Image.Image) else Image.frombytes(*source)
+    try:
+        return encode(page, image)
+    finally:
+        image.close()
+
+def render_pages(input_file, pages, dpi, encode, poppler_path=None, workers=None, work_dir=None, backend=None):
+    """
+    並行轉換頁面並編碼，按頁碼順序返回結果
+
+    參數:
+    input_file (str): PDF文件路徑
+    pages (iterable): 要轉換的頁面索引（從0開始）
+    dpi (int): 轉換分辨率
+    encode (callable): encode(頁面索引, PIL圖像) -> 結果，在線程池中執行；圖像在返回後即被關閉
+    poppler_path (str): poppler所在目錄
+    workers (int): 並行進程數，默認由render_worker_count決定
+    work_dir (str): 存放中間點陣圖的目錄（只有poppler後端使用）
+    backend (str): 轉換後端，見resolve_backend
+
+    返回:
+    generator: 依次產生 (頁面索引, encode的結果)
+    """
+    pages = sorted(set(pages))
+    if not pages:
+        return
+    backend = resolve_backend(backend)
+    # pdfium一次返回整個範圍的原始像素，等待編碼時都留在記憶體中；
+    # 下面每個工作單位預先提交兩個範圍，因此最多持有兩個範圍的頁面
+    pages_per_worker = 2 * RENDER_RUN_PAGES if backend == "pdfium" else 2
+    workers = render_worker_count(input_file, dpi, workers, pages, pages_per_worker)
+    # 頁數較少時縮小每個範圍，讓所有進程都有工作
+    run_pages = max(1, min(RENDER_RUN_PAGES, math.ceil(len(pages) / workers)))
+    # 不連續的頁面分在不同範圍，中間的頁面不會被轉換
+    runs = page_runs(pages, run_pages)
+    workers = min(workers, len(runs))
+    temp_dir = tempfile.mkdtemp(prefix="render_", dir=work_dir) if backend == "poppler" else None
+    render_pool = ThreadPoolExecutor(max_workers=workers)
+    encode_pool = ThreadPoolExecutor(max_workers=workers)
+    # pdfium不能在同一進程內並行，多個工作單位時每個範圍交給共用進程池中的進程轉換
+    process_pool = _pdfium_process_pool(workers) if backend == "pdfium" and workers > 1 else None
+
+    def render_run(run):
+        if backend == "poppler":
+            # 每次調用都會啟動一個獨立的pdftoppm進程
+            sources = convert_from_path(
+                input_file, dpi=dpi, first_page=run[0] + 1, last_page=run[-1] + 1,
+                poppler_path=poppler_path, output_folder=temp_dir, fmt="ppm",
+                output_file=f"run{run[0]}_", paths_only=True
+            )
+        elif process_pool is not None:
+            try:
+                sources = process_pool.submit(_pdfium_render_raw, input_file, run, dpi).result()
+            except BrokenProcessPool:
+                _discard_process_pool(process_pool)
+                raise
+        else:
+            with PDFIUM_LOCK:
+                sources = pdfium_render(input_file, run, dpi)
+        # 轉換完成後立即開始編碼，不必等待前面的範圍被取用
+        return [encode_pool.submit(_load_and_encode, page, source, encode) for page, source in zip(run, sources)]
+
+    pending = deque()
+    run_iter = iter(runs)
+
+    def submit_next():
+        run = next(run_iter, None)
+        if run is not None:
+            pending.append((run, render_pool.submit(render_run, run)))
+
+    try:
+        # 只預先提交有限數量的範圍，避免中間點陣圖佔滿磁碟
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            run, future = pending.popleft()
+            encoded = future.result()
+            submit_next()
+            for page, encode_future in zip(run, encoded):
+                yield page, encode_future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        render_pool.shutdown(wait=True, cancel_futures=True)
+        encode_pool.shutdown(wait=True, cancel_futures=True)
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def render_page_set(input_file, page_nums, dpi, encode, poppler_path=None, workers=None, work_dir=None, backend=None):
+    """
+    轉換一組頁碼（從1開始，例如parse_page_selection的結果），只轉換選中的頁面
+
+    encode(頁碼, PIL圖像) 收到的是真實頁碼；其他參數與render_pages相同
+
+    返回:
+    generator: 按頁碼順序依次產生 (頁碼, encode的結果)
+    """
+    for page_index, result in render_pages(
+        input_file, [page_num - 1 for page_num in page_nums], dpi,
+        lambda page_index, image: encode(page_index + 1, image),
+        poppler_path=poppler_path, workers=workers, work_dir=work_dir, backend=backend
+    ):
+        yield page_index + 1, result
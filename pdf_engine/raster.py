@@ -0,0 +1,326 @@
+# 光柵化壓縮引擎：把PDF頁面轉換為圖像再組合為PDF（舊版壓縮使用）
+# 自動模式會以多個DPI反覆嘗試，頁面只以最高DPI轉換一次，其他DPI由母版縮小得到
+import os
+import shutil
+import tempfile
+import threading
+import pikepdf
+from PIL import Image
+
+from pdf_engine.sampling import extrapolate_by_pages
+from pdf_engine.image_pdf import ImagePdfWriter, encode_page_image
+from pdf_engine.parallel_render import render_pages
+
+# 自動模式搜索DPI的上下限
+AUTO_MIN_DPI = 72
+AUTO_MAX_DPI = 300
+# 順序讀取時快取未命中預先轉換的頁數
+RENDER_CHUNK_PAGES = 8
+# 二維搜索嘗試的JPEG質量（由高到低）及最低可接受質量
+AUTO_QUALITY_STEPS = (95, 85, 75, 65, 55, 45, 35)
+AUTO_MIN_QUALITY = 35
+# 評估保真度時，JPEG質量每降低1約等於損失0.5%的有效分辨率，轉為灰階約等於損失10%
+QUALITY_FIDELITY_COST = 0.005
+GRAYSCALE_FIDELITY_COST = 0.10
+
+class PageRenderCache:
+    """
+    頁面轉換快取：每頁只以master_dpi轉換一次，母版以快速壓縮的PNG保存在磁碟上，
+    其他DPI的頁面由母版以Pillow縮小得到，比重新調用poppler轉換快得多
+
+    用法:
+    with PageRenderCache(input_file, 300, poppler_path, work_dir) as cache:
+        image = cache.get(0, 150)
+    """
+
+    def __init__(self, input_file, master_dpi=AUTO_MAX_DPI, poppler_path=None, work_dir=None):
+        self.input_file = input_file
+        self.master_dpi = master_dpi
+        self.poppler_path = poppler_path
+        self.cache_dir = tempfile.mkdtemp(prefix="render_cache_", dir=work_dir)
+        self._masters = {}  # 頁面索引（從0開始） -> 母版PNG路徑
+        self._last_page = None  # 上一次get的頁面，用於判斷是否順序讀取
+        self._lock = threading.Lock()
+        with pikepdf.open(input_file) as pdf:
+            self.page_count = len(pdf.pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._masters = {}
+
+    def prefetch(self, pages=None):
+        """轉換尚未快取的頁面"""
+        if pages is None:
+            pages = range(self.page_count)
+        with self._lock:
+            missing = [p for p in set(pages) if p not in self._masters]
+            
+            def save_master(page, image):
+                path = os.path.join(self.cache_dir, f"page_{page}.png")
+                image.convert("RGB").save(path, "PNG", compress_level=1)
+                return path
+            
+            # 連續的頁面合併為一次pdftoppm調用，多個範圍並行轉換
+            for page, path in render_pages(self.input_file, missing, self.master_dpi, save_master,
+                                           poppler_path=self.poppler_path, work_dir=self.cache_dir):
+                self._masters[page] = path
+
+    def get(self, page, dpi):
+        """
+        返回指定頁面在指定DPI下的RGB圖像
+
+        參數:
+        page (int): 頁面索引（從0開始）
+        dpi (int): 所需DPI，高於master_dpi時返回母版大小的圖像
+
+        返回:
+        PIL.Image: RGB圖像
+        """
+        if page not in self._masters:
+            if self._last_page is not None and page == self._last_page + 1:
+                # 順序讀取時預先轉換後面的頁面，減少poppler調用次數
+                self.prefetch(range(page, min(self.page_count, page + RENDER_CHUNK_PAGES)))
+            else:
+                # 跳躍讀取（例如抽樣頁面）時只轉換這一頁，多個頁面應先以prefetch一次轉換
+                self.prefetch([page])
+        self._last_page = page
+        with Image.open(self._masters[page]) as master:
+            master.load()
+            if dpi >= self.master_dpi:
+                return master.copy()
+            scale = dpi / self.master_dpi
+            size = (max(1, round(master.width * scale)), max(1, round(master.height * scale)))
+            # reducing_gap先以整數倍快速縮小，再用LANCZOS處理餘下部分
+            return master.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+# 將PDF轉換為JPEG圖像後重新組合為PDF，返回輸出大小(KB)
+def render_to_pdf(input_file, output_path, dpi, poppler_path, work_dir=None, render_cache=None, workers=None,
+                  quality=None, subsampling=None, bilevel=False, grayscale=False):
+    """
+    轉換頁面、編碼為JPEG並按頁面順序直接寫入輸出PDF，峰值記憶體只與同時處理的頁數有關
+
+    work_dir (str): 存放中間點陣圖的目錄
+    render_cache (PageRenderCache): 可選，提供時從快取的母版縮小得到頁面，不再調用poppler
+    workers (int): 並行轉換的進程數，默認由render_worker_count決定
+    quality (int): JPEG質量，None時使用Pillow的默認值
+    subsampling (int): JPEG色度抽樣，0為4:4:4、1為4:2:2、2為4:2:0
+    bilevel (bool): 只有黑白兩色的頁面改用CCITT Group 4編碼
+    grayscale (bool): 以灰階JPEG編碼
+    """
+    def encode(page, image):
+        return encode_page_image(image.convert("RGB"), quality, subsampling, bilevel, grayscale)
+    
+    with ImagePdfWriter(output_path) as writer:
+        if render_cache is not None:
+            for page in range(render_cache.page_count):
+                image = render_cache.get(page, dpi)
+                writer.add_encoded(encode(page, image), dpi)
+                image.close()
+        else:
+            with pikepdf.open(input_file) as pdf:
+                page_count = len(pdf.pages)
+            for _, encoded in render_pages(
+                input_file, range(page_count), dpi, encode,
+                poppler_path=poppler_path, workers=workers, work_dir=work_dir
+            ):
+                writer.add_encoded(encoded, dpi)
+    
+    return os.path.getsize(output_path) / 1024
+
+# 只轉換抽樣頁面，推算整份文檔轉換後的大小(KB)
+def estimate_rendered_size(input_file, plan, dpi, poppler_path, render_cache=None,
+                           quality=None, subsampling=None, bilevel=False, grayscale=False):
+    def encoded_size(page, image):
+        return len(encode_page_image(image.convert("RGB"), quality, subsampling, bilevel, grayscale)[1]) / 1024
+    
+    if render_cache is not None:
+        # 抽樣頁面不連續，一次轉換所有尚未快取的抽樣頁面，不預讀其後的頁面
+        render_cache.prefetch(plan["pages"])
+        page_sizes = {page: encoded_size(page, render_cache.get(page, dpi)) for page in plan["pages"]}
+    else:
+        page_sizes = dict(render_pages(input_file, plan["pages"], dpi, encoded_size, poppler_path=poppler_path))
+    return extrapolate_by_pages(plan, page_sizes)
+
+def find_target_dpi(measure, start_dpi, target_size, max_attempts=15, log=None):
+    """
+    自動尋找輸出大小最接近但不超過目標大小的DPI
+
+    參數:
+    measure (callable): measure(dpi) -> 輸出大小(KB)
+    start_dpi (int): 初始DPI
+    target_size (float): 目標大小(KB)
+    max_attempts (int): 最多嘗試次數
+    log (callable): 可選，用於輸出進度信息
+
+    返回:
+    tuple: (選定的DPI, 選定DPI對應的大小KB, 最後一次測量使用的DPI)
+    """
+    current_dpi = start_dpi
+    attempt = 0
+    measured_dpi = None
+    output_size = None
+
+    # 階段1: 找到一個小於目標大小的DPI
+    last_success_dpi = 0
+    last_success_size = 0
+
+    while attempt < max_attempts:
+        attempt += 1
+        if log:
+            log(f"嘗試 #{attempt}，使用DPI: {current_dpi}")
+
+        output_size = measure(current_dpi)
+        measured_dpi = current_dpi
+
+        if output_size <= target_size:
+            # 達到了目標大小以下，記錄這個DPI和大小
+            last_success_dpi = current_dpi
+            last_success_size = output_size
+
+            # 結束條件: 已達到最小DPI或已非常接近目標大小
+            if current_dpi >= AUTO_MAX_DPI or (target_size - output_size) < target_size * 0.05:
+                if log:
+                    log("已找到最佳DPI設定")
+                break
+
+            # 嘗試更高一點的DPI，看能否更接近目標大小
+            next_dpi = min(AUTO_MAX_DPI, int(current_dpi * 1.1))
+            if next_dpi == current_dpi:
+                next_dpi += 5  # 確保至少增加一點
+            current_dpi = next_dpi
+        else:
+            # 超過目標大小，需要降低DPI
+            if last_success_dpi > 0:
+                # 我們之前已找到一個成功的DPI，找最大的可行值
+                current_dpi = int((last_success_dpi + current_dpi) / 2)
+                # 如果差距很小，就結束嘗試
+                if abs(current_dpi - last_success_dpi) <= 2:
+                    if log:
+                        log(f"確定最終DPI: {last_success_dpi}")
+                    break
+            else:
+                # 首次嘗試就超過目標大小，大幅降低DPI
+                size_ratio = output_size / target_size
+                current_dpi = max(AUTO_MIN_DPI, int(current_dpi / size_ratio))
+
+    # 如果最後一次嘗試超過目標，使用最後一次成功的設定
+    if last_success_dpi > 0 and last_success_dpi != measured_dpi:
+        return last_success_dpi, last_success_size, measured_dpi
+    return measured_dpi, output_size, measured_dpi
+
+def setting_fidelity(dpi, quality, grayscale=False):
+    """
+    估算一組轉換設定的保真度（以等效DPI表示），用於比較不同的DPI、JPEG質量和灰階組合
+
+    降低JPEG質量在較高質量時幾乎不影響可讀性，比降低分辨率划算；
+    參數QUALITY_FIDELITY_COST和GRAYSCALE_FIDELITY_COST決定兩者之間的換算
+    """
+    fidelity = dpi * (1 - QUALITY_FIDELITY_COST * (max(AUTO_QUALITY_STEPS) - quality))
+    if grayscale:
+        fidelity *= 1 - GRAYSCALE_FIDELITY_COST
+    return fidelity
+
+def find_target_settings(measure, target_size, max_quality=max(AUTO_QUALITY_STEPS), allow_grayscale=False,
+                         start_dpi=AUTO_MAX_DPI, attempts_per_setting=4, log=None):
+    """
+    同時搜索DPI、JPEG質量和灰階，找出輸出不超過目標大小且保真度最高的組合
+
+    對每個JPEG質量（由高到低）按「大小約與DPI平方成正比」預測並校正可行的最高DPI，
+    再以setting_fidelity比較各組合；較低質量即使用最高DPI也不可能更好時停止搜索。
+    配合PageRenderCache使用時每次嘗試只需縮小和重新編碼，不必重新轉換頁面
+
+    參數:
+    measure (callable): measure(dpi, quality, grayscale) -> 輸出大小(KB)
+    target_size (float): 目標大小(KB)
+    max_quality (int): 最高JPEG質量
+    allow_grayscale (bool): 是否允許轉為灰階
+    start_dpi (int): 第一次嘗試使用的DPI
+    attempts_per_setting (int): 每個質量最多嘗試的次數
+    log (callable): 可選，用於輸出進度信息
+
+    返回:
+    dict: dpi、quality、grayscale、size（KB）及 reached（是否達到目標），以及 measured（所有嘗試過的組合）
+    """
+    qualities = [q for q in AUTO_QUALITY_STEPS if AUTO_MIN_QUALITY <= q <= max_quality] or [max_quality]
+    measured = {}
+    best = None
+    smallest = None
+    # 已停止降低質量的顏色模式，以及各顏色模式上一個可行質量的保真度
+    stopped = set()
+    mode_fidelity = {}
+
+    def run(dpi, quality, grayscale):
+        key = (dpi, quality, grayscale)
+        if key not in measured:
+            if log:
+                log(f"嘗試 #{len(measured) + 1}，DPI: {dpi}，JPEG質量: {quality}{'，灰階' if grayscale else ''}")
+            measured[key] = measure(dpi, quality, grayscale)
+        return measured[key]
+
+    next_dpi = max(AUTO_MIN_DPI, min(AUTO_MAX_DPI, start_dpi))
+    for quality, grayscale in [(q, g) for g in ((False, True) if allow_grayscale else (False,)) for q in qualities]:
+        if grayscale in stopped:
+            continue
+        # 只有高於這個DPI才可能比已找到的組合更好
+        useful_dpi = AUTO_MIN_DPI
+        if best is not None:
+            useful_dpi = int(best["fidelity"] / setting_fidelity(1, quality, grayscale)) + 1
+            if useful_dpi > AUTO_MAX_DPI:
+                # 即使使用最高DPI也不比已找到的組合好，同一顏色模式下更低的質量也不會更好
+                stopped.add(grayscale)
+                continue
+            useful_dpi = max(AUTO_MIN_DPI, useful_dpi)
+        dpi = max(next_dpi, useful_dpi)
+        low_ok, high_fail = None, None
+        for _ in range(attempts_per_setting):
+            size = run(dpi, quality, grayscale)
+            if smallest is None or size < smallest["size"]:
+                smallest = {"dpi": dpi, "quality": quality, "grayscale": grayscale, "size": size}
+            if size <= target_size:
+                low_ok = (dpi, size)
+                if dpi >= AUTO_MAX_DPI or target_size - size < target_size * 0.05:
+                    break
+            else:
+                high_fail = dpi
+                if dpi <= useful_dpi:
+                    break
+            # 按大小與DPI平方成正比預測剛好達到目標的DPI，留少量餘量
+            predicted = int(dpi * (target_size / size) ** 0.5 * 0.98)
+            lower = low_ok[0] + 1 if low_ok else useful_dpi
+            upper = high_fail - 1 if high_fail else AUTO_MAX_DPI
+            predicted = max(lower, min(upper, predicted))
+            if predicted == dpi or lower > upper:
+                break
+            dpi = predicted
+
+        fidelity = setting_fidelity(low_ok[0], quality, grayscale) if low_ok else None
+        if grayscale in mode_fidelity and (fidelity is None or fidelity <= mode_fidelity[grayscale]):
+            # 保真度隨質量降低先升後降，降低質量已不能再提高保真度，同一顏色模式下不再繼續降低
+            stopped.add(grayscale)
+        if fidelity is not None:
+            mode_fidelity[grayscale] = fidelity
+            if best is None or fidelity > best["fidelity"]:
+                best = {"dpi": low_ok[0], "quality": quality, "grayscale": grayscale,
+                        "size": low_ok[1], "fidelity": fidelity}
+            # 較低質量可以使用更高的DPI，從這裡開始嘗試
+            next_dpi = min(AUTO_MAX_DPI, int(low_ok[0] * 1.15))
+        elif high_fail is not None:
+            next_dpi = high_fail
+
+    if best is None:
+        # 所有組合都超過目標大小，使用最小的結果
+        best = dict(smallest)
+        best["reached"] = False
+    else:
+        best["reached"] = True
+        best.pop("fidelity")
+    if log:
+        log(f"選定DPI: {best['dpi']}，JPEG質量: {best['quality']}{'，灰階' if best['grayscale'] else ''}")
+    best["measured"] = measured
+    return best
@@ -0,0 +1,102 @@
+# 轉換後端基準測試：比較pdfium和poppler在不同DPI下每頁的轉換時間
+#
+# 用法示例:
+#   python -m pdf_engine.render_benchmark report.pdf
+#   python -m pdf_engine.render_benchmark report.pdf --dpi 72 150 300 --pages 20 --workers 1 --encode jpeg
+#
+# 每個組合先轉換一頁預熱，再計時轉換所選頁面；--encode 同時計入編碼時間，更接近實際使用
+import sys
+import time
+import argparse
+import tempfile
+import pikepdf
+
+from pdf_engine.image_pdf import encode_jpeg
+from pdf_engine.parallel_render import RENDER_BACKENDS, pdfium, render_pages
+
+def _touch(page, image):
+    # 只轉換不編碼時，確保像素確實已經產生
+    return image.size
+
+def _jpeg(page, image):
+    return len(encode_jpeg(image.convert("RGB"))[0])
+
+ENCODERS = {"none": _touch, "jpeg": _jpeg}
+
+def benchmark(input_file, backend, dpi, pages, workers=1, encode="none", poppler_path=None):
+    """
+    計時以指定後端和DPI轉換頁面
+
+    參數:
+    input_file (str): PDF文件路徑
+    backend (str): pdfium或poppler
+    dpi (int): 轉換分辨率
+    pages (list): 頁面索引（從0開始）
+    workers (int): 並行數
+    encode (str): none只轉換，jpeg同時編碼為JPEG
+
+    返回:
+    dict: backend、dpi、pages、workers、seconds、ms_per_page、pages_per_second
+    """
+    encoder = ENCODERS[encode]
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 預熱：載入庫和文件、啟動進程池等一次性開銷不計入結果
+        for _ in render_pages(input_file, pages[:1], dpi, encoder, poppler_path=poppler_path,
+                              workers=1, work_dir=work_dir, backend=backend):
+            pass
+        start = time.perf_counter()
+        for _ in render_pages(input_file, pages, dpi, encoder, poppler_path=poppler_path,
+                              workers=workers, work_dir=work_dir, backend=backend):
+            pass
+        seconds = time.perf_counter() - start
+    return {
+        "backend": backend,
+        "dpi": dpi,
+        "pages": len(pages),
+        "workers": workers,
+        "seconds": seconds,
+        "ms_per_page": seconds * 1000 / len(pages),
+        "pages_per_second": len(pages) / seconds if seconds > 0 else float("inf"),
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m pdf_engine.render_benchmark",
+        description="比較不同轉換後端在各DPI下的每頁轉換時間"
+    )
+    parser.add_argument("input", help="用於測試的PDF文件")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[72, 150, 300], help="要測試的DPI（默認 72 150 300）")
+    parser.add_argument("--pages", type=int, default=10, help="測試的頁數，從第1頁開始（默認10）")
+    parser.add_argument("--backends", nargs="+", choices=RENDER_BACKENDS, default=None,
+                        help="要比較的後端，默認為所有可用的後端")
+    parser.add_argument("--workers", type=int, default=1, help="並行數（默認1，即比較單核速度）")
+    parser.add_argument("--encode", choices=sorted(ENCODERS), default="none",
+                        help="none只計轉換時間，jpeg同時計入JPEG編碼時間")
+    parser.add_argument("--poppler-path", default=None, help="poppler所在目錄")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    backends = args.backends or [b for b in RENDER_BACKENDS if b != "pdfium" or pdfium is not None]
+    with pikepdf.open(args.input) as pdf:
+        pages = list(range(min(args.pages, len(pdf.pages))))
+    if not pages:
+        print("文件沒有頁面", file=sys.stderr)
+        return 1
+
+    print(f"{'後端':<8}{'DPI':>6}{'頁數':>6}{'並行':>6}{'總時間(s)':>12}{'每頁(ms)':>12}{'頁/秒':>10}")
+    failed = False
+    for dpi in args.dpi:
+        for backend in backends:
+            try:
+                result = benchmark(args.input, backend, dpi, pages, args.workers, args.encode, args.poppler_path)
+            except Exception as e:
+                print(f"{backend:<8}{dpi:>6}  出錯: {e}")
+                failed = True
+                continue
+            print(f"{backend:<8}{dpi:>6}{result['pages']:>6}{result['workers']:>6}"
+                  f"{result['seconds']:>12.3f}{result['ms_per_page']:>12.1f}{result['pages_per_second']:>10.2f}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
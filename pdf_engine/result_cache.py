@@ -0,0 +1,219 @@
+# 處理結果快取模組：按輸入文件內容和處理參數快取輸出文件，多個Streamlit會話可共用同一個快取目錄
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+
+# 快取設置，可通過環境變量調整
+CACHE_ENABLED = os.environ.get("PDF_TOOLKIT_CACHE", "1") != "0"
+CACHE_DIR = os.environ.get("PDF_TOOLKIT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "pdf_toolkit_cache")
+CACHE_MAX_BYTES = int(float(os.environ.get("PDF_TOOLKIT_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+# 超過此時間的臨時寫入文件視為中斷的寫入，清理時一併刪除
+_STALE_TEMP_SECONDS = 3600
+# 每寫入多少次重新掃描一次快取目錄（其他進程也會寫入同一目錄，估計的大小會逐漸偏離實際）
+_EVICT_SCAN_WRITES = 200
+
+# 本進程估計的快取總大小，None表示尚未掃描；寫入時累加，超過上限時才掃描目錄並淘汰
+_cache_bytes = None
+_writes_since_scan = 0
+_size_lock = threading.Lock()
+
+# 由其他模組自行管理大小的命名空間（例如正被其他會話打開的SQLite索引），evict不會刪除其中的文件
+_unmanaged_namespaces = set()
+
+# 文件哈希記憶：(路徑, 大小, 修改時間) -> sha256，避免同一輸入被重複讀取
+_hash_memo = {}
+_hash_lock = threading.Lock()
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """分塊計算文件的SHA-256，同一文件未修改時直接返回記憶的結果"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    result = digest.hexdigest()
+
+    with _hash_lock:
+        if len(_hash_memo) > 256:
+            _hash_memo.clear()
+        _hash_memo[memo_key] = result
+    return result
+
+def remember_sha256(path, sha256):
+    """登記已在其他地方計算過的文件哈希（例如上傳時邊寫邊算），之後不必再讀取整個文件"""
+    stat = os.stat(path)
+    with _hash_lock:
+        _hash_memo[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = sha256
+
+def make_cache_key(input_file, params):
+    """
+    根據輸入文件內容和處理參數生成快取鍵
+
+    參數:
+    input_file (str): 輸入文件路徑
+    params (dict): 會影響輸出的所有參數，必須可以序列化為JSON
+
+    返回:
+    str: 十六進制的SHA-256快取鍵
+    """
+    payload = json.dumps(
+        {"input": file_sha256(input_file), "params": params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _entry_path(key, namespace):
+    return os.path.join(CACHE_DIR, namespace, key)
+
+def cache_get(key, output_file, namespace="process_pdf"):
+    """
+    如果快取中有對應的結果，複製到output_file並返回True
+
+    命中時會更新快取文件的修改時間，作為LRU淘汰的依據
+    """
+    if not CACHE_ENABLED:
+        return False
+    entry = _entry_path(key, namespace)
+    try:
+        shutil.copyfile(entry, output_file)
+    except OSError:
+        return False
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    return True
+
+def cache_put(key, source_file, namespace="process_pdf"):
+    """
+    將source_file存入快取
+
+    先寫入同目錄下的臨時文件再原子替換，其他會話不會讀到寫了一半的文件
+    """
+    if not CACHE_ENABLED:
+        return False
+    try:
+        size = os.path.getsize(source_file)
+        if size > CACHE_MAX_BYTES:
+            return False
+        directory = os.path.join(CACHE_DIR, namespace)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(source_file, "rb") as src:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(temp_path, _entry_path(key, namespace))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    except OSError:
+        return False
+
+    # 使用寫入前測量的大小：替換後的文件可能已被其他會話的淘汰刪除，寫入快取失敗不能影響調用者
+    record_cache_write(size)
+    return True
+
+def record_cache_write(size):
+    """
+    記錄寫入快取目錄的位元組數，估計的總大小超過上限或累計寫入一定次數後才掃描目錄並淘汰
+
+    直接在快取目錄中寫入、可以隨時被淘汰的文件也應調用此函數；不能隨時刪除的文件見exclude_from_eviction
+    """
+    global _cache_bytes, _writes_since_scan
+    with _size_lock:
+        _writes_since_scan += 1
+        if _cache_bytes is not None:
+            _cache_bytes += max(0, size)
+        needs_scan = (
+            _cache_bytes is None
+            or _cache_bytes > CACHE_MAX_BYTES
+            or _writes_since_scan >= _EVICT_SCAN_WRITES
+        )
+    if needs_scan:
+        evict()
+
+def exclude_from_eviction(namespace):
+    """不在evict中掃描或刪除指定命名空間，該命名空間的大小由使用它的模組自行管理"""
+    _unmanaged_namespaces.add(namespace)
+
+def evict(max_bytes=None):
+    """按最近使用時間淘汰快取文件，直到總大小不超過上限的90%"""
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+
+    entries = []
+    total = 0
+    now = time.time()
+    try:
+        namespaces = [e.path for e in os.scandir(CACHE_DIR)
+                      if e.is_dir() and e.name not in _unmanaged_namespaces]
+    except OSError:
+        return
+
+    for namespace in namespaces:
+        try:
+            scanned = list(os.scandir(namespace))
+        except OSError:
+            continue
+        for entry in scanned:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.startswith(".tmp-"):
+                # 清理中斷的寫入
+                if now - stat.st_mtime > _STALE_TEMP_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        _set_scanned_size(total)
+        return
+
+    entries.sort()
+    limit = max_bytes * 0.9
+    for mtime, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            total -= size
+        except OSError:
+            # Windows上正被其他會話讀取的文件無法刪除，跳過
+            continue
+    _set_scanned_size(total)
+
+def _set_scanned_size(total):
+    global _cache_bytes, _writes_since_scan
+    with _size_lock:
+        _cache_bytes = total
+        _writes_since_scan = 0
+
+def clear_cache(namespace=None):
+    """刪除整個快取目錄或指定命名空間"""
+    global _cache_bytes
+    target = os.path.join(CACHE_DIR, namespace) if namespace else CACHE_DIR
+    shutil.rmtree(target, ignore_errors=True)
+    with _size_lock:
+        _cache_bytes = None
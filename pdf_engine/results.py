@@ -0,0 +1,31 @@
+# 處理結果的統一格式：引擎函數不直接顯示任何提示，而是把結果、警告和錯誤放在字典中返回
+import os
+
+def make_result(output_file=None, error=None, warnings=None, **details):
+    """
+    生成處理結果字典
+
+    參數:
+    output_file (str): 輸出文件路徑，處理失敗時為None
+    error (str): 錯誤信息，成功時為None
+    warnings (list): 處理過程中的警告（例如回退到備用方法）
+    details: 其他與具體處理相關的信息
+
+    返回:
+    dict: 至少包含 success、output_file、output_bytes、error、warnings
+    """
+    success = error is None and bool(output_file) and os.path.exists(output_file)
+    result = {
+        "success": success,
+        "output_file": output_file if success else None,
+        "output_bytes": os.path.getsize(output_file) if success else 0,
+        "error": error if error is not None or success else "沒有生成輸出文件",
+        "warnings": list(warnings or []),
+    }
+    result.update(details)
+    return result
+
+def report_progress(progress_callback, value=None, message=None):
+    """調用進度回調 progress_callback(進度0~1或None, 文字或None)，未提供回調時忽略"""
+    if progress_callback is not None:
+        progress_callback(value, message)
@@ -0,0 +1,152 @@
+# 抽樣頁面估算模組：從文檔中抽取具代表性的頁面，先壓縮樣本再推算整份文檔的大小
+import pikepdf
+
+# 頁數達到此值才使用抽樣估算，頁數較少時直接處理整份文檔更準確
+SAMPLE_MIN_PAGES = 30
+# 分層數量（按圖像密度）
+SAMPLE_STRATA = 4
+
+def default_sample_count(total_pages):
+    """根據總頁數決定抽樣頁數，約為總頁數的2%，介於4到12頁之間"""
+    return max(4, min(12, total_pages // 50))
+
+def _stream_length(obj):
+    """讀取流對象的壓縮後長度，不解碼流內容"""
+    try:
+        return int(obj.get("/Length", 0))
+    except Exception:
+        return 0
+
+def _xobject_image_bytes(resources, seen, depth=0):
+    """統計資源字典中圖像XObject的位元組數，會遞歸進入表單XObject"""
+    total = 0
+    if resources is None or depth > 4:
+        return total
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return total
+    for name in list(xobjects.keys()):
+        xobj = xobjects[name]
+        try:
+            key = xobj.objgen
+        except Exception:
+            key = None
+        if key is not None and key != (0, 0):
+            if key in seen:
+                continue
+            seen.add(key)
+        subtype = xobj.get("/Subtype")
+        if subtype == "/Image":
+            total += _stream_length(xobj)
+        elif subtype == "/Form":
+            total += _stream_length(xobj)
+            total += _xobject_image_bytes(xobj.get("/Resources"), seen, depth + 1)
+    return total
+
+def page_weights(pdf_path):
+    """
+    估算每頁的數據量
+
+    參數:
+    pdf_path (str): PDF文件路徑
+
+    返回:
+    list: 每頁一個 (圖像位元組數, 總位元組數) 元組，頁碼從0開始
+    """
+    weights = []
+    with pikepdf.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            image_bytes = _xobject_image_bytes(page.obj.get("/Resources"), set())
+            contents = page.obj.get("/Contents")
+            content_bytes = 0
+            if isinstance(contents, pikepdf.Array):
+                content_bytes = sum(_stream_length(c) for c in contents)
+            elif contents is not None:
+                content_bytes = _stream_length(contents)
+            # 每頁加上固定開銷，避免空白頁權重為0
+            weights.append((image_bytes, image_bytes + content_bytes + 1024))
+    return weights
+
+def plan_sample(pdf_path, sample_count=None, strata=SAMPLE_STRATA):
+    """
+    按圖像密度分層抽取代表性頁面
+
+    參數:
+    pdf_path (str): PDF文件路徑
+    sample_count (int): 抽樣頁數，默認由default_sample_count決定
+    strata (int): 分層數量
+
+    返回:
+    dict: {
+        "pages": 抽樣頁碼列表（從0開始，按文檔順序）,
+        "groups": 每個分層包含的頁碼列表,
+        "total_weight": 整份文檔的總權重,
+        "sample_weight": 樣本頁的總權重
+    }
+    """
+    weights = page_weights(pdf_path)
+    total_pages = len(weights)
+    if sample_count is None:
+        sample_count = default_sample_count(total_pages)
+    sample_count = max(1, min(sample_count, total_pages))
+    strata = max(1, min(strata, sample_count))
+
+    # 按圖像密度排序後等分為若干層
+    by_density = sorted(range(total_pages), key=lambda i: (weights[i][0], i))
+    groups = []
+    for s in range(strata):
+        start = s * total_pages // strata
+        end = (s + 1) * total_pages // strata
+        if end > start:
+            groups.append(sorted(by_density[start:end]))
+
+    # 每層按頁數比例分配樣本，每層至少一頁，在層內按文檔順序均勻選取
+    pages = []
+    for group in groups:
+        count = max(1, round(sample_count * len(group) / total_pages))
+        count = min(count, len(group))
+        for k in range(count):
+            pages.append(group[(2 * k + 1) * len(group) // (2 * count)])
+    pages = sorted(set(pages))
+
+    return {
+        "pages": pages,
+        "groups": groups,
+        "total_weight": sum(w[1] for w in weights),
+        "sample_weight": sum(weights[i][1] for i in pages)
+    }
+
+def build_sample_pdf(pdf_path, pages, output_path):
+    """將指定頁面（從0開始）複製到新的PDF文件"""
+    with pikepdf.open(pdf_path) as src:
+        dst = pikepdf.new()
+        for i in pages:
+            dst.pages.append(src.pages[i])
+        dst.save(output_path)
+    return output_path
+
+def extrapolate_by_weight(plan, sample_size):
+    """按權重比例由整個樣本文件的大小推算整份文檔的大小"""
+    if plan["sample_weight"] <= 0:
+        return sample_size
+    return sample_size * plan["total_weight"] / plan["sample_weight"]
+
+def extrapolate_by_pages(plan, page_sizes):
+    """
+    由每個樣本頁的大小推算整份文檔的大小：每層以樣本頁平均大小乘以該層頁數
+
+    參數:
+    plan (dict): plan_sample的返回值
+    page_sizes (dict): {頁碼(從0開始): 大小}
+    """
+    total = 0
+    for group in plan["groups"]:
+        sizes = [page_sizes[i] for i in group if i in page_sizes]
+        if sizes:
+            total += sum(sizes) / len(sizes) * len(group)
+    # 若某層沒有樣本（理論上不會發生），以全部樣本平均值補足
+    measured_groups = sum(len(g) for g in plan["groups"] if any(i in page_sizes for i in g))
+    missing = sum(len(g) for g in plan["groups"]) - measured_groups
+    if missing and page_sizes:
+        total += sum(page_sizes.values()) / len(page_sizes) * missing
+    return total
@@ -0,0 +1,375 @@
+# 分段並行處理模組：將大型PDF按頁面範圍拆分，分別處理後重新合併
+# 合併時去除各分段之間重複的字體和圖像，並按原始文檔恢復書籤和連結
+import os
+import hashlib
+import pikepdf
+from pdf_engine.sampling import page_weights
+
+# 頁數達到此值才分段處理
+SHARD_MIN_PAGES = 500
+# 每個分段最少頁數，分段太小時Ghostscript的啟動和合併開銷會抵消並行的收益
+SHARD_MIN_SHARD_PAGES = 50
+
+def count_pages(pdf_path):
+    """返回PDF頁數，無法讀取時返回0"""
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return 0
+
+def plan_shards(pdf_path, workers, min_pages=SHARD_MIN_PAGES, min_shard_pages=SHARD_MIN_SHARD_PAGES):
+    """
+    按頁面數據量把文檔劃分為連續的頁面範圍
+
+    參數:
+    pdf_path (str): PDF文件路徑
+    workers (int): 並行處理的數量
+    min_pages (int): 頁數少於此值時不分段
+    min_shard_pages (int): 每個分段最少頁數
+
+    返回:
+    list: [(起始頁, 結束頁), ...]，頁碼從0開始、不含結束頁；不需要分段時返回空列表
+    """
+    total_pages = count_pages(pdf_path)
+    if workers < 2 or total_pages < min_pages:
+        return []
+
+    shard_count = min(workers, total_pages // min_shard_pages)
+    if shard_count < 2:
+        return []
+
+    # 按每頁數據量累計，使各分段的處理量大致相同
+    weights = [w[1] for w in page_weights(pdf_path)]
+    total_weight = sum(weights)
+    ranges = []
+    start = 0
+    accumulated = 0
+    for i, weight in enumerate(weights):
+        accumulated += weight
+        remaining_shards = shard_count - len(ranges) - 1
+        remaining_pages = total_pages - (i + 1)
+        if remaining_shards <= 0:
+            break
+        boundary = total_weight * (len(ranges) + 1) / shard_count
+        if (accumulated >= boundary and i + 1 - start >= min_shard_pages
+                and remaining_pages >= remaining_shards * min_shard_pages):
+            ranges.append((start, i + 1))
+            start = i + 1
+    ranges.append((start, total_pages))
+    return ranges
+
+def split_pdf(pdf_path, ranges, output_dir):
+    """
+    將文檔按頁面範圍拆分為多個文件
+
+    返回:
+    list: 分段文件路徑，與ranges順序相同
+    """
+    shard_files = []
+    with pikepdf.open(pdf_path) as src:
+        for index, (start, end) in enumerate(ranges):
+            shard = pikepdf.new()
+            shard.pages.extend(src.pages[start:end])
+            shard_file = os.path.join(output_dir, f"shard_{index:03d}.pdf")
+            shard.save(shard_file)
+            shard_files.append(shard_file)
+    return shard_files
+
+def _import_object(out, obj):
+    """把其他文檔中的對象複製到out，間接對象使用copy_foreign"""
+    if isinstance(obj, pikepdf.Object) and obj.is_indirect:
+        return out.copy_foreign(obj)
+    if isinstance(obj, pikepdf.Dictionary):
+        return pikepdf.Dictionary({key: _import_object(out, obj[key]) for key in obj.keys()})
+    if isinstance(obj, pikepdf.Array):
+        return pikepdf.Array([_import_object(out, item) for item in obj])
+    return obj
+
+def _remap_dest(out, dest, page_map):
+    """把目標中指向原始頁面的引用換成輸出文檔的對應頁面；命名目標保持不變"""
+    if isinstance(dest, pikepdf.Dictionary) and "/D" in dest:
+        return pikepdf.Dictionary({"/D": _remap_dest(out, dest.D, page_map)})
+    if isinstance(dest, pikepdf.Array) and len(dest) > 0:
+        target = dest[0]
+        if isinstance(target, pikepdf.Dictionary) and target.is_indirect:
+            index = page_map.get(target.objgen)
+            if index is None:
+                return None
+            return pikepdf.Array([out.pages[index].obj] + [_import_object(out, item) for item in list(dest)[1:]])
+        return _import_object(out, dest)
+    return _import_object(out, dest)
+
+def _remap_action(out, action, page_map):
+    """複製動作字典，GoTo動作的目標重新指向輸出文檔的頁面"""
+    if not isinstance(action, pikepdf.Dictionary):
+        return None
+    if action.get("/S") == "/GoTo" and "/D" in action:
+        dest = _remap_dest(out, action.D, page_map)
+        if dest is None:
+            return None
+        return pikepdf.Dictionary({"/S": pikepdf.Name.GoTo, "/D": dest})
+    copied = pikepdf.Dictionary()
+    for key in action.keys():
+        if key != "/Next":
+            copied[key] = _import_object(out, action[key])
+    return copied
+
+def _copy_outline_items(out, first, parent, page_map, depth=0):
+    """遞歸複製書籤層級，返回 (第一項, 最後一項, 可見項數)"""
+    items = []
+    node = first
+    visited = set()
+    while node is not None and depth < 64:
+        if node.objgen in visited:
+            break
+        visited.add(node.objgen)
+
+        item = pikepdf.Dictionary({"/Title": _import_object(out, node.get("/Title", pikepdf.String("")))})
+        if "/Dest" in node:
+            dest = _remap_dest(out, node.Dest, page_map)
+            if dest is not None:
+                item.Dest = dest
+        elif "/A" in node:
+            action = _remap_action(out, node.A, page_map)
+            if action is not None:
+                item.A = action
+        for key in ("/C", "/F"):
+            if key in node:
+                item[key] = _import_object(out, node[key])
+        item = out.make_indirect(item)
+        item.Parent = parent
+
+        if "/First" in node:
+            child_first, child_last, child_count = _copy_outline_items(out, node.First, item, page_map, depth + 1)
+            if child_first is not None:
+                item.First = child_first
+                item.Last = child_last
+                # 保持原始的展開/收起狀態
+                original_count = int(node.get("/Count", 0))
+                item.Count = child_count if original_count > 0 else -child_count
+
+        items.append(item)
+        node = node.get("/Next")
+
+    for previous, current in zip(items, items[1:]):
+        previous.Next = current
+        current.Prev = previous
+
+    visible = len(items) + sum(max(0, int(i.get("/Count", 0))) for i in items)
+    if not items:
+        return None, None, 0
+    return items[0], items[-1], visible
+
+def _copy_name_tree(out, node, page_map, depth=0):
+    """複製命名目標樹，並重新映射其中的頁面引用"""
+    copied = pikepdf.Dictionary()
+    if "/Names" in node:
+        names = list(node.Names)
+        entries = []
+        for i in range(0, len(names) - 1, 2):
+            dest = _remap_dest(out, names[i + 1], page_map)
+            if dest is not None:
+                entries.extend([_import_object(out, names[i]), dest])
+        copied.Names = pikepdf.Array(entries)
+    if "/Kids" in node and depth < 32:
+        copied.Kids = pikepdf.Array([
+            out.make_indirect(_copy_name_tree(out, kid, page_map, depth + 1)) for kid in node.Kids
+        ])
+    if "/Limits" in node:
+        copied.Limits = _import_object(out, node.Limits)
+    return copied
+
+def _restore_navigation(out, original, restore_outlines=True):
+    """從原始文檔恢復書籤、命名目標和頁面連結"""
+    page_map = {page.obj.objgen: index for index, page in enumerate(original.pages)}
+    root = original.Root
+
+    if restore_outlines and "/Outlines" in root and "/First" in root.Outlines:
+        outlines = out.make_indirect(pikepdf.Dictionary({"/Type": pikepdf.Name.Outlines}))
+        first, last, count = _copy_outline_items(out, root.Outlines.First, outlines, page_map)
+        if first is not None:
+            outlines.First = first
+            outlines.Last = last
+            outlines.Count = count
+            out.Root.Outlines = outlines
+            if "/PageMode" in root:
+                out.Root.PageMode = root.PageMode
+
+    # 命名目標：舊式 /Dests 字典和 /Names /Dests 名稱樹
+    if "/Dests" in root:
+        dests = pikepdf.Dictionary()
+        for key in root.Dests.keys():
+            dest = _remap_dest(out, root.Dests[key], page_map)
+            if dest is not None:
+                dests[key] = dest
+        out.Root.Dests = out.make_indirect(dests)
+    if "/Names" in root and "/Dests" in root.Names:
+        names = out.Root.get("/Names")
+        if names is None:
+            names = out.make_indirect(pikepdf.Dictionary())
+            out.Root.Names = names
+        names.Dests = out.make_indirect(_copy_name_tree(out, root.Names.Dests, page_map))
+
+    # 頁面連結：以原始文檔的連結註解取代分段處理後的連結
+    for index, page in enumerate(original.pages):
+        if index >= len(out.pages):
+            break
+        original_links = [a for a in page.obj.get("/Annots", []) if a.get("/Subtype") == "/Link"]
+        out_page = out.pages[index].obj
+        kept = [a for a in out_page.get("/Annots", []) if a.get("/Subtype") != "/Link"]
+        if not original_links and len(kept) == len(out_page.get("/Annots", [])):
+            continue
+
+        for annot in original_links:
+            link = pikepdf.Dictionary()
+            for key in annot.keys():
+                if key in ("/P", "/Dest", "/A", "/Parent", "/Popup", "/StructParent"):
+                    continue
+                link[key] = _import_object(out, annot[key])
+            if "/Dest" in annot:
+                dest = _remap_dest(out, annot.Dest, page_map)
+                if dest is None:
+                    continue
+                link.Dest = dest
+            elif "/A" in annot:
+                action = _remap_action(out, annot.A, page_map)
+                if action is None:
+                    continue
+                link.A = action
+            link.P = out_page
+            kept.append(out.make_indirect(link))
+
+        if kept:
+            out_page.Annots = pikepdf.Array(kept)
+        elif "/Annots" in out_page:
+            del out_page["/Annots"]
+
+def _object_digest(obj):
+    """計算對象內容的哈希，子對象以引用表示（子對象須已先去重）"""
+    digest = hashlib.sha256()
+    if isinstance(obj, pikepdf.Stream):
+        digest.update(b"stream")
+        for key in sorted(obj.keys()):
+            if key != "/Length":
+                digest.update(key.encode("utf-8"))
+                value = obj[key]
+                digest.update(value.unparse() if isinstance(value, pikepdf.Object) else repr(value).encode("utf-8"))
+        digest.update(obj.read_raw_bytes())
+    else:
+        digest.update(obj.unparse(resolved=True))
+    return digest.hexdigest()
+
+def _is_replaced(value, replacement):
+    return (isinstance(value, pikepdf.Object) and value.is_indirect
+            and replacement.objgen != value.objgen)
+
+def dedupe_resources(pdf):
+    """
+    合併頁面資源中內容完全相同的字體、圖像和其他資源對象
+
+    返回:
+    int: 被合併的對象數量
+    """
+    canonical = {}
+    memo = {}
+    merged = [0]
+
+    def visit(obj, depth):
+        if depth > 32:
+            return obj
+        if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream, pikepdf.Array)) and obj.is_indirect:
+            key = obj.objgen
+            if key in memo:
+                return memo[key]
+            # 先登記自身，避免循環引用時無限遞歸
+            memo[key] = obj
+            visit_children(obj, depth)
+            digest = _object_digest(obj)
+            if digest in canonical:
+                memo[key] = canonical[digest]
+                merged[0] += 1
+            else:
+                canonical[digest] = obj
+            return memo[key]
+        if isinstance(obj, (pikepdf.Dictionary, pikepdf.Array)):
+            visit_children(obj, depth)
+        return obj
+
+    def visit_children(obj, depth):
+        if isinstance(obj, pikepdf.Array):
+            for i in range(len(obj)):
+                value = obj[i]
+                replacement = visit(value, depth + 1)
+                if _is_replaced(value, replacement):
+                    obj[i] = replacement
+        else:
+            for key in list(obj.keys()):
+                if key in ("/Parent", "/P"):
+                    continue
+                value = obj[key]
+                replacement = visit(value, depth + 1)
+                if _is_replaced(value, replacement):
+                    obj[key] = replacement
+
+    for page in pdf.pages:
+        resources = page.obj.get("/Resources")
+        if resources is not None:
+            page.obj.Resources = visit(resources, 0)
+    return merged[0]
+
+def _version_tuple(version):
+    try:
+        return tuple(int(part) for part in str(version).split("."))
+    except ValueError:
+        return (1, 4)
+
+def stitch_pdfs(shard_files, original_file, output_file, restore_outlines=True, keep_metadata=True,
+                pdf_version=None):
+    """
+    按順序合併處理後的分段文件
+
+    參數:
+    shard_files (list): 分段文件路徑（已處理）
+    original_file (str): 原始文檔，用於恢復書籤、連結和文檔信息
+    output_file (str): 輸出文件路徑
+    restore_outlines (bool): 是否恢復書籤
+    keep_metadata (bool): 是否保留原始文檔信息
+    pdf_version (str): 輸出的PDF版本，例如 "1.4"；低於1.5時不使用對象流。
+                       None時使用各分段中最高的版本
+
+    返回:
+    int: 去重時合併的對象數量
+    """
+    out = pikepdf.new()
+    sources = []
+    min_version = "1.4"
+    try:
+        for shard_file in shard_files:
+            src = pikepdf.open(shard_file)
+            sources.append(src)
+            out.pages.extend(src.pages)
+            min_version = max(min_version, src.pdf_version)
+
+        merged = dedupe_resources(out)
+
+        with pikepdf.open(original_file) as original:
+            _restore_navigation(out, original, restore_outlines)
+            if keep_metadata:
+                for key in original.docinfo.keys():
+                    out.docinfo[key] = _import_object(out, original.docinfo[key])
+            if pdf_version is None:
+                save_options = {"min_version": min_version}
+            else:
+                save_options = {"force_version": str(pdf_version)}
+            # 對象流需要PDF 1.5以上，要求兼容舊版本時保留原有的對象結構
+            version = pdf_version if pdf_version is not None else min_version
+            if _version_tuple(version) >= (1, 5):
+                save_options["object_stream_mode"] = pikepdf.ObjectStreamMode.generate
+            else:
+                save_options["object_stream_mode"] = pikepdf.ObjectStreamMode.disable
+            out.save(output_file, **save_options)
+    finally:
+        for src in sources:
+            src.close()
+    return merged
@@ -0,0 +1,212 @@
+# 文字提取引擎：只對所選頁面做pdfminer版面分析，頁面分組後交給多個進程並行處理，結果按頁碼順序返回
+# pdfminer是純Python實現，受GIL限制，只能以多進程並行；未選中的頁面只讀取頁面樹，不解析內容
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTChar, LTContainer, LTTextContainer, LTTextLine
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+from pdf_engine.results import report_progress
+
+# 並行的提取進程數，默認為CPU核心數
+TEXT_WORKERS = int(os.environ.get("PDF_TOOLKIT_TEXT_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+# 每個進程一次處理的最多頁數；每組都要重新打開文件，組太小時解析交叉引用表的開銷會抵消並行的收益
+TEXT_CHUNK_PAGES = 25
+# 頁數少於此值時在當前進程內提取，啟動進程的開銷比分析這些頁面還大
+TEXT_PARALLEL_MIN_PAGES = 8
+
+# 版面分析設定（LAParams的參數），None表示不做版面分析
+#   none     - 不分析版面，直接按字元位置拼接文字，最快，但多欄文檔的閱讀順序可能錯亂
+#   fast     - 只把字元組合為行和文字框，不計算文字框之間的閱讀順序
+#   accurate - pdfminer的默認設定（與extract_text相同），計算文字框的閱讀順序
+LAYOUT_PRESETS = {
+    "none": None,
+    "fast": {"boxes_flow": None},
+    "accurate": {},
+}
+DEFAULT_LAYOUT_PRESET = "accurate"
+
+# 提取進程池，所有調用共用；spawn啟動的進程需要重新導入pdfminer，每次調用都重建進程池的開銷太大
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def _text_process_pool(workers):
+    """返回至少有workers個進程的共用進程池"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None and _process_pool._max_workers < workers:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+        if _process_pool is None:
+            # 使用spawn避免在Streamlit的多線程進程中fork（pdfium和OCR線程可能正在運行）
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max(workers, TEXT_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+def _discard_process_pool(pool):
+    # 工作進程異常退出後進程池不能再使用，下次調用時重新創建
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+def _shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(_shutdown_process_pool)
+
+def _layout_params(preset):
+    if preset not in LAYOUT_PRESETS:
+        raise ValueError(f"未知的版面分析設定: {preset}")
+    params = LAYOUT_PRESETS[preset]
+    return None if params is None else LAParams(**params)
+
+def _iter_chars(container):
+    for item in container:
+        if isinstance(item, LTChar):
+            yield item
+        elif isinstance(item, LTContainer):
+            yield from _iter_chars(item)
+
+def _raw_text(page_layout):
+    # 沒有版面分析時只有單個字元，按內容流順序拼接，基線變化時換行，字距明顯較大時補空格
+    parts = []
+    previous = None
+    for char in _iter_chars(page_layout):
+        if previous is not None:
+            if abs(char.y0 - previous.y0) > max(char.height, previous.height) / 2:
+                parts.append("\n")
+            elif char.x0 - previous.x1 > max(char.width, previous.width) * 0.3:
+                parts.append(" ")
+        parts.append(char.get_text())
+        previous = char
+    if parts:
+        parts.append("\n")
+    return "".join(parts)
+
+def _layout_text(page_layout):
+    # 與pdfminer的extract_text相同，每個文字框之後空一行
+    return "".join(element.get_text() + "\n" for element in page_layout if isinstance(element, LTTextContainer))
+
+def _layout_boxes(page_layout):
+    # 每行文字的位置（PDF座標，原點在頁面左下角）及其文字
+    boxes = []
+    for element in page_layout:
+        if isinstance(element, LTTextContainer):
+            lines = [line for line in element if isinstance(line, LTTextLine)] or [element]
+            boxes.extend((line.x0, line.y0, line.x1, line.y1, line.get_text()) for line in lines)
+    return boxes
+
+def _raw_boxes(page_layout):
+    # 沒有版面分析時以同一基線上字元的範圍作為一行
+    boxes = []
+    line = []
+
+    def flush():
+        if line:
+            boxes.append((
+                min(c.x0 for c in line), min(c.y0 for c in line),
+                max(c.x1 for c in line), max(c.y1 for c in line),
+                "".join(c.get_text() for c in line)
+            ))
+            line.clear()
+
+    for char in _iter_chars(page_layout):
+        if line and abs(char.y0 - line[-1].y0) > max(char.height, line[-1].height) / 2:
+            flush()
+        line.append(char)
+    flush()
+    return boxes
+
+def _extract_chunk(input_file, page_nums, preset, password="", with_boxes=False):
+    # 在工作進程中執行：打開文件，只解釋所選頁面的內容
+    laparams = _layout_params(preset)
+    to_text = _raw_text if laparams is None else _layout_text
+    to_boxes = _raw_boxes if laparams is None else _layout_boxes
+    results = []
+    with open(input_file, "rb") as fp:
+        resource_manager = PDFResourceManager(caching=True)
+        device = PDFPageAggregator(resource_manager, laparams=laparams)
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        # get_pages按頁面順序只返回所選頁面，與排序後的頁碼一一對應
+        pages = PDFPage.get_pages(fp, [page_num - 1 for page_num in page_nums], password=password)
+        for page_num, page in zip(page_nums, pages):
+            interpreter.process_page(page)
+            page_layout = device.get_result()
+            if with_boxes:
+                results.append((page_num, to_text(page_layout), to_boxes(page_layout)))
+            else:
+                results.append((page_num, to_text(page_layout)))
+    return results
+
+def _chunks(page_nums, workers, chunk_pages):
+    # 頁數較少時縮小每組，讓所有進程都有工作；不連續的頁面也可以分在同一組
+    size = max(1, min(chunk_pages, -(-len(page_nums) // workers)))
+    return [page_nums[i:i + size] for i in range(0, len(page_nums), size)]
+
+def extract_page_texts(input_file, page_nums, preset=DEFAULT_LAYOUT_PRESET, workers=None,
+                       chunk_pages=TEXT_CHUNK_PAGES, password="", progress_callback=None, with_boxes=False):
+    """
+    提取指定頁面的文字，只分析所選頁面的版面
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    preset (str): 版面分析設定，見LAYOUT_PRESETS
+    workers (int): 並行進程數，默認為TEXT_WORKERS；頁數較少時在當前進程內提取
+    chunk_pages (int): 每個進程一次處理的最多頁數
+    password (str): 文件密碼
+    progress_callback (callable): progress_callback(進度0~1, 文字)
+    with_boxes (bool): 同時返回文字框的位置
+
+    返回:
+    generator: 按頁碼順序依次產生 (頁碼, 文字)；with_boxes為True時產生
+               (頁碼, 文字, [(x0, y0, x1, y1, 文字), ...])
+    """
+    _layout_params(preset)
+    page_nums = sorted(set(page_nums))
+    if not page_nums:
+        return
+    workers = max(1, workers or TEXT_WORKERS)
+    if len(page_nums) < TEXT_PARALLEL_MIN_PAGES:
+        workers = 1
+    chunks = _chunks(page_nums, workers, chunk_pages)
+    workers = min(workers, len(chunks))
+    done = 0
+
+    def report(results):
+        nonlocal done
+        done += len(results)
+        report_progress(progress_callback, done / len(page_nums), f"已提取 {done}/{len(page_nums)} 頁")
+        return results
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from report(_extract_chunk(input_file, chunk, preset, password, with_boxes))
+        return
+
+    pool = _text_process_pool(workers)
+    # 各組同時提交，按提交順序取回即為頁碼順序
+    futures = [
+        pool.submit(_extract_chunk, input_file, chunk, preset, password, with_boxes) for chunk in chunks
+    ]
+    try:
+        for future in futures:
+            yield from report(future.result())
+    except BrokenProcessPool:
+        _discard_process_pool(pool)
+        raise
+    finally:
+        # 提前停止讀取時取消尚未開始的組，進程池保留給下次使用
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,344 @@
+# 文字索引：把pdfminer提取的每頁文字和每行位置存入SQLite（FTS5全文索引），按文件內容和版面分析設定區分
+# 索引放在結果快取目錄中，但不參與結果快取的淘汰（其他會話可能正打開同一索引），另有自己的大小上限；
+# 同一文件再次提取或搜索時直接讀取索引，不必重新分析版面
+# 頁面在第一次被提取時才加入索引，搜索前會補齊所有頁面
+import os
+import time
+import sqlite3
+import threading
+
+from pdf_engine.result_cache import CACHE_DIR, CACHE_ENABLED, exclude_from_eviction, make_cache_key
+from pdf_engine.text_extract import DEFAULT_LAYOUT_PRESET, extract_page_texts
+
+_NAMESPACE = "text_index"
+# 索引結構變更時遞增，舊的索引文件不再被使用，由prune_text_indexes淘汰
+INDEX_VERSION = 1
+# 所有索引文件的大小上限，可通過環境變量調整
+INDEX_MAX_BYTES = int(float(os.environ.get("PDF_TOOLKIT_TEXT_INDEX_MAX_MB", "256")) * 1024 * 1024)
+# 最近這段時間內使用過的索引可能仍被其他會話打開，淘汰時跳過（秒）
+_PRUNE_GRACE_SECONDS = 3600
+# SQLite在索引旁邊創建的文件，刪除索引時一併刪除
+_SIDE_SUFFIXES = ("-journal", "-wal", "-shm")
+# 多個會話同時寫入同一索引時等待鎖的秒數
+_LOCK_TIMEOUT = 30
+# 每提取多少頁寫入一次索引
+_COMMIT_PAGES = 50
+# 搜索結果摘要在匹配位置前後保留的字數
+SNIPPET_CHARS = 40
+
+# 本進程估計的索引總大小，None表示尚未掃描；超過上限時才掃描目錄並淘汰
+_index_bytes = None
+_size_lock = threading.Lock()
+
+exclude_from_eviction(_NAMESPACE)
+
+def _create_fts(connection):
+    # trigram分詞器按三個字元建立索引，可以搜索中文等沒有空格分詞的文字（需要SQLite 3.34以上）
+    try:
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text)")
+        return False
+
+class TextIndex:
+    """
+    一個文檔的文字索引
+
+    用法:
+    with open_text_index(input_file) as index:
+        texts = index.get_texts([1, 2, 3])
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=_LOCK_TIMEOUT, check_same_thread=False)
+        with self._connection:
+            self.trigram = _create_fts(self._connection)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS lines (page INTEGER, x0 REAL, y0 REAL, x1 REAL, y1 REAL, text TEXT)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS lines_page ON lines (page)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def indexed_pages(self):
+        """返回已加入索引的頁碼集合"""
+        return {row[0] for row in self._connection.execute("SELECT rowid FROM pages")}
+
+    def add_pages(self, pages):
+        """
+        把頁面加入索引
+
+        參數:
+        pages (iterable): (頁碼, 文字, [(x0, y0, x1, y1, 文字), ...])，見extract_page_texts的with_boxes
+        """
+        with self._connection:
+            for page_num, text, lines in pages:
+                # 其他會話可能已經加入了同一頁
+                self._connection.execute("DELETE FROM pages WHERE rowid = ?", (page_num,))
+                self._connection.execute("DELETE FROM lines WHERE page = ?", (page_num,))
+                self._connection.execute("INSERT INTO pages (rowid, text) VALUES (?, ?)", (page_num, text))
+                self._connection.executemany(
+                    "INSERT INTO lines (page, x0, y0, x1, y1, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(page_num,) + tuple(line) for line in lines]
+                )
+
+    def get_texts(self, page_nums):
+        """返回 {頁碼: 文字}，只包含已加入索引的頁面"""
+        page_nums = list(page_nums)
+        texts = {}
+        # SQLite對參數數量有上限，分批查詢
+        for start in range(0, len(page_nums), 500):
+            batch = page_nums[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            texts.update(self._connection.execute(
+                f"SELECT rowid, text FROM pages WHERE rowid IN ({placeholders})", batch
+            ))
+        return texts
+
+    def search(self, query, limit=100):
+        """
+        在已加入索引的頁面中搜索文字（不區分大小寫）
+
+        參數:
+        query (str): 要搜索的文字，按原樣匹配，不支持FTS5查詢語法
+        limit (int): 最多返回的頁數
+
+        返回:
+        list: 按頁碼排序，每項為 {"page", "count"（頁內出現次數）, "snippet"（第一處的上下文）,
+              "lines"（包含搜索文字的行的位置 (x0, y0, x1, y1)）}
+        """
+        query = query.strip()
+        if not query:
+            return []
+        if self.trigram and len(query) >= 3:
+            # 以雙引號包住作為一個短語，查詢文字中的引號需要重複轉義
+            rows = self._connection.execute(
+                "SELECT rowid, text FROM pages WHERE pages MATCH ? ORDER BY rowid",
+                ('"' + query.replace('"', '""') + '"',)
+            )
+        else:
+            # 少於三個字元時trigram索引無法使用，逐頁比對
+            rows = self._connection.execute("SELECT rowid, text FROM pages ORDER BY rowid")
+
+        needle = query.lower()
+        results = []
+        for page_num, text in rows:
+            lowered = text.lower()
+            position = lowered.find(needle)
+            if position < 0:
+                continue
+            start = max(0, position - SNIPPET_CHARS)
+            end = min(len(text), position + len(query) + SNIPPET_CHARS)
+            snippet = ("…" if start > 0 else "") + text[start:end] + ("…" if end < len(text) else "")
+            lines = [
+                tuple(row[:4]) for row in self._connection.execute(
+                    "SELECT x0, y0, x1, y1, text FROM lines WHERE page = ? ORDER BY rowid", (page_num,)
+                ) if needle in row[4].lower()
+            ]
+            results.append({
+                "page": page_num,
+                "count": lowered.count(needle),
+                "snippet": " ".join(snippet.split()),
+                "lines": lines,
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+    def close(self):
+        self._connection.close()
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _discard_index(path):
+    """刪除損壞的索引及其日誌文件，下次打開時重新建立"""
+    for suffix in ("",) + _SIDE_SUFFIXES:
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+def _is_corrupt(error):
+    # 鎖定超時、磁碟錯誤等屬於OperationalError，不代表索引本身損壞
+    return isinstance(error, sqlite3.DatabaseError) and not isinstance(error, sqlite3.OperationalError)
+
+def open_text_index(input_file, preset=DEFAULT_LAYOUT_PRESET):
+    """
+    打開（必要時創建）文檔的文字索引，索引文件損壞時刪除並重新建立
+
+    返回:
+    TextIndex: 文字索引；快取被停用或無法創建索引時返回None
+    """
+    if not CACHE_ENABLED:
+        return None
+    key = make_cache_key(input_file, {"text_index": INDEX_VERSION, "layout": preset})
+    directory = os.path.join(CACHE_DIR, _NAMESPACE)
+    path = os.path.join(directory, key)
+    for attempt in range(2):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            index = TextIndex(path)
+            # 更新修改時間，作為淘汰的依據
+            os.utime(path)
+            return index
+        except sqlite3.Error as e:
+            if attempt or not _is_corrupt(e):
+                return None
+            _discard_index(path)
+        except OSError:
+            return None
+
+def record_index_write(size):
+    """記錄索引增加的位元組數，估計的總大小超過INDEX_MAX_BYTES時才掃描目錄並淘汰"""
+    global _index_bytes
+    with _size_lock:
+        if _index_bytes is not None:
+            _index_bytes += max(0, size)
+        needs_scan = _index_bytes is None or _index_bytes > INDEX_MAX_BYTES
+    if needs_scan:
+        prune_text_indexes()
+
+def prune_text_indexes(max_bytes=None):
+    """
+    按最近使用時間刪除索引，直到總大小不超過上限的90%
+
+    最近_PRUNE_GRACE_SECONDS內使用過的索引可能正被其他會話打開，不會被刪除
+    """
+    global _index_bytes
+    if max_bytes is None:
+        max_bytes = INDEX_MAX_BYTES
+    directory = os.path.join(CACHE_DIR, _NAMESPACE)
+    # 索引文件名 -> [最後修改時間, 總大小]，日誌文件計入所屬的索引
+    groups = {}
+    try:
+        scanned = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in scanned:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        name = entry.name
+        for suffix in _SIDE_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+        group = groups.setdefault(name, [0.0, 0])
+        group[0] = max(group[0], stat.st_mtime)
+        group[1] += stat.st_size
+
+    total = sum(size for _, size in groups.values())
+    limit = max_bytes * 0.9
+    if total > max_bytes:
+        now = time.time()
+        for name, (mtime, size) in sorted(groups.items(), key=lambda item: item[1][0]):
+            if total <= limit:
+                break
+            if now - mtime < _PRUNE_GRACE_SECONDS:
+                continue
+            _discard_index(os.path.join(directory, name))
+            total -= size
+    with _size_lock:
+        _index_bytes = total
+
+def indexed_page_texts(input_file, page_nums, preset=DEFAULT_LAYOUT_PRESET, workers=None, progress_callback=None):
+    """
+    提取指定頁面的文字：已在索引中的頁面直接讀取，其餘頁面以extract_page_texts提取後加入索引
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    preset (str): 版面分析設定，見text_extract.LAYOUT_PRESETS
+    workers (int): 提取未索引頁面的並行進程數
+    progress_callback (callable): progress_callback(進度0~1, 文字)，只按需要提取的頁面計算
+
+    返回:
+    tuple: ([(頁碼, 文字), ...] 按頁碼排序, 從索引讀取的頁數)
+    """
+    page_nums = sorted(set(page_nums))
+    index = open_text_index(input_file, preset)
+    if index is None:
+        page_texts = list(extract_page_texts(input_file, page_nums, preset, workers=workers,
+                                             progress_callback=progress_callback))
+        return page_texts, 0
+
+    size_before = _file_size(index.path)
+    texts = {}
+    cached = 0
+    missing = page_nums
+    extracted = None
+    try:
+        texts = index.get_texts(page_nums)
+        cached = len(texts)
+        missing = [page_num for page_num in page_nums if page_num not in texts]
+        batch = []
+        extracted = extract_page_texts(input_file, missing, preset, workers=workers,
+                                       progress_callback=progress_callback, with_boxes=True)
+        for page_num, text, lines in extracted:
+            texts[page_num] = text
+            batch.append((page_num, text, lines))
+            if len(batch) >= _COMMIT_PAGES:
+                index.add_pages(batch)
+                batch = []
+        if batch:
+            index.add_pages(batch)
+    except sqlite3.Error as e:
+        # 索引無法讀寫時不再使用索引，只提取還沒有取得文字的頁面；損壞的索引下次重新建立
+        if extracted is not None:
+            extracted.close()
+        index.close()
+        if _is_corrupt(e):
+            _discard_index(index.path)
+        remaining = [page_num for page_num in page_nums if page_num not in texts]
+        texts.update(extract_page_texts(input_file, remaining, preset, workers=workers,
+                                        progress_callback=progress_callback))
+        return [(page_num, texts[page_num]) for page_num in page_nums], cached
+    finally:
+        index.close()
+    if missing:
+        record_index_write(_file_size(index.path) - size_before)
+    return [(page_num, texts[page_num]) for page_num in page_nums], cached
+
+def search_document(input_file, query, page_count, preset=DEFAULT_LAYOUT_PRESET, workers=None,
+                    limit=100, progress_callback=None):
+    """
+    在整個文檔中搜索文字，未加入索引的頁面會先被提取並加入索引
+
+    參數:
+    input_file (str): PDF文件路徑
+    query (str): 要搜索的文字
+    page_count (int): 文檔頁數
+    其餘參數見indexed_page_texts和TextIndex.search
+
+    返回:
+    list: TextIndex.search的結果；無法使用索引時在提取的文字中直接搜索，結果沒有行的位置
+    """
+    page_texts, _ = indexed_page_texts(input_file, range(1, page_count + 1), preset, workers, progress_callback)
+    index = open_text_index(input_file, preset)
+    if index is not None:
+        try:
+            return index.search(query, limit)
+        except sqlite3.Error as e:
+            if _is_corrupt(e):
+                _discard_index(index.path)
+        finally:
+            index.close()
+
+    # 快取被停用或索引無法使用時使用臨時的記憶體索引
+    index = TextIndex(":memory:")
+    try:
+        index.add_pages((page_num, text, []) for page_num, text in page_texts)
+        return index.search(query, limit)
+    finally:
+        index.close()
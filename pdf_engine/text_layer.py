@@ -0,0 +1,80 @@
+# 文字層檢查：讀取頁面本身已有的文字，判斷哪些頁面是只有圖像的掃描頁，需要OCR
+# 有pypdfium2時直接讀取文字層（不需要版面分析，每頁只需幾毫秒），否則使用pdfminer
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+
+from pdf_engine.parallel_render import PDFIUM_LOCK, pdfium
+
+# 文字層中非空白字元少於此數的頁面視為沒有文字層（例如只有頁碼的掃描頁）
+MIN_TEXT_CHARS = 20
+
+def _pdfium_text_layers(input_file, page_nums):
+    results = []
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(input_file)
+        try:
+            for page_num in page_nums:
+                page = pdf[page_num - 1]
+                try:
+                    text_page = page.get_textpage()
+                    try:
+                        # pdfium以\r\n分行，統一為\n與pdfminer的輸出一致
+                        results.append((page_num, text_page.get_text_bounded().replace("\r\n", "\n")))
+                    finally:
+                        text_page.close()
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    return results
+
+def _pdfminer_text_layers(input_file, page_nums):
+    # extract_pages按頁面順序只返回所選頁面（pageid只是返回的序號），與排序後的頁碼一一對應
+    layouts = extract_pages(input_file, page_numbers=[page_num - 1 for page_num in page_nums])
+    return [
+        (page_num, "".join(element.get_text() for element in page_layout if isinstance(element, LTTextContainer)))
+        for page_num, page_layout in zip(page_nums, layouts)
+    ]
+
+def read_text_layers(input_file, page_nums):
+    """
+    讀取頁面文字層中的文字
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+
+    返回:
+    dict: 頁碼 -> 文字層中的文字（沒有文字層時為空字串）
+    """
+    page_nums = sorted(set(page_nums))
+    if not page_nums:
+        return {}
+    if pdfium is not None:
+        return dict(_pdfium_text_layers(input_file, page_nums))
+    return dict(_pdfminer_text_layers(input_file, page_nums))
+
+def has_text_layer(text, min_chars=MIN_TEXT_CHARS):
+    """判斷文字層是否有足夠的文字，不足min_chars個非空白字元的頁面需要OCR"""
+    return sum(1 for char in text if not char.isspace()) >= min_chars
+
+def split_by_text_layer(input_file, page_nums, min_chars=MIN_TEXT_CHARS):
+    """
+    把頁面分為已有文字層的頁面和需要OCR的頁面
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    min_chars (int): 文字層至少要有多少個非空白字元才直接使用
+
+    返回:
+    tuple: (已有文字層的頁面 {頁碼: 文字}, 需要OCR的頁碼列表)
+    """
+    text_layers = {}
+    scanned_pages = []
+    for page_num, text in sorted(read_text_layers(input_file, page_nums).items()):
+        if has_text_layer(text, min_chars):
+            text_layers[page_num] = text
+        else:
+            scanned_pages.append(page_num)
+    return text_layers, scanned_pages
@@ -0,0 +1,112 @@
+# 縮圖：直接以固定的小尺寸轉換頁面預覽（pdfium按比例轉換，poppler使用 -scale-to），不必先生成全分辨率圖像再縮小
+# 縮圖按文件內容、頁碼和尺寸快取，同一文件再次預覽時無需重新轉換
+import os
+import tempfile
+from io import BytesIO
+from pdf2image import convert_from_path
+
+from pdf_engine.pages import page_runs
+from pdf_engine.result_cache import make_cache_key, cache_get, cache_put
+from pdf_engine.parallel_render import PDFIUM_LOCK, pdfium, resolve_backend
+
+# 縮圖最長邊的像素數及JPEG質量
+THUMBNAIL_SIZE = 240
+THUMBNAIL_QUALITY = 80
+_CACHE_NAMESPACE = "thumbnails"
+
+def _render_pdfium(input_file, page_nums, size):
+    # 縮圖很小，在鎖內一次轉換完所有頁面
+    images = []
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(input_file)
+        try:
+            for page_num in page_nums:
+                page = pdf[page_num - 1]
+                try:
+                    width, height = page.get_size()
+                    images.append((page_num, page.render(scale=size / max(width, height, 1)).to_pil()))
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    return iter(images)
+
+def _render_poppler(input_file, page_nums, size, poppler_path):
+    # 連續的頁面合併為一次pdftoppm調用，-scale-to限制最長邊
+    for run in page_runs(page_nums):
+        images = convert_from_path(
+            input_file, first_page=run[0], last_page=run[-1], size=size, poppler_path=poppler_path
+        )
+        yield from zip(run, images)
+
+def _encode_thumbnail(image):
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+def _cache_key(input_file, page_num, size):
+    return make_cache_key(input_file, {"thumbnail_page": page_num, "size": size})
+
+def _cached_thumbnail(key):
+    fd, temp_path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    try:
+        if cache_get(key, temp_path, namespace=_CACHE_NAMESPACE):
+            with open(temp_path, "rb") as f:
+                return f.read()
+        return None
+    finally:
+        os.remove(temp_path)
+
+def _store_thumbnail(key, data):
+    fd, temp_path = tempfile.mkstemp(suffix=".jpg")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        cache_put(key, temp_path, namespace=_CACHE_NAMESPACE)
+    finally:
+        os.remove(temp_path)
+
+def iter_thumbnails(input_file, page_nums, size=THUMBNAIL_SIZE, poppler_path=None):
+    """
+    按頁碼順序生成頁面縮圖，已快取的頁面直接返回
+
+    參數:
+    input_file (str): PDF文件路徑
+    page_nums (iterable): 頁碼（從1開始）
+    size (int): 縮圖最長邊的像素數
+    poppler_path (str): 使用poppler轉換後端時的poppler目錄
+
+    返回:
+    generator: 依次產生 (頁碼, JPEG位元組)
+    """
+    page_nums = sorted(set(page_nums))
+    cached = {}
+    for page_num in page_nums:
+        data = _cached_thumbnail(_cache_key(input_file, page_num, size))
+        if data is not None:
+            cached[page_num] = data
+
+    missing = [page_num for page_num in page_nums if page_num not in cached]
+    if not missing:
+        rendered = iter(())
+    elif resolve_backend() == "pdfium":
+        rendered = _render_pdfium(input_file, missing, size)
+    else:
+        rendered = _render_poppler(input_file, missing, size, poppler_path)
+
+    for page_num in page_nums:
+        if page_num in cached:
+            yield page_num, cached[page_num]
+            continue
+        # missing與page_nums順序相同，依次取出轉換結果
+        try:
+            _, image = next(rendered)
+        except StopIteration:
+            raise RuntimeError(f"無法生成第 {page_num} 頁的縮圖")
+        data = _encode_thumbnail(image)
+        image.close()
+        _store_thumbnail(_cache_key(input_file, page_num, size), data)
+        yield page_num, data
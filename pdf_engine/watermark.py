@@ -0,0 +1,164 @@
+# PDF水印引擎：生成文字或圖片水印並疊加到指定頁面，不依賴Streamlit
+import os
+import sys
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from PIL import Image
+
+from pdf_engine.results import make_result
+
+# 註冊中文字體
+def register_fonts():
+    # 註冊內置中文字體(用於支持中文水印)
+    font_path = None
+    
+    # 根據不同操作系統查找合適的中文字體
+    if sys.platform.startswith('win'):
+        # Windows 系統字體路徑
+        possible_fonts = [
+            "C:\\Windows\\Fonts\\mingliu.ttc",
+            "C:\\Windows\\Fonts\\msjh.ttc",
+            "C:\\Windows\\Fonts\\simsun.ttc",
+            "C:\\Windows\\Fonts\\simhei.ttf"
+        ]
+    elif sys.platform.startswith('darwin'):
+        # macOS 系統字體路徑
+        possible_fonts = [
+            "/System/Library/Fonts/PingFang.ttc",
+            "/Library/Fonts/Microsoft/PMingLiU.ttf",
+            "/Library/Fonts/Microsoft/SimHei.ttf"
+        ]
+    else:
+        # Linux 系統字體路徑
+        possible_fonts = [
+            "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+            "/usr/share/fonts/truetype/arphic/uming.ttc",
+            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc"
+        ]
+    
+    # 檢查字體文件是否存在並註冊第一個找到的字體
+    for font_file in possible_fonts:
+        if os.path.exists(font_file):
+            font_path = font_file
+            break
+    
+    # 如果找到系統字體，註冊它
+    if font_path:
+        try:
+            pdfmetrics.registerFont(TTFont("ChineseFont", font_path))
+            return "ChineseFont"
+        except:
+            pass
+    
+    # 如果找不到系統字體，返回默認字體
+    return "Helvetica"
+
+# 获取默认中文字体
+DEFAULT_CHINESE_FONT = register_fonts()
+
+# 創建文字水印
+def create_text_watermark(output_file, text, font_size, color, angle, x_gap, y_gap, font_name="Helvetica"):
+    c = canvas.Canvas(output_file, pagesize=A4)
+    width, height = A4
+    
+    # 設置透明度和顏色
+    r, g, b, alpha = color
+    c.setFillColorRGB(r, g, b, alpha=alpha)
+    
+    # 設置字體和大小
+    c.setFont(font_name, font_size)
+    
+    # 在整個頁面上重複添加文字
+    for y in range(0, int(height), y_gap):
+        for x in range(0, int(width), x_gap):
+            c.saveState()
+            c.translate(x, y)
+            c.rotate(angle)
+            c.drawString(0, 0, text)
+            c.restoreState()
+    
+    c.save()
+
+# 創建圖片水印
+def create_image_watermark(output_file, image_path, opacity, size_percent, position):
+    c = canvas.Canvas(output_file, pagesize=A4)
+    width, height = A4
+    
+    # 加載圖片並計算大小
+    img = Image.open(image_path)
+    img_width, img_height = img.size
+    
+    # 計算水印大小（根據頁面寬度的百分比）
+    new_width = width * size_percent / 100
+    new_height = img_height * (new_width / img_width)
+    
+    # 計算位置
+    if position == "居中":
+        x = (width - new_width) / 2
+        y = (height - new_height) / 2
+    elif position == "左上角":
+        x = 20
+        y = height - new_height - 20
+    elif position == "右上角":
+        x = width - new_width - 20
+        y = height - new_height - 20
+    elif position == "左下角":
+        x = 20
+        y = 20
+    else:  # 右下角
+        x = width - new_width - 20
+        y = 20
+    
+    # 繪製圖片
+    c.drawImage(image_path, x, y, width=new_width, height=new_height, mask='auto', alpha=opacity)
+    c.save()
+
+# 將水印應用到PDF
+def add_watermark_to_pdf(input_pdf, watermark_pdf, output_pdf, pages_to_watermark, password=None):
+    """
+    把水印PDF的第一頁疊加到指定頁面
+    
+    參數:
+    input_pdf (str): 輸入PDF路徑
+    watermark_pdf (str): create_text_watermark或create_image_watermark生成的水印文件
+    output_pdf (str): 輸出PDF路徑
+    pages_to_watermark (iterable): 要添加水印的頁面索引（從0開始）
+    password (str): 可選，輸入文件的密碼
+    
+    返回:
+    dict: make_result的結果，另含 pages（已添加水印的頁數）
+    """
+    pages_to_watermark = set(pages_to_watermark)
+    watermarked = 0
+    try:
+        # 讀取輸入PDF
+        reader = PdfReader(input_pdf)
+        
+        # 如果文件已加密且提供了密碼，嘗試解密
+        if reader.is_encrypted and password:
+            reader.decrypt(password)
+            
+        watermark = PdfReader(watermark_pdf)
+        watermark_page = watermark.pages[0]
+        
+        # 創建輸出PDF
+        writer = PdfWriter()
+        
+        # 處理每一頁
+        for i, page in enumerate(reader.pages):
+            if i in pages_to_watermark:
+                # 將水印疊加到頁面上
+                page.merge_page(watermark_page)
+                watermarked += 1
+            writer.add_page(page)
+        
+        # 保存輸出PDF
+        with open(output_pdf, "wb") as f:
+            writer.write(f)
+    except Exception as e:
+        return make_result(error=f"添加水印時出錯: {str(e)}", pages=watermarked)
+    
+    return make_result(output_pdf, pages=watermarked)
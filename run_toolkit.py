@@ -220,7 +220,8 @@ def launch_app():
             "--server.port=8501",
             "--server.address=0.0.0.0",         # 允許從任何地址訪問
             "--server.enableCORS=false",        # 禁用CORS限制
-            "--server.enableXsrfProtection=false" # 禁用XSRF保護
+            "--server.enableXsrfProtection=false", # 禁用XSRF保護
+            "--server.enableStaticServing=true"   # 大型結果從static/downloads直接下載
         ]
         
         # 如果是Windows，使用subprocess.Popen啟動，並設置creationflags以避免顯示命令窗口
@@ -0,0 +1,5 @@
+# 讓測試可以直接導入倉庫根目錄下的pdf_engine和modules
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
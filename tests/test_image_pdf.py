@@ -0,0 +1,85 @@
+import pikepdf
+import pypdfium2 as pdfium
+import pytest
+from PIL import Image, ImageDraw
+
+from pdf_engine.image_pdf import CCITT_AVAILABLE, ImagePdfWriter, encode_ccitt, is_bilevel
+
+
+def black_square_page(mode="L"):
+    # 白底，中間有黑色方塊
+    image = Image.new(mode, (200, 100), "white")
+    ImageDraw.Draw(image).rectangle((50, 25, 149, 74), fill="black")
+    return image
+
+
+def render_page(path, page_index=0):
+    # 以scale=1渲染，每個點對應一個像素
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return pdf[page_index].render(scale=1).to_pil()
+    finally:
+        pdf.close()
+
+
+def test_writes_valid_pdf_with_page_size_from_dpi(tmp_path):
+    output = tmp_path / "out.pdf"
+    color = Image.new("RGB", (300, 150), (200, 30, 30))
+    with ImagePdfWriter(str(output)) as writer:
+        writer.add_image(color, dpi=150, quality=80)
+        writer.add_image(black_square_page(), dpi=72)
+        assert writer.page_count == 2
+
+    with pikepdf.open(output) as pdf:
+        assert len(pdf.pages) == 2
+        assert [float(v) for v in pdf.pages[0].MediaBox] == pytest.approx([0, 0, 144, 72])
+        assert [float(v) for v in pdf.pages[1].MediaBox] == pytest.approx([0, 0, 200, 100])
+        image = pdf.pages[0].Resources.XObject.Im0
+        assert image.Filter == "/DCTDecode"
+        assert (int(image.Width), int(image.Height)) == (300, 150)
+
+    red, green, blue = render_page(str(output)).convert("RGB").getpixel((72, 36))
+    assert red > 150 and green < 80 and blue < 80
+
+
+def test_failed_write_leaves_no_trailer(tmp_path):
+    output = tmp_path / "broken.pdf"
+    with pytest.raises(RuntimeError):
+        with ImagePdfWriter(str(output)) as writer:
+            writer.add_image(black_square_page(), dpi=72)
+            raise RuntimeError("stop")
+    assert b"%%EOF" not in output.read_bytes()
+
+
+def test_is_bilevel():
+    assert is_bilevel(black_square_page())
+    assert not is_bilevel(Image.new("L", (50, 50), 128))
+
+
+@pytest.mark.skipif(not CCITT_AVAILABLE, reason="Pillow沒有libtiff")
+@pytest.mark.parametrize("mode", ["L", "1", "RGB"])
+def test_ccitt_page_keeps_polarity(tmp_path, mode):
+    output = tmp_path / "ccitt.pdf"
+    with ImagePdfWriter(str(output)) as writer:
+        writer.add_image(black_square_page(mode), dpi=72, bilevel=True)
+
+    with pikepdf.open(output) as pdf:
+        image = pdf.pages[0].Resources.XObject.Im0
+        assert image.Filter == "/CCITTFaxDecode"
+        assert int(image.BitsPerComponent) == 1
+
+    rendered = render_page(str(output)).convert("L")
+    assert rendered.size == (200, 100)
+    # 方塊內為黑色，方塊外為白色
+    assert rendered.getpixel((100, 50)) < 64
+    assert rendered.getpixel((10, 10)) > 192
+    assert rendered.getpixel((190, 90)) > 192
+
+
+@pytest.mark.skipif(not CCITT_AVAILABLE, reason="Pillow沒有libtiff")
+def test_encode_ccitt_thresholds_gray():
+    image = Image.new("L", (64, 64), 200)
+    ImageDraw.Draw(image).rectangle((0, 0, 31, 63), fill=100)
+    data, width, height = encode_ccitt(image)
+    assert (width, height) == (64, 64)
+    assert data
@@ -0,0 +1,114 @@
+import math
+
+import pytest
+
+from pdf_engine.compress import (
+    MODEL_DEFAULT_SLOPE, MODEL_MAX_DPI, MODEL_MIN_DPI, MODEL_QUALITY_LADDER,
+    _model_target_search, _predict_dpi, model_target_search
+)
+
+# 各品質下的大小係數，大小 = 係數 × (DPI/100)^1.8 MB
+QUALITY_FACTORS = {"/printer": 4.0, "/ebook": 2.0, "/screen": 1.0}
+
+
+def power_law_measure(exponent=1.8, calls=None):
+    def measure(dpi, quality):
+        if calls is not None:
+            calls.append((dpi, quality))
+        return QUALITY_FACTORS[quality] * (dpi / 100) ** exponent, None
+    return measure
+
+
+def test_predict_dpi_recovers_exact_power_law():
+    points = [(100, 2.0), (200, 2.0 * 2 ** 1.8)]
+    dpi, slope = _predict_dpi(points, 2.0 * 1.5 ** 1.8)
+    assert slope == pytest.approx(1.8)
+    assert dpi == pytest.approx(150)
+
+
+def test_predict_dpi_uses_default_slope_with_one_point():
+    dpi, slope = _predict_dpi([(100, 4.0)], 1.0)
+    assert slope == MODEL_DEFAULT_SLOPE
+    assert dpi == pytest.approx(100 * 0.25 ** (1 / MODEL_DEFAULT_SLOPE))
+
+
+def test_predict_dpi_clamps_noisy_slope():
+    # 兩點幾乎同樣大小，割線斜率接近0，限制在0.2以避免大幅跳躍
+    _, slope = _predict_dpi([(100, 2.0), (200, 2.01)], 1.0)
+    assert slope == pytest.approx(0.2)
+    _, slope = _predict_dpi([(100, 1.0), (110, 5.0)], 1.0)
+    assert slope == pytest.approx(2.5)
+
+
+def test_search_converges_below_target():
+    target = 1.3
+    results = model_target_search(power_law_measure(), target, max_runs=8, start_dpi=150)
+    dpi, quality, size_mb, _ = results[-1]
+    assert size_mb <= target
+    assert target - size_mb < max(0.05, target * 0.1)
+    # 冪律模型應在少數幾次內收斂
+    assert len(results) <= 4
+
+
+def test_search_respects_max_runs():
+    calls = []
+    model_target_search(power_law_measure(calls=calls), 1.3, max_runs=2, start_dpi=300)
+    assert len(calls) == 2
+
+
+def test_search_unreachable_small_target_stops_at_strongest_setting():
+    calls = []
+    results = model_target_search(power_law_measure(calls=calls), 0.0001, max_runs=20, start_dpi=150)
+    assert len(calls) < 20
+    dpi, quality, size_mb, _ = results[-1]
+    assert (dpi, quality) == (MODEL_MIN_DPI, MODEL_QUALITY_LADDER[-1])
+    assert size_mb > 0.0001
+
+
+def test_search_unreachable_large_target_stops_at_highest_setting():
+    results = model_target_search(power_law_measure(), 1000, max_runs=20, start_dpi=150)
+    dpi, quality, _, _ = results[-1]
+    assert (dpi, quality) == (MODEL_MAX_DPI, MODEL_QUALITY_LADDER[0])
+
+
+@pytest.mark.parametrize("start_dpi, expected", [(1000, MODEL_MAX_DPI), (5, MODEL_MIN_DPI)])
+def test_search_clamps_start_dpi(start_dpi, expected):
+    calls = []
+    model_target_search(power_law_measure(calls=calls), 1.0, max_runs=1, start_dpi=start_dpi)
+    assert calls[0][0] == expected
+
+
+def test_search_keeps_every_dpi_within_bounds():
+    calls = []
+    for target in (0.001, 0.3, 3.0, 500):
+        model_target_search(power_law_measure(calls=calls), target, max_runs=10, start_dpi=120)
+    assert all(MODEL_MIN_DPI <= dpi <= MODEL_MAX_DPI for dpi, _ in calls)
+    assert all(isinstance(dpi, int) for dpi, _ in calls)
+
+
+def test_search_quality_switch_measures_new_quality_at_same_dpi():
+    calls = []
+    # /ebook預測需要低於最低DPI，改用/screen；/screen的第一次測量沿用當前DPI，而不是按/ebook的擬合外推
+    model_target_search(power_law_measure(calls=calls), 0.2, max_runs=8, start_dpi=100)
+    switch = next(i for i, (_, quality) in enumerate(calls) if quality == "/screen")
+    assert calls[switch][0] == calls[switch - 1][0]
+
+
+def test_search_stops_when_measure_fails():
+    def failing(dpi, quality):
+        return None, None
+    assert model_target_search(failing, 1.0, max_runs=5, start_dpi=150) == []
+
+
+def test_on_result_reports_each_run():
+    seen = []
+    results = model_target_search(power_law_measure(), 1.3, max_runs=8, start_dpi=150,
+                                  on_result=lambda run, dpi, quality, size: seen.append((run, dpi, quality)))
+    assert seen == [(i + 1, dpi, quality) for i, (dpi, quality, _, _) in enumerate(results)]
+    assert all(math.isfinite(size) for _, _, size, _ in results)
+
+
+def test_model_target_search_empty_input(tmp_path):
+    input_file = tmp_path / "empty.pdf"
+    input_file.write_bytes(b"")
+    assert _model_target_search(str(input_file), str(tmp_path), 1.0, 6, None) == (None, None, None)
@@ -0,0 +1,54 @@
+import pytest
+
+from pdf_engine.pages import parse_page_selection, page_runs
+
+
+def test_parse_ranges_and_single_pages():
+    assert parse_page_selection("1-3,5,8-9", 10) == [1, 2, 3, 5, 8, 9]
+
+
+def test_parse_accepts_fullwidth_comma_and_spaces():
+    assert parse_page_selection(" 2 ，4 - 5 ", 10) == [2, 4, 5]
+
+
+def test_parse_removes_duplicates_and_sorts():
+    assert parse_page_selection("5,1-3,2,3-4,1", 10) == [1, 2, 3, 4, 5]
+
+
+def test_parse_rejects_reversed_range():
+    with pytest.raises(ValueError, match="5-3"):
+        parse_page_selection("5-3", 10)
+
+
+@pytest.mark.parametrize("text", ["0", "11", "8-11", "0-2"])
+def test_parse_rejects_out_of_range_pages(text):
+    with pytest.raises(ValueError, match="文檔共 10 頁"):
+        parse_page_selection(text, 10)
+
+
+@pytest.mark.parametrize("text", ["", "   ", ",", " , ，"])
+def test_parse_rejects_empty_selection(text):
+    with pytest.raises(ValueError, match="至少指定一個頁碼"):
+        parse_page_selection(text, 10)
+
+
+@pytest.mark.parametrize("text", ["a", "1-b", "1-2-3", "1.5"])
+def test_parse_rejects_malformed_pages(text):
+    with pytest.raises(ValueError):
+        parse_page_selection(text, 10)
+
+
+def test_page_runs_groups_consecutive_pages():
+    assert page_runs([1, 2, 3, 500]) == [[1, 2, 3], [500]]
+
+
+def test_page_runs_removes_duplicates_and_sorts():
+    assert page_runs([7, 3, 2, 3, 8]) == [[2, 3], [7, 8]]
+
+
+def test_page_runs_limits_run_length():
+    assert page_runs(range(1, 8), max_length=3) == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_page_runs_empty_input():
+    assert page_runs([]) == []
@@ -0,0 +1,121 @@
+import pikepdf
+import pytest
+
+from pdf_engine.sharding import dedupe_resources, plan_shards, split_pdf, stitch_pdfs
+
+
+def make_pdf(path, page_count, link_from=None, link_to=None, outline=None):
+    """每頁使用各自的字體對象（內容相同），可選一個頁面連結和書籤 [(標題, 頁面索引), ...]"""
+    pdf = pikepdf.new()
+    for index in range(page_count):
+        font = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                    BaseFont=pikepdf.Name.Helvetica))
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream(f"BT /F1 12 Tf 72 700 Td (page {index + 1}) Tj ET".encode("ascii"))
+    if link_from is not None:
+        link = pdf.make_indirect(pikepdf.Dictionary(
+            Type=pikepdf.Name.Annot, Subtype=pikepdf.Name.Link, Rect=[72, 72, 144, 96],
+            Dest=pikepdf.Array([pdf.pages[link_to].obj, pikepdf.Name.Fit])
+        ))
+        pdf.pages[link_from].obj.Annots = pikepdf.Array([link])
+    if outline:
+        with pdf.open_outline() as pdf_outline:
+            for title, page_index in outline:
+                pdf_outline.root.append(pikepdf.OutlineItem(title, page_index))
+    pdf.save(path)
+
+
+def page_index(pdf, page_obj):
+    return [page.obj.objgen for page in pdf.pages].index(page_obj.objgen)
+
+
+def test_plan_shards_skips_small_documents(tmp_path):
+    path = str(tmp_path / "small.pdf")
+    make_pdf(path, 20)
+    assert plan_shards(path, 4, min_pages=50, min_shard_pages=5) == []
+    assert plan_shards(path, 1, min_pages=10, min_shard_pages=5) == []
+
+
+def test_plan_shards_covers_every_page(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 40)
+    ranges = plan_shards(path, 4, min_pages=10, min_shard_pages=5)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == 40
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    assert all(end - start >= 5 for start, end in ranges)
+
+
+def test_plan_shards_respects_min_shard_pages(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 12)
+    # 12頁每段至少5頁，最多只能分成兩段
+    assert len(plan_shards(path, 8, min_pages=10, min_shard_pages=5)) == 2
+
+
+def test_split_pdf_writes_each_range(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 10)
+    shard_files = split_pdf(path, [(0, 3), (3, 10)], str(tmp_path))
+    page_counts = []
+    for shard_file in shard_files:
+        with pikepdf.open(shard_file) as shard:
+            page_counts.append(len(shard.pages))
+    assert page_counts == [3, 7]
+
+
+def test_dedupe_resources_merges_identical_fonts(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 3)
+    with pikepdf.open(path) as pdf:
+        assert dedupe_resources(pdf) == 2
+        fonts = {page.obj.Resources.Font.F1.objgen for page in pdf.pages}
+        assert len(fonts) == 1
+
+
+def test_stitch_pdfs_restores_outline_and_links(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 6, link_from=0, link_to=4, outline=[("Chapter 1", 0), ("Chapter 2", 3)])
+    shard_files = split_pdf(path, [(0, 3), (3, 6)], str(tmp_path))
+    output = str(tmp_path / "out.pdf")
+
+    merged = stitch_pdfs(shard_files, path, output)
+    # 兩個分段各有一個字體對象保留下來，合併為一個
+    assert merged >= 1
+
+    with pikepdf.open(output) as out:
+        assert len(out.pages) == 6
+        with out.open_outline() as outline:
+            titles = [item.title for item in outline.root]
+            targets = [page_index(out, item.destination[0]) for item in outline.root]
+        assert titles == ["Chapter 1", "Chapter 2"]
+        assert targets == [0, 3]
+        links = [a for a in out.pages[0].obj.Annots if a.Subtype == "/Link"]
+        assert len(links) == 1
+        assert page_index(out, links[0].Dest[0]) == 4
+        assert links[0].P.objgen == out.pages[0].obj.objgen
+
+
+def test_stitch_pdfs_can_drop_outline(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 4, outline=[("Chapter 1", 1)])
+    shard_files = split_pdf(path, [(0, 2), (2, 4)], str(tmp_path))
+    output = str(tmp_path / "out.pdf")
+    stitch_pdfs(shard_files, path, output, restore_outlines=False)
+    with pikepdf.open(output) as out:
+        assert "/Outlines" not in out.Root
+
+
+@pytest.mark.parametrize("pdf_version, object_streams", [("1.4", False), ("1.5", True), ("1.7", True)])
+def test_stitch_pdfs_uses_requested_version(tmp_path, pdf_version, object_streams):
+    path = str(tmp_path / "doc.pdf")
+    make_pdf(path, 4)
+    shard_files = split_pdf(path, [(0, 2), (2, 4)], str(tmp_path))
+    output = str(tmp_path / "out.pdf")
+    stitch_pdfs(shard_files, path, output, pdf_version=pdf_version)
+    with pikepdf.open(output) as out:
+        assert out.pdf_version == pdf_version
+    with open(output, "rb") as f:
+        assert (b"/ObjStm" in f.read()) is object_streams
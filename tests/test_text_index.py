@@ -0,0 +1,205 @@
+import os
+import sqlite3
+
+import pikepdf
+import pytest
+
+from pdf_engine import result_cache, text_index
+from pdf_engine.text_index import TextIndex, _create_fts
+
+PAGES = [
+    (1, "Annual Report 2023\nRevenue grew strongly.\n", [
+        (72.0, 700.0, 300.0, 712.0, "Annual Report 2023\n"),
+        (72.0, 680.0, 280.0, 692.0, "Revenue grew strongly.\n"),
+    ]),
+    (2, "第二章 財務報表\n營業收入與營業成本\n", [
+        (72.0, 700.0, 200.0, 712.0, "第二章 財務報表\n"),
+        (72.0, 680.0, 220.0, 692.0, "營業收入與營業成本\n"),
+    ]),
+    (3, 'He said "revenue" twice: REVENUE.\n', [
+        (72.0, 700.0, 320.0, 712.0, 'He said "revenue" twice: REVENUE.\n'),
+    ]),
+]
+
+
+class NoTrigramConnection:
+    """模擬不支持trigram分詞器的舊版SQLite"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def execute(self, sql, *args):
+        if "trigram" in sql:
+            raise sqlite3.OperationalError("no such tokenizer: trigram")
+        return self._connection.execute(sql, *args)
+
+
+@pytest.fixture
+def no_trigram(monkeypatch):
+    create_fts = text_index._create_fts
+    monkeypatch.setattr(text_index, "_create_fts", lambda connection: create_fts(NoTrigramConnection(connection)))
+
+
+@pytest.fixture(params=["trigram", "fallback"])
+def index(request):
+    if request.param == "fallback":
+        request.getfixturevalue("no_trigram")
+    index = TextIndex(":memory:")
+    index.add_pages(PAGES)
+    yield index
+    index.close()
+
+
+def test_create_fts_uses_trigram():
+    connection = sqlite3.connect(":memory:")
+    assert _create_fts(connection) is True
+    connection.close()
+
+
+def test_create_fts_falls_back_without_trigram():
+    connection = sqlite3.connect(":memory:")
+    assert _create_fts(NoTrigramConnection(connection)) is False
+    # 默認分詞器的全文索引仍然可用
+    connection.execute("INSERT INTO pages (rowid, text) VALUES (1, 'hello world')")
+    assert connection.execute("SELECT rowid FROM pages WHERE pages MATCH 'hello'").fetchall() == [(1,)]
+    connection.close()
+
+
+def test_fallback_index_reports_no_trigram(no_trigram):
+    with TextIndex(":memory:") as index:
+        assert index.trigram is False
+
+
+def test_indexed_pages_and_get_texts(index):
+    assert index.indexed_pages() == {1, 2, 3}
+    texts = index.get_texts([2, 3, 9])
+    assert set(texts) == {2, 3}
+    assert texts[2] == PAGES[1][1]
+
+
+def test_add_pages_replaces_existing_page(index):
+    index.add_pages([(1, "replaced text\n", [(0.0, 0.0, 10.0, 10.0, "replaced text\n")])])
+    assert index.get_texts([1]) == {1: "replaced text\n"}
+    assert index.search("Revenue grew") == []
+    assert index.search("replaced")[0]["lines"] == [(0.0, 0.0, 10.0, 10.0)]
+
+
+def test_search_is_case_insensitive_with_counts_and_lines(index):
+    results = index.search("revenue")
+    assert [r["page"] for r in results] == [1, 3]
+    assert results[0]["count"] == 1
+    assert results[0]["lines"] == [(72.0, 680.0, 280.0, 692.0)]
+    assert results[1]["count"] == 2
+
+
+def test_search_chinese_substring(index):
+    results = index.search("營業收入")
+    assert [r["page"] for r in results] == [2]
+    assert results[0]["lines"] == [(72.0, 680.0, 220.0, 692.0)]
+
+
+def test_search_short_query_scans_pages(index):
+    # 少於三個字元時trigram索引無法匹配，改為逐頁比對
+    assert [r["page"] for r in index.search("營業")] == [2]
+    assert [r["page"] for r in index.search("23")] == [1]
+
+
+def test_search_escapes_quotes(index):
+    results = index.search('"revenue"')
+    assert [r["page"] for r in results] == [3]
+    assert results[0]["count"] == 1
+
+
+def test_search_snippet_and_limit(index):
+    assert index.search("   ") == []
+    assert len(index.search("revenue", limit=1)) == 1
+    snippet = index.search("strongly")[0]["snippet"]
+    # 摘要中的換行合併為空格
+    assert snippet == "Annual Report 2023 Revenue grew strongly."
+
+
+def make_text_pdf(path, page_texts):
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                BaseFont=pikepdf.Name.Helvetica))
+    for text in page_texts:
+        page = pdf.add_blank_page(page_size=(612, 792))
+        page.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+        page.Contents = pdf.make_stream(f"BT /F1 12 Tf 72 700 Td ({text}) Tj ET".encode("ascii"))
+    pdf.save(path)
+
+
+def test_indexed_page_texts_reuses_index(tmp_path, monkeypatch):
+    input_file = tmp_path / "doc.pdf"
+    make_text_pdf(str(input_file), ["first page", "second page", "third page"])
+    writes = []
+    monkeypatch.setattr(text_index, "CACHE_ENABLED", True)
+    monkeypatch.setattr(text_index, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(text_index, "record_index_write", writes.append)
+
+    page_texts, cached = text_index.indexed_page_texts(str(input_file), [3, 1])
+    assert [page for page, _ in page_texts] == [1, 3]
+    assert "first page" in page_texts[0][1]
+    assert cached == 0
+    assert len(writes) == 1
+
+    page_texts, cached = text_index.indexed_page_texts(str(input_file), [1, 2, 3])
+    assert cached == 2
+    assert "second page" in page_texts[1][1]
+
+    results = text_index.search_document(str(input_file), "third", 3)
+    assert [r["page"] for r in results] == [3]
+    assert results[0]["lines"]
+
+
+def test_search_document_without_cache(tmp_path, monkeypatch):
+    input_file = tmp_path / "doc.pdf"
+    make_text_pdf(str(input_file), ["alpha", "beta"])
+    monkeypatch.setattr(text_index, "CACHE_ENABLED", False)
+    results = text_index.search_document(str(input_file), "beta", 2)
+    assert [r["page"] for r in results] == [2]
+    # 沒有索引時不記錄行的位置
+    assert results[0]["lines"] == []
+
+
+def test_open_text_index_rebuilds_corrupt_index(tmp_path, monkeypatch):
+    input_file = tmp_path / "doc.pdf"
+    input_file.write_bytes(b"%PDF-1.4\n")
+    monkeypatch.setattr(text_index, "CACHE_ENABLED", True)
+    monkeypatch.setattr(text_index, "CACHE_DIR", str(tmp_path / "cache"))
+
+    index = text_index.open_text_index(str(input_file))
+    path = index.path
+    index.close()
+    with open(path, "wb") as f:
+        f.write(b"not a database" * 100)
+
+    index = text_index.open_text_index(str(input_file))
+    assert index is not None and index.path == path
+    index.add_pages(PAGES[:1])
+    assert 1 in index.get_texts([1])
+    index.close()
+
+
+def test_prune_text_indexes_keeps_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_index, "CACHE_DIR", str(tmp_path))
+    directory = tmp_path / text_index._NAMESPACE
+    directory.mkdir()
+    for name in ("old", "old-journal", "recent"):
+        (directory / name).write_bytes(b"x" * 100)
+    for name in ("old", "old-journal"):
+        os.utime(directory / name, (0, 0))
+
+    text_index.prune_text_indexes(max_bytes=50)
+    # 最近使用過的索引可能正被其他會話打開，即使超過上限也不刪除
+    assert sorted(os.listdir(directory)) == ["recent"]
+
+
+def test_result_cache_evict_skips_text_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path))
+    directory = tmp_path / text_index._NAMESPACE
+    directory.mkdir()
+    (directory / "index").write_bytes(b"x" * 100)
+
+    result_cache.evict(max_bytes=1)
+    assert os.listdir(directory) == ["index"]